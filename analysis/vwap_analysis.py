@@ -26,7 +26,7 @@ def data_concentrate(filename, time_interval = '1T'):
         data = json.load(meta_file)
     trades = pd.DataFrame(data['finished_orders'].values())
 
-    trades['time'] = [datetime.strptime(str(x), '%Y-%m-%d %H:%M:%S') for x in trades['update_time'].tolist()]
+    trades['time'] = str_series_to_datetime(trades['update_time'].astype(str))
     trades.set_index('time', inplace=True)
 
     trade_summary = get_trade_summary(trades, time_interval, 'price', 'filled')
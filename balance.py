@@ -1,9 +1,11 @@
-import json
 import asyncio
 
 from config.enums import *
 from config.config import *
 from util.aredis import RedisHandler
+from util import codec
+from util.book_store import book_store
+from util.task_status import merge_status
 
 
 class Balance:
@@ -13,6 +15,7 @@ class Balance:
         1. 查询对应交易所对应账户的余额
         2. 下载特定Task在某个时间段的统计信息
         3. 查询特定的Task最新的运行状态, 当PDTUI因为特定原因丢失Task状态的时候使用
+        4. 读取本机共享内存中的最新orderbook, 不需要订阅行情
     """
 
     def __init__(self):
@@ -28,32 +31,50 @@ class Balance:
         elif rtype == PublishChannel.UI.value:
             await self.r_ui.publish(keyword, body)
         elif rtype == MasterCommand.INSPECT.value:
-            status = await self.r_ui.hget(CONFIG_GLOBAL['REDIS_STATUS_MONITOR'], body['task_id'])
+            status = await self.get_task_status('', body['task_id'])
             if status is None:
-                status = await self.r_ui.hget('test_' + CONFIG_GLOBAL['REDIS_STATUS_MONITOR'], body['task_id'])
+                status = await self.get_task_status('test_', body['task_id'])
             if status is not None:
-                status = json.loads(status)
                 status['client_id'] = body['client_id']
                 status['result'] = True
             else:
                 status = {'client_id': body['client_id'], 'result': False}
-            status = json.dumps(status)
+            status = codec.dumps(status)
             await self.r_ui.publish(keyword, status)
 
+    async def get_task_status(self, prefix, task_id):
+        """
+        latest status of task: snapshot in monitor hash merged with delta, plus task definition
+        :param prefix: '' or 'test_'
+        :return: dict, None when task is not found
+        """
+        status = await self.r_ui.hget(prefix + CONFIG_GLOBAL['REDIS_STATUS_MONITOR'], task_id)
+        if status is None:
+            return None
+        delta = await self.r_ui.hget(prefix + CONFIG_GLOBAL['REDIS_STATUS_DELTA'], task_id)
+        status = merge_status(codec.loads(status), codec.loads(delta) if delta else None)
+        task = await self.r_ui.hget(prefix + CONFIG_GLOBAL['REDIS_TASK_DEFINITION'], task_id)
+        if task is not None:
+            # 旧版本driver写入的snapshot中直接带有task
+            status['task'] = codec.loads(task)
+        return status
+
     def command_handler(self, command):
         """
         接收来自PDTUI的命令, blpop eaas_master_command队列, 处理完把结果publish至redis
-        :param command:  目前有三种命令:
+        :param command:  目前有四种命令:
         1. 查询余额 {"type":"get_balance","exchange":"Hotbit","client_id":1570863741413,"account":"tuber","test_mode":false}
         2. 统计信息下载 {"type":"download","client_id":1570873969068,"start_time":"2019-10-02 03:30:00","end_time":"2019-10-12 17:46:33","task":{"algorithm":"TWAP","exchange":"Bittrex","account":"trading","symbol":["WAXPBTC","WAXP","BTC"],"direction":"Sell","currency_type":"Base","total_size":4100100,"trade_role":"Taker","price_threshold":null,"exchange_fee":0.002,"execution_mode":"Passive","test_mode":false,"start_time":"2019-10-02 03:30:00","end_time":"2019-10-14 03:30:00","initial_balance":{"WAXP":4100100,"BTC":0},"task_id":"TWAP_Bittrex_WAXPBTC_20191010155258","coin_config":{"WAXPBTC":{"base_min_order_size":0.001,"quote_min_order_size":0.001,"price_precision":1e-8,"size_precision":0.001}},"customer_id":"amberai","alarm":true}}
         3. 查询Task状态 {"type":"inspect","task_id":"SAMPLE_Binance_ETHUSDT_20191003122252","client_id":1570759975824}
+        4. 查询本机最新orderbook {"type":"orderbook","exchange":"Binance","symbol":"BTCUSDT","contract_type":"spot","client_id":1570759975824}
         :return: 函数无回报, 结果会通过redis publish到 eaas_master_command_response中
         1. 查询余额 {"client_id": 1570874319275, "action": "query_balance", "metadata": {"BTC": {"available": 0, "reserved": 0, "shortable": 0, "total": 0}, "USDT": {"available": 0, "reserved": 0, "shortable": 0, "total": 0}, "BAT": {"available": 0, "reserved": 0, "shortable": 0, "total": 0}, "account_id": "laura1", "result": true}}
         2. 统计信息下载 {"task_id": "TWAP_Bittrex_WAXPBTC_20191010155258", "client_id": 1570874267021, "type": "download", "msg": "http://eaas.oss.amberainsider.com/EAAS_TWAP_Bittrex_WAXPBTC_20191010155258.csv?OSSAccessKeyId=LTAIuRlBvUKMjDP6&Expires=4724474272&Signature=VG62Z9dETs%2B9qk9zSsqN3ZbHJLU%3D"}
         3. 查询Task状态 {"client_id": 1570759838252, "result": true, "ip": "172.31.228.79", "pid": 2669, "name": "TWAP_Bittrex_WAXPBTC_20191010155258", "exchange": "Bittrex", "account": "trading", "symbol": ["WAXPBTC", "WAXP", "BTC"], "direction": "Sell", "currency_type": "Base", "price_threshold": null, "total_size": 4100100, "deal_size": 3629797.35, "start_time": "2019-10-02 03:30:00", "end_time": "2019-10-14 03:30:00", "update_time": "2019-10-12 18:27:43.551", "status": "running", "status_msg": "\u4efb\u52a1\u6b63\u5728\u8fd0\u884c", "attention": false, "task": {"algorithm": "TWAP", "exchange": "Bittrex", "account": "trading", "symbol": ["WAXPBTC", "WAXP", "BTC"], "direction": "Sell", "currency_type": "Base", "total_size": 4100100, "trade_role": "Taker", "price_threshold": null, "exchange_fee": 0.002, "execution_mode": "Passive", "test_mode": false, "start_time": "2019-10-02 03:30:00", "end_time": "2019-10-14 03:30:00", "initial_balance": {"WAXP": 4100100, "BTC": 0}, "task_id": "TWAP_Bittrex_WAXPBTC_20191010155258", "coin_config": {"WAXPBTC": {"base_min_order_size": 0.001, "quote_min_order_size": 0.001, "price_precision": 1e-08, "size_precision": 0.001}}, "customer_id": "amberai", "alarm": true}}
+        4. 查询本机最新orderbook {"client_id": 1570759975824, "action": "orderbook", "result": true, "metadata": {"asks": [[9000.5, 0.1]], "bids": [[9000.0, 0.2]], "timestamp_ms": 1570759975000, "seq": 12}}
         """
         print(f"Master get command => {command}")
-        command = json.loads(command)
+        command = codec.loads(command)
         if command['type'] == MasterCommand.GET_BALANCE.value:
             request = {
                 'strategy': self.strategy_name,
@@ -68,12 +89,22 @@ class Balance:
             balance_request = f'{IntercomScope.TRADE.value}:{self.strategy_name}_request'
             if 'test_mode' in command and command['test_mode']:
                 balance_request = 'Test' + balance_request
-            self.requests.append([balance_request, json.dumps(request), PublishChannel.PDT.value])
+            self.requests.append([balance_request, codec.dumps(request), PublishChannel.PDT.value])
         elif command['type'] == MasterCommand.INSPECT.value:
             self.requests.append([CONFIG_GLOBAL['REDIS_MASTER_COMMAND_RESP'], command, MasterCommand.INSPECT.value])
+        elif command['type'] == MasterCommand.ORDERBOOK.value:
+            # 直接读本机共享内存, 本机没有driver收到该symbol的行情时result为false
+            book = book_store.read(command['exchange'], command['symbol'], command.get('contract_type', 'spot'))
+            response = {
+                'client_id': command['client_id'],
+                'action': MasterCommand.ORDERBOOK.value,
+                'result': book is not None,
+                'metadata': book
+            }
+            self.requests.append([CONFIG_GLOBAL['REDIS_MASTER_COMMAND_RESP'], codec.dumps(response), PublishChannel.UI.value])
 
     def balance_handler(self, response):
-        response = json.loads(response['data'])
+        response = codec.loads(response['data'])
         if response['action'] == RequestActions.QUERY_BALANCE.value:
             metadata = {
                 "client_id": response['ref_id'],
@@ -81,7 +112,7 @@ class Balance:
                 "metadata": response['metadata']['metadata']
             }
             # 发送查询到的balance结果给PDTUI
-            self.requests.append([CONFIG_GLOBAL['REDIS_MASTER_COMMAND_RESP'], json.dumps(metadata), PublishChannel.UI.value])
+            self.requests.append([CONFIG_GLOBAL['REDIS_MASTER_COMMAND_RESP'], codec.dumps(metadata), PublishChannel.UI.value])
 
     async def main_process(self):
         balance_key = f'{IntercomScope.TRADE.value}:{self.strategy_name}_response'
@@ -0,0 +1,80 @@
+# encoding: utf-8
+# 共享内存orderbook: 写入/读取一次20档行情的耗时, 以及另一个进程持续写入时读取是否一致(seqlock)
+# 对比: 从redis消息解码一次20档orderbook的耗时(原来每个进程订阅行情后得到最新book的成本)
+# 用法: python benchmark/bench_book_store.py [count]
+import os
+import sys
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+import json
+import multiprocessing
+import time
+from multiprocessing import shared_memory
+
+from config.config import CONFIG_GLOBAL
+from util import codec
+from util.book_store import book_store, segment_name
+
+CONFIG_GLOBAL['BOOK_STORE_PREFIX'] = 'eaas_bench_book'
+KEY = ('Bench', 'BTCUSDT', 'spot')
+
+
+def build_levels(value):
+    return [[value, value] for _ in range(20)]
+
+
+def keep_writing(seconds):
+    # 写入价格和timestamp相同, 读到不一致的数据说明seqlock失效
+    end = time.time() + seconds
+    value = 0
+    while time.time() < end:
+        value += 1
+        book_store.write(*KEY, build_levels(float(value)), build_levels(float(value)), value)
+
+
+def main(count):
+    asks, bids = build_levels(9000.5), build_levels(8999.5)
+    start = time.perf_counter()
+    for i in range(count):
+        book_store.write(*KEY, asks, bids, i + 1)
+    write_us = (time.perf_counter() - start) / count * 1e6
+    start = time.perf_counter()
+    for _ in range(count):
+        book_store.read(*KEY)
+    read_us = (time.perf_counter() - start) / count * 1e6
+    raw = json.dumps({'exchange': 'Bench', 'symbol': 'BTCUSDT', 'contract_type': 'spot', 'data_type': 'orderbook',
+                      'metadata': {'asks': asks, 'bids': bids, 'timestamp': '20191010155258000'},
+                      'timestamp': '20191010155258000'})
+    start = time.perf_counter()
+    for _ in range(count):
+        codec.decode_market_data(raw)
+    decode_us = (time.perf_counter() - start) / count * 1e6
+    print(f'write {write_us:.2f}us read {read_us:.2f}us decode redis message {decode_us:.2f}us')
+    book_store.release(*KEY)
+
+    writer = multiprocessing.Process(target=keep_writing, args=(2,))
+    writer.start()
+    time.sleep(0.2)
+    consistent = torn = missed = 0
+    while writer.is_alive():
+        book = book_store.read(*KEY)
+        if book is None:
+            missed += 1
+            continue
+        values = {value for level in book['asks'] + book['bids'] for value in level}
+        if values == {book['timestamp_ms']}:
+            consistent += 1
+        else:
+            torn += 1
+    print(f'concurrent reads: consistent {consistent} torn {torn} missed {missed}')
+    book_store.close()
+    shm = shared_memory.SharedMemory(segment_name(*KEY))
+    shm.close()
+    shm.unlink()
+    os.unlink(os.path.join(CONFIG_GLOBAL['BOOK_STORE_LOCK_DIR'], segment_name(*KEY) + '.lock'))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,96 @@
+# encoding: utf-8
+# redis消息编解码吞吐: 每个已安装的json库的loads/dumps, 以及行情的typed decode
+# 用法: python benchmark/bench_codec.py [recorded_messages_file] [rounds]
+# recorded_messages_file: 每行一条从redis录制的原始消息, 如 redis-cli subscribe 的输出整理而来; 不指定时使用模拟的pdt消息
+import os
+import sys
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+import json
+import random
+import time
+
+from util import codec
+from util.market_message import MarketMessage
+
+
+def mock_messages():
+    """
+    orderbook(20档)占大多数, 和线上的消息比例接近
+    """
+    ts = '20191201130101123'
+    messages = []
+    for i in range(1000):
+        mid = 8800 + random.uniform(-50, 50)
+        messages.append(json.dumps({
+            "exchange": "Binance", "symbol": "BTCUSDT", "contract_type": "spot", "data_type": "orderbook",
+            "metadata": {"asks": [[round(mid + 0.01 * (j + 1), 2), round(random.uniform(0.01, 5), 6)] for j in range(20)],
+                         "bids": [[round(mid - 0.01 * (j + 1), 2), round(random.uniform(0.01, 5), 6)] for j in range(20)],
+                         "timestamp": ts},
+            "timestamp": ts}))
+        if i % 4 == 0:
+            messages.append(json.dumps({
+                "exchange": "Binance", "symbol": "BTCUSDT", "contract_type": "spot", "data_type": "trade",
+                "metadata": [[str(i * 10 + j), ts, round(mid, 2), random.choice(['buy', 'sell']), 0.01 * j]
+                             for j in range(5)],
+                "timestamp": ts}))
+        if i % 20 == 0:
+            messages.append(json.dumps({
+                "ref_id": f"20191201130101_{i:08}", "action": "place_order", "strategy": "eaas_execution",
+                "metadata": {"exchange": "Binance", "symbol": "BTCUSDT", "contract_type": "spot", "event": "place_order",
+                             "metadata": {"result": True, "account_id": "trader1", "order_id": str(100000 + i)},
+                             "request": {"task_id": "ICEBERG_Binance_BTCUSDT_20191201130101",
+                                         "strategy_id": "ICEBERG_Binance_BTCUSDT_20191201130101"},
+                             "timestamp": ts}}))
+    return messages
+
+
+def bench(name, messages, loads, dumps, rounds):
+    size = sum(len(m) for m in messages) * rounds
+    count = len(messages) * rounds
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for m in messages:
+            loads(m)
+    t_loads = time.perf_counter() - t0
+    line = f'{name:<16} loads {count / t_loads:10.0f} msg/s {size / t_loads / 1e6:7.1f} MB/s'
+    if dumps is not None:
+        decoded = [loads(m) for m in messages]
+        t0 = time.perf_counter()
+        for _ in range(rounds):
+            for d in decoded:
+                dumps(d)
+        t_dumps = time.perf_counter() - t0
+        line += f'   dumps {count / t_dumps:10.0f} msg/s'
+    print(line)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and os.path.isfile(sys.argv[1]):
+        with open(sys.argv[1]) as f:
+            messages = [line.strip() for line in f if line.strip()]
+    else:
+        messages = mock_messages()
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    print(f'{len(messages)} messages, avg {sum(len(m) for m in messages) / len(messages):.0f} bytes, '
+          f'selected backend: {codec.BACKEND}')
+
+    for backend in ['json', 'ujson', 'msgspec', 'orjson']:
+        name, loads, dumps = codec._select_backend(backend)
+        if name != backend:
+            print(f'{backend:<16} not installed')
+            continue
+        bench(backend, messages, loads, dumps, rounds)
+
+    market = [m for m in messages if '"data_type"' in m]
+    bench(f'typed({codec.BACKEND})', market, codec.decode_market_data, None, rounds)
+    # on_book中不订阅的行情只解析消息头, 暂停的任务只解析第一档
+    bench('lazy header', market, MarketMessage, None, rounds)
+    books = [m for m in market if '"orderbook"' in m]
+    bench('lazy top of book', books, lambda m: MarketMessage(m).top_of_book(), None, rounds)
+    for m in books[:100]:
+        message = MarketMessage(m)
+        assert message.top_of_book() == tuple(codec.loads(m)['metadata'][side][0] for side in ('asks', 'bids'))
+        assert message.timestamp == codec.loads(m)['timestamp']
@@ -0,0 +1,121 @@
+# encoding: utf-8
+# StrategyMaster.on_book行情分发: 每条行情遍历所有策略并拼接订阅key(原实现) vs 预先建立的路由表
+# 用法: python benchmark/bench_dispatch.py [messages]
+import os
+import sys
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+import json
+import time
+from datetime import datetime
+
+from config.enums import IntercomScope, MarketDataType, TaskStatus
+from strategy.strategy_master import StrategyMaster
+from util.market_message import MarketMessage
+from util.util import check_precison_of_number
+
+SYMBOLS = [['BTCUSDT', 'BTC', 'USDT'], ['ETHUSDT', 'ETH', 'USDT'], ['ETHBTC', 'ETH', 'BTC'], ['EOSUSDT', 'EOS', 'USDT']]
+
+
+class BenchStrategy:
+    """
+    stand-in of StrategyBase, only counts callbacks
+    """
+    def __init__(self, symbol):
+        self.valid_symbols = {symbol[0]: symbol}
+        self.current_price = None
+        self.anchor_price = 0
+        self.count = 0
+
+    def on_orderbook_ready(self, market_data):
+        self.count += 1
+
+    def on_trade_ready(self, market_data):
+        self.count += 1
+
+
+def create_master(count):
+    """
+    one task with count strategies on 4 symbols of Binance
+    """
+    master = StrategyMaster()
+    master.task = {'strategies': {}, 'coin_config': {'Binance': {}}}
+    master.valid_exchanges['Binance'] = True
+    for i in range(count):
+        symbol = SYMBOLS[i % len(SYMBOLS)]
+        strategy_id = f'ICEBERG_Binance_{symbol[0]}_{i:04}'
+        master.task['strategies'][strategy_id] = {'algorithm': 'ICEBERG', 'symbol': symbol, 'direction': 'Buy'}
+        master.task['coin_config']['Binance'][symbol[0]] = {'price_precision': 0.01, 'size_precision': 0.0001}
+        master.valid_symbols[symbol[0]] = symbol
+        master.strategies[strategy_id] = BenchStrategy(symbol)
+        for data_key in ['orderbook|20', 'trade']:
+            master.subscribe_key['market_data'][f'{IntercomScope.MARKET.value}:Binance|{symbol[0]}|spot|{data_key}'] = {
+                'update_time': time.monotonic(), 'count': 0}
+    return master
+
+
+def legacy_on_book(master, market_data):
+    # 原实现的分发部分, 作为对比; 头部处理与StrategyMaster.on_book相同
+    market_data = MarketMessage(market_data['data'])
+    if market_data.symbol not in master.valid_symbols or market_data.exchange not in master.valid_exchanges:
+        return
+    if market_data.data_type == MarketDataType.ORDERBOOK.value:
+        master.cal_current_price(market_data)
+        price_precision = master.task['coin_config'][market_data.exchange][market_data.symbol]['price_precision']
+        if not check_precison_of_number(market_data.top_of_book()[0][0], price_precision):
+            return
+    if master.status == TaskStatus.PAUSED.value:
+        return
+    for strategy_id in master.strategies:
+        st = master.strategies[strategy_id]
+        if market_data['symbol'] not in st.valid_symbols:
+            continue
+        if market_data['data_type'] == MarketDataType.ORDERBOOK.value:
+            key = '|'.join([market_data['exchange'], market_data['symbol'], market_data['contract_type'],
+                            market_data['data_type'], '20'])
+            key = f'{IntercomScope.MARKET.value}:{key}'
+            master.subscribe_key['market_data'][key]['update_time'] = datetime.now()
+            st.on_orderbook_ready(market_data)
+        elif market_data['data_type'] == MarketDataType.TRADE.value:
+            key = '|'.join([market_data['exchange'], market_data['symbol'], market_data['contract_type'],
+                            market_data['data_type']])
+            key = f'{IntercomScope.MARKET.value}:{key}'
+            master.subscribe_key['market_data'][key]['update_time'] = datetime.now()
+            st.on_trade_ready(market_data)
+
+
+def create_messages(count):
+    # 时间戳设在未来, 避免触发时效性告警
+    ts = '20991201130101123'
+    messages = []
+    for i in range(count):
+        symbol = SYMBOLS[i % len(SYMBOLS)][0]
+        if i % 5:
+            body = {"exchange": "Binance", "symbol": symbol, "contract_type": "spot", "data_type": "orderbook",
+                    "metadata": {"asks": [[100 + j * 0.01, 1.0] for j in range(1, 21)],
+                                 "bids": [[100 - j * 0.01, 1.0] for j in range(1, 21)], "timestamp": ts},
+                    "timestamp": ts}
+        else:
+            body = {"exchange": "Binance", "symbol": symbol, "contract_type": "spot", "data_type": "trade",
+                    "metadata": [["1", ts, 100, "buy", 0.1]], "timestamp": ts}
+        messages.append({'data': json.dumps(body)})
+    return messages
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    messages = create_messages(count)
+    for strategies in [1, 10, 50]:
+        line = f'{strategies:3} strategies:'
+        for name in ['legacy', 'routed']:
+            master = create_master(strategies)
+            on_book = master.on_book if name == 'routed' else lambda m: legacy_on_book(master, m)
+            t0 = time.perf_counter()
+            for message in messages:
+                on_book(message)
+            cost = (time.perf_counter() - t0) / count * 1e6
+            calls = sum(st.count for st in master.strategies.values())
+            line += f'   {name} {cost:7.2f} us/msg ({calls} callbacks)'
+        print(line)
@@ -0,0 +1,95 @@
+# encoding: utf-8
+# 检查Driver事件驱动主循环: 空闲时CPU占用, 以及行情到达到request推送出去的延迟
+# 用法: python benchmark/bench_driver_idle.py [idle_seconds] [ticks]
+# 需要能连接CONFIG_GLOBAL['REDIS_PDT'], 不会抢任务队列中的task
+import os
+import sys
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+import asyncio
+import time
+
+from config.enums import PublishChannel
+from driver import Driver, TaskRunner
+from util.logger import logger
+from util.scheduler import Scheduler
+
+BENCH_TICK_CHANNEL = 'bench:driver_tick'
+BENCH_ORDER_CHANNEL = 'bench:driver_order'
+
+
+class EchoMaster:
+    """
+    minimal strategy_master: every tick sends one request, the same way StrategyMaster.send_order does
+    """
+    def __init__(self):
+        self.requests = []
+        self.request_notify = None
+        self.task = {}
+        self.timer_count = 0
+        self.scheduler = Scheduler()  # 没有job, driver按TIME_INTERVAL触发on_timer
+
+    def send_request(self, req, rtype='PDT', channel=PublishChannel.PDT.value):
+        self.requests.append({'rtype': rtype, 'channel': channel, 'request': req})
+        if self.request_notify is not None:
+            self.request_notify()
+
+    def get_request(self):
+        return self.requests
+
+    def clear_request(self):
+        self.requests = []
+
+    def on_tick(self, message):
+        self.send_request([BENCH_ORDER_CHANNEL, message['data']])
+
+    def on_command(self, message):
+        pass
+
+    def on_timer(self):
+        self.timer_count += 1
+
+    def error_handler(self, status, msg):
+        raise RuntimeError(msg)
+
+
+async def bench(driver, runner, idle_seconds, ticks):
+    master = runner.strategy_master
+    master.send_request(['', {BENCH_TICK_CHANNEL: master.on_tick}], rtype='Subscribe')
+    asyncio.ensure_future(runner.serve())
+    asyncio.ensure_future(driver.listen(driver.p_pdt))
+    asyncio.ensure_future(driver.listen(driver.p_ui))
+    await driver.subscribed.wait()
+
+    # 1. 空闲阶段: 没有行情时进程不应该占用CPU
+    cpu_start, wall_start = time.process_time(), time.time()
+    await asyncio.sleep(idle_seconds)
+    idle_cpu = (time.process_time() - cpu_start) / (time.time() - wall_start)
+
+    # 2. 行情到达 -> handler -> send_request -> publish 的延迟
+    p = driver.r_pdt.pubsub(ignore_subscribe_messages=True)
+    await p.subscribe(BENCH_ORDER_CHANNEL)
+    latency = []
+    for i in range(ticks):
+        await driver.r_pdt.publish(BENCH_TICK_CHANNEL, str(time.perf_counter()))
+        while True:
+            message = await p.get_message(timeout=1)
+            if message:
+                latency.append((time.perf_counter() - float(message['data'])) * 1000)
+                break
+    latency.sort()
+    print(f'idle cpu usage: {idle_cpu * 100:.2f}% over {idle_seconds}s, timer fired {master.timer_count} times')
+    print(f'tick to request latency(ms) of {ticks} ticks: p50 {latency[len(latency) // 2]:.3f} '
+          f'p99 {latency[int(len(latency) * 0.99) - 1]:.3f} max {latency[-1]:.3f}')
+
+
+if __name__ == '__main__':
+    idle_seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    logger.init('bench_driver_idle.txt', local_debug=True)
+    driver_instance = Driver()
+    runner = TaskRunner(driver_instance, {'task_id': 'bench'})
+    runner.strategy_master = EchoMaster()
+    driver_instance.loop.run_until_complete(bench(driver_instance, runner, idle_seconds, ticks))
@@ -0,0 +1,66 @@
+# encoding: utf-8
+# logger单次调用开销: traceback.extract_stack取调用位置 vs frame取调用位置, 以及级别关闭时Lazy参数的开销
+# 用法: python benchmark/bench_logger.py [calls]
+import os
+import sys
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+import json
+import timeit
+import traceback
+from datetime import datetime
+
+from util.logger import format_msg, Lazy, LEVELS
+
+BALANCE = {'Binance|trader1': {c: {'total': 1.5, 'available': 1.2, 'reserved': 0.3, 'shortable': 0}
+                               for c in ['BTC', 'ETH', 'USDT', 'EOS', 'BNB']}}
+
+
+def format_msg_traceback(level, *args):
+    # 原实现, 作为对比
+    caller = traceback.extract_stack()[-3]
+    filepath, filename = os.path.split(caller[0])
+    msg = ' '.join([str(x) for x in args])
+    return f'{datetime.now().strftime("%Y%m%d %H:%M:%S.%f")[0:-3]} {level}[{filename}/{caller[2]}:{caller[1]}] {msg}'
+
+
+class BenchLog:
+    """
+    same call depth as EaasLog.debug, only formats the line
+    """
+    def __init__(self, formatter, level='DEBUG'):
+        self.formatter = formatter
+        self.level = LEVELS[level]
+
+    def debug(self, *args):
+        if self.level > LEVELS['DEBUG']:
+            return
+        return self.formatter('DEBUG ', *args)
+
+
+def handler(log):
+    # 模拟on_response_process里的一次日志调用
+    log.debug('Master Balance => ', Lazy(json.dumps, BALANCE))
+
+
+def nested_handler(log, depth):
+    # 模拟较深的调用栈, traceback.extract_stack的开销随栈深度增长
+    if depth == 0:
+        return handler(log)
+    return nested_handler(log, depth - 1)
+
+
+if __name__ == '__main__':
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    cases = [
+        ('traceback caller', BenchLog(format_msg_traceback)),
+        ('frame caller', BenchLog(format_msg)),
+        ('level disabled', BenchLog(format_msg, 'INFO')),
+    ]
+    for depth in [0, 20]:
+        print(f'call depth +{depth}:')
+        for name, log in cases:
+            cost = timeit.timeit(lambda: nested_handler(log, depth), number=calls) / calls * 1e6
+            print(f'    {name:<18} {cost:8.2f} us/call')
@@ -0,0 +1,115 @@
+# encoding: utf-8
+# 同一台机器上N个driver订阅同一个行情频道: 每个driver直接订阅pdt redis vs 通过relay转发
+# 对比pdt redis推送的消息数/字节数, 以及publish到最后一个driver收到的延迟
+# 用法: python benchmark/bench_market_relay.py [drivers] [messages]
+# 需要能连接CONFIG_GLOBAL['REDIS_PDT']
+import os
+import sys
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+import asyncio
+import json
+import time
+
+from config.config import CONFIG_GLOBAL
+from relay import MarketRelay
+from util.aredis import RedisHandler
+from util.market_relay import RelayClient
+
+BENCH_CHANNEL = 'Md_beta05:Bench|BTCUSDT|spot|orderbook|20'
+
+
+def build_orderbook(i):
+    return json.dumps({
+        'exchange': 'Bench', 'symbol': 'BTCUSDT', 'contract_type': 'spot', 'data_type': 'orderbook',
+        'metadata': {'asks': [[10000.5 + j, 0.5] for j in range(20)], 'bids': [[9999.5 - j, 0.5] for j in range(20)],
+                     'timestamp': time.strftime('%Y%m%d%H%M%S000')},
+        'seq': i, 'sent': time.perf_counter(), 'timestamp': time.strftime('%Y%m%d%H%M%S000')})
+
+
+async def receive(queue, latency):
+    data = await queue.get()
+    latency.append((time.perf_counter() - json.loads(data)['sent']) * 1000)
+
+
+async def listen(pubsub):
+    # aredis的listen()每次只处理一条消息; 取消订阅的回复处理完后subscribed为False, 循环结束
+    # aredis会吞掉读消息时的CancelledError, 不能用cancel()结束listen
+    while pubsub.subscribed:
+        await pubsub.listen()
+
+
+async def bench_direct(r_pdt, drivers, messages):
+    queues = [asyncio.Queue() for _ in range(drivers)]
+    pubsubs = []
+    for queue in queues:
+        p = r_pdt.pubsub(ignore_subscribe_messages=True)
+        await p.subscribe(**{BENCH_CHANNEL: lambda message, queue=queue: queue.put_nowait(message['data'])})
+        pubsubs.append(p)
+    listeners = [asyncio.ensure_future(listen(p)) for p in pubsubs]
+    # 等订阅生效, 否则publish时还没有订阅者
+    await asyncio.sleep(0.2)
+    latency = []
+    delivered = 0
+    for i in range(messages):
+        data = build_orderbook(i)
+        delivered += await r_pdt.publish(BENCH_CHANNEL, data) * len(data)
+        # 只统计最后一个driver收到的延迟
+        await asyncio.gather(*[receive(queue, latency if n == drivers - 1 else []) for n, queue in enumerate(queues)])
+    for p in pubsubs:
+        await p.unsubscribe()
+    await asyncio.gather(*listeners)
+    return delivered, latency
+
+
+async def bench_relay(r_pdt, drivers, messages):
+    relay = MarketRelay()
+    relay.path = '/tmp/bench_market_relay.sock'
+    if os.path.exists(relay.path):
+        os.unlink(relay.path)
+    server = await asyncio.start_unix_server(relay.serve_client, relay.path)
+    listener = asyncio.ensure_future(relay.listen())
+    clients = [RelayClient(relay.path) for _ in range(drivers)]
+    for client in clients:
+        await client.connect()
+        await client.subscribe([BENCH_CHANNEL])
+    await asyncio.sleep(0.2)
+
+    async def client_receive(client, latency):
+        _, data, _ = await client.read()
+        latency.append((time.perf_counter() - json.loads(data)['sent']) * 1000)
+
+    latency = []
+    delivered = 0
+    for i in range(messages):
+        data = build_orderbook(i)
+        delivered += await r_pdt.publish(BENCH_CHANNEL, data) * len(data)
+        await asyncio.gather(*[client_receive(client, latency if n == drivers - 1 else []) for n, client in enumerate(clients)])
+    for client in clients:
+        client.close()
+    # driver都断开后relay取消订阅, listen进入sleep时才能cancel
+    while relay.p_pdt.subscribed:
+        await asyncio.sleep(0.1)
+    listener.cancel()
+    server.close()
+    return delivered, latency
+
+
+def summary(name, delivered, latency, messages):
+    latency.sort()
+    print(f'{name:8} redis deliveries: {delivered / 1024:8.1f} KB ({delivered / 1024 / messages:.2f} KB/msg) '
+          f'latency p50 {latency[len(latency) // 2]:.3f}ms p99 {latency[max(int(len(latency) * 0.99) - 1, 0)]:.3f}ms')
+
+
+async def main(drivers, messages):
+    r_pdt, _ = RedisHandler().connect(CONFIG_GLOBAL['REDIS_PDT'])
+    summary('direct', *await bench_direct(r_pdt, drivers, messages), messages)
+    summary('relay', *await bench_relay(r_pdt, drivers, messages), messages)
+
+
+if __name__ == '__main__':
+    drivers = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    asyncio.get_event_loop().run_until_complete(main(drivers, messages))
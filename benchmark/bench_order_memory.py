@@ -0,0 +1,101 @@
+# encoding: utf-8
+# 长时间任务中保留的订单内存: dict订单(原实现) vs __slots__ Order记录, 以及json编码的开销
+# 用法: python benchmark/bench_order_memory.py [orders]
+import os
+import sys
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+import gc
+import json
+import timeit
+import tracemalloc
+from datetime import datetime
+
+from util.records import Order, encode_record
+
+TASK_ID = 'TWAP_Binance_BTCUSDT_20191201130101'
+STRATEGY_ID = 'TWAP_Binance_BTCUSDT_20191201130101'
+
+
+def dict_order(i):
+    # 原实现: 每个订单一个dict, 每个订单一个notes dict
+    order = {
+        "exchange": 'Binance',
+        "symbol": 'BTCUSDT',
+        "account_type": 'exchange',
+        "contract_type": 'spot',
+        "price": 8822.45 + i % 100,
+        "quantity": 0.01 * (i % 7 + 1),
+        "direction": 'Buy',
+        "order_type": 'limit',
+        "account_id": 'trader01',
+        "strategy_key": 'twap',
+        "delay": 59000,
+        "post_only": False,
+        "filled": 0,
+        "avg_price": 0,
+        "create_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "notes": {"task_id": TASK_ID, "strategy_id": STRATEGY_ID}
+    }
+    # 订单完结后增加的字段
+    order['order_id'] = str(1000000000 + i)
+    order['status'] = 'filled'
+    order['filled'] = order['quantity']
+    order['avg_price'] = order['price']
+    order['update_time'] = order['create_time']
+    return order
+
+
+NOTES = {"task_id": TASK_ID, "strategy_id": STRATEGY_ID}
+
+
+def record_order(i):
+    order = Order(
+        exchange='Binance',
+        symbol='BTCUSDT',
+        account_type='exchange',
+        contract_type='spot',
+        price=8822.45 + i % 100,
+        quantity=0.01 * (i % 7 + 1),
+        direction='Buy',
+        order_type='limit',
+        account_id='trader01',
+        strategy_key='twap',
+        delay=59000,
+        post_only=False,
+        filled=0,
+        avg_price=0,
+        create_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        notes=NOTES
+    )
+    order['order_id'] = str(1000000000 + i)
+    order['status'] = 'filled'
+    order['filled'] = order['quantity']
+    order['avg_price'] = order['price']
+    order['update_time'] = order['create_time']
+    return order
+
+
+def measure(build, count):
+    """
+    :return: (retained bytes, orders)
+    """
+    gc.collect()
+    tracemalloc.start()
+    orders = {f'20191201130101_{i:08}': build(i) for i in range(count)}
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, orders
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    for name, build in [('dict order', dict_order), ('slotted Order', record_order)]:
+        size, orders = measure(build, count)
+        sample = list(orders.values())[:1000]
+        cost = timeit.timeit(lambda: json.dumps(sample, default=encode_record), number=10) / 10 / len(sample) * 1e6
+        print(f'{name:<14} {count} orders {size / 1024 / 1024:8.2f} MB {size / count:8.0f} bytes/order '
+              f'json encode {cost:6.2f} us/order')
+        del orders, sample
@@ -0,0 +1,112 @@
+# encoding: utf-8
+# 模拟10分钟的挂单查询: 每3秒inspect全部active订单(原实现, push交易所每60秒) vs OrderTracker
+# 统计每个成交订单的inspect次数, 成交被发现的平均延迟, 以及超过交易所限频(xxx502)的次数
+# 用法: python benchmark/bench_order_tracker.py [orders]
+import os
+import sys
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+import asyncio
+import random
+
+from util.order_tracker import OrderTracker
+from util.rate_limiter import TokenReserve
+
+SECONDS = 600
+STEP = 0.5  # 模拟时间步长(秒)
+LIMIT = {'default': {'inspect_order': [2, 5]}, 'Binance': {'inspect_order': [5, 10]}}  # PDT_RATE_LIMIT格式
+EXCHANGE_LIMIT = {'Binance': 8, 'Huobi': 4}  # 交易所实际允许的每秒inspect次数
+PUSH = {'Binance': True, 'Huobi': False}
+TOP = ([8000.0, 1], [7999.0, 1])
+
+
+class SimulatedLimiter:
+    """
+    SharedRateLimiter on the simulated clock, same token bucket as TOKEN_BUCKET_SCRIPT
+    """
+
+    def __init__(self, limits, clock):
+        self.limits = limits
+        self.clock = clock
+        self.buckets = {}  # key -> [tokens, ts]
+
+    async def acquire(self, exch_acc, action, count=1):
+        rate, burst = self.limits.get(exch_acc.split('|', 1)[0], self.limits['default'])[action]
+        now = self.clock[0]
+        tokens, ts = self.buckets.get((exch_acc, action), (burst, now))
+        tokens = min(burst, tokens + (now - ts) * rate)
+        granted = min(count, int(tokens))
+        self.buckets[(exch_acc, action)] = (tokens - granted, now)
+        return granted, 0
+
+
+def create_orders(count):
+    orders = {}
+    for i in range(count):
+        exchange = 'Binance' if i % 2 else 'Huobi'
+        price = round(TOP[1][0] * (1 - random.uniform(-0.0005, 0.003)), 2)
+        # 越靠近盘口越容易成交
+        fill_time = random.expovariate(1 / (60 + (TOP[1][0] - price) * 2))
+        orders[('s', str(i))] = {'exchange': exchange, 'account_id': 'trader1', 'symbol': 'BTCUSDT',
+                                 'direction': 'Buy', 'price': price, 'fill_time': fill_time}
+    return orders
+
+
+def simulate(orders, legacy):
+    clock = [0.0]
+    tracker = OrderTracker(TokenReserve('inspect_order'), 60, 6, clock=lambda: clock[0])
+    limiter = SimulatedLimiter(LIMIT, clock)
+    loop = asyncio.new_event_loop()
+    active = dict(orders)
+    inspects, errors, latency = 0, 0, []
+    window = {exchange: [] for exchange in EXCHANGE_LIMIT}
+    last_legacy = {'Binance': 0, 'Huobi': 0}
+    while clock[0] < SECONDS and active:
+        now = clock[0]
+        for key, order in list(active.items()):
+            if order['fill_time'] <= now and PUSH[order['exchange']]:
+                # on_order_update推送成交
+                latency.append(now - order['fill_time'])
+                del active[key]
+        if legacy:
+            selected = []
+            for exchange, interval in (('Binance', 60), ('Huobi', 3)):
+                if now - last_legacy[exchange] >= interval:
+                    last_legacy[exchange] = now
+                    selected += [key for key, order in active.items() if order['exchange'] == exchange]
+        else:
+            selected = tracker.select(active, lambda order: PUSH[order['exchange']], lambda order: TOP)
+            # driver补充令牌后立即重新选择
+            if loop.run_until_complete(tracker.tokens.fill(limiter)):
+                selected += tracker.select(active, lambda order: PUSH[order['exchange']], lambda order: TOP)
+        for key in selected:
+            order = active[key]
+            inspects += 1
+            sent = window[order['exchange']]
+            sent[:] = [t for t in sent if now - t < 1] + [now]
+            if len(sent) > EXCHANGE_LIMIT[order['exchange']]:
+                errors += 1
+                if not legacy:
+                    tracker.on_rate_limited(f"{order['exchange']}|trader1")
+                continue
+            if not legacy:
+                tracker.on_update(*key)
+            if order['fill_time'] <= now:
+                latency.append(now - order['fill_time'])
+                del active[key]
+        clock[0] += STEP
+    loop.close()
+    filled = len(latency)
+    return inspects, filled, errors, sum(latency) / max(filled, 1)
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    random.seed(1)
+    orders = create_orders(count)
+    for name, legacy in [('legacy', True), ('OrderTracker', False)]:
+        inspects, filled, errors, latency = simulate(orders, legacy)
+        print(f'{name:<13} inspects: {inspects:6d}  filled: {filled:4d}  inspects/fill: {inspects / max(filled, 1):6.1f}  '
+              f'rate limit errors: {errors:5d}  fill detect latency: {latency:5.2f}s')
@@ -0,0 +1,58 @@
+# encoding: utf-8
+# 对比逐条await publish与Driver按连接合并pipeline推送一批request的耗时, 模拟cancel_all_order的撤单burst
+# 用法: python benchmark/bench_request_pipeline.py [burst_size] [rounds]
+# 需要能连接CONFIG_GLOBAL['REDIS_PDT']
+import os
+import sys
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+import json
+import time
+
+from config.enums import PublishChannel
+from driver import Driver, TaskRunner
+from util.logger import logger
+
+BENCH_CHANNEL = 'bench:driver_burst'
+
+
+def build_burst(burst_size):
+    return [{
+        'rtype': 'PDT',
+        'channel': PublishChannel.PDT.value,
+        'request': [BENCH_CHANNEL, {'action': 'cancel_order', 'ref_id': f'bench_{i:08}'}]
+    } for i in range(burst_size)]
+
+
+async def bench(driver, runner, burst_size, rounds):
+    serial, pipelined = [], []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for req in build_burst(burst_size):
+            await driver.r_pdt.publish(req['request'][0], json.dumps(req['request'][1]))
+        serial.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        pipes = {}
+        for req in build_burst(burst_size):
+            await runner.process_request(req, pipes)
+        await driver.flush_pipelines(pipes)
+        pipelined.append((time.perf_counter() - start) * 1000)
+    print(f'burst of {burst_size} requests, {rounds} rounds')
+    print(f'serial publish: avg {sum(serial) / rounds:.3f}ms')
+    print(f'pipelined:      avg {sum(pipelined) / rounds:.3f}ms')
+
+
+if __name__ == '__main__':
+    burst_size = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    logger.init('bench_request_pipeline.txt', local_debug=True)
+    driver_instance = Driver()
+    runner = TaskRunner(driver_instance, {'task_id': 'bench'})
+    # 关闭request日志, 只统计推送耗时
+    logger.file = lambda *args: None
+    driver_instance.loop.run_until_complete(bench(driver_instance, runner, burst_size, rounds))
+    logger.file = lambda *args: print(*args)
+    driver_instance.report_pipeline_stats()
@@ -0,0 +1,93 @@
+# encoding: utf-8
+# driver启动方式对比: exec(每个driver启动新的python进程) vs zygote(从已经导入所有模块的zygote进程fork)
+# 1. 从请求启动到driver就绪(导入完成, Driver初始化完成, 可以blpop任务)的时间;
+#    没有空闲driver时, 任务入队到首次下单的时间 = driver就绪时间 + 和启动方式无关的task初始化/算法调度时间
+# 2. 同时运行N个driver(默认 4 x cpu核数)时的内存: rss总和, 以及pss总和(共享页按进程数分摊, 写时复制共享的页只算一份)
+# 用法: python benchmark/bench_spawn.py [drivers]
+import os
+import sys
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+import signal
+import subprocess
+import time
+
+import psutil
+
+PROBE = 'import driver; driver.Driver(); print("ready", flush=True); import time; time.sleep(3600)'
+
+
+def memory(pids):
+    rss = pss = 0
+    for pid in pids:
+        info = psutil.Process(pid).memory_full_info()
+        rss += info.rss
+        pss += getattr(info, 'pss', info.uss)
+    return rss / 1024 / 1024, pss / 1024 / 1024
+
+
+def bench_exec(count):
+    latency = []
+    procs = []
+    for _ in range(count):
+        start = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, '-c', PROBE], cwd=rootPath, stdout=subprocess.PIPE)
+        proc.stdout.readline()
+        latency.append((time.perf_counter() - start) * 1000)
+        procs.append(proc)
+    rss, pss = memory([proc.pid for proc in procs])
+    for proc in procs:
+        proc.kill()
+        proc.wait()
+    return latency, rss, pss
+
+
+def bench_zygote(count):
+    start = time.perf_counter()
+    import driver
+    import zygote
+    zygote.preload()
+    preload_ms = (time.perf_counter() - start) * 1000
+    zygote_instance = zygote.Zygote()
+    latency = []
+    pids = []
+    for _ in range(count):
+        ready_r, ready_w = os.pipe()
+
+        def probe():
+            driver.Driver()
+            os.write(ready_w, b'r')
+            time.sleep(3600)
+
+        start = time.perf_counter()
+        pids.append(zygote_instance.fork(probe))
+        os.read(ready_r, 1)
+        latency.append((time.perf_counter() - start) * 1000)
+        os.close(ready_r)
+        os.close(ready_w)
+    # zygote自身(本进程)也常驻内存, 计入总和
+    rss, pss = memory(pids + [os.getpid()])
+    for pid in pids:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+    return latency, rss, pss, preload_ms
+
+
+def summary(name, latency, rss, pss, count):
+    latency.sort()
+    print(f'{name:7} ready p50 {latency[len(latency) // 2]:8.1f}ms max {latency[-1]:8.1f}ms '
+          f'{count} drivers rss {rss:8.1f}MB pss {pss:8.1f}MB')
+
+
+def main(count):
+    latency, rss, pss = bench_exec(count)
+    summary('exec', latency, rss, pss, count)
+    latency, rss, pss, preload_ms = bench_zygote(count)
+    summary('zygote', latency, rss, pss, count)
+    print(f'zygote import + preload (once per host): {preload_ms:.1f}ms')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 4 * os.cpu_count())
@@ -0,0 +1,114 @@
+# encoding: utf-8
+# 每个task每小时写入UI redis的字节数: 每3秒推送完整status+hset带task的status(原实现) vs snapshot/delta
+# 用法: python benchmark/bench_status.py [strategies]
+import os
+import sys
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+import copy
+import random
+from datetime import datetime, timedelta
+
+from util import codec
+from util.task_status import DELTA, StatusTracker, merge_status
+
+TICKS = 3600 // 3  # 一小时, 每3秒一次send_status
+
+
+def create_task(strategies):
+    task = {'task_id': 'TWAP_Binance_BTCUSDT_20200101000000', 'start_time': '2020-01-01 00:00:00',
+            'end_time': '2020-01-02 00:00:00', 'test_mode': False, 'strategies': {}}
+    for i in range(strategies):
+        strategy_id = f'TWAP_Binance_BTCUSDT_2020010100000{i}'
+        task['strategies'][strategy_id] = {
+            'algorithm': 'TWAP', 'exchange': 'Binance', 'account': 'trader1', 'symbol': ['BTCUSDT', 'BTC', 'USDT'],
+            'direction': 'Sell', 'currency_type': 'Base', 'total_size': 100, 'trade_role': 'Taker',
+            'price_threshold': None, 'exchange_fee': 0.001, 'execution_mode': 'Passive',
+            'start_time': '2020-01-01 00:00:00', 'end_time': '2020-01-02 00:00:00',
+            'initial_balance': {'BTC': 100, 'USDT': 0}, 'fixed_interval': 30000, 'random_interval': 10000,
+            'coin_config': {'BTCUSDT': {'base_min_order_size': 0.0001, 'quote_min_order_size': 10,
+                                        'price_precision': 0.01, 'size_precision': 1e-06}},
+            'customer_id': 'customer', 'alarm': True, 'strategy_id': strategy_id}
+    return task
+
+
+def create_statuses(task):
+    """
+    current_price changes on most ticks, deal_size on a few, status changes twice
+    """
+    now = datetime(2020, 1, 1)
+    price = 8000.0
+    deal_size = 0
+    statuses = []
+    for tick in range(TICKS):
+        price = round(price + random.choice([-0.5, 0, 0.5]), 2)
+        if random.random() < 0.1:
+            deal_size = round(deal_size + random.uniform(0, 0.1), 6)
+        status_obj = {
+            'ip': '172.31.0.1', 'pid': 1234, 'name': task['task_id'],
+            'status': 'running' if tick < TICKS // 2 else 'paused', 'status_msg': '任务正在运行',
+            'start_time': task['start_time'], 'end_time': task['end_time'],
+            'update_time': (now + timedelta(seconds=3 * tick)).strftime("%Y-%m-%d %H:%M:%S.%f")[0:-3],
+            'strategies': {},
+        }
+        for strategy_id, st_task in task['strategies'].items():
+            status_obj['strategies'][strategy_id] = {
+                'strategy_id': strategy_id, 'exchange': st_task['exchange'], 'account': st_task['account'],
+                'symbol': st_task['symbol'][0], 'direction': st_task['direction'],
+                'currency_type': st_task['currency_type'], 'price_threshold': st_task['price_threshold'],
+                'total_size': st_task['total_size'], 'start_time': st_task['start_time'],
+                'end_time': st_task['end_time'], 'deal_size': deal_size, 'attention': False,
+                'current_price': price, 'status': status_obj['status'], 'status_msg': status_obj['status_msg']}
+        statuses.append(status_obj)
+    return statuses
+
+
+def legacy(task, statuses):
+    written = 0
+    for status_obj in statuses:
+        body = copy.deepcopy(status_obj)
+        written += len(codec.dumps(body))  # rpush
+        body['task'] = task
+        written += len(codec.dumps(body))  # hset monitor
+    return written, len(statuses)
+
+
+def delta(task, statuses):
+    clock = [0]
+    tracker = StatusTracker(300, clock=lambda: clock[0])
+    written = 0
+    task_definition = None
+    snapshot, last_delta, snapshots = None, None, 0
+    for tick, status_obj in enumerate(statuses):
+        clock[0] = 3 * tick
+        message = tracker.build(copy.deepcopy(status_obj))
+        data = codec.dumps(message)
+        written += len(data)  # rpush
+        if message['type'] == DELTA:
+            last_delta = message
+            if tick % 10 == 0:
+                written += len(data)  # hset delta, STATUS_DELTA_INTERVAL = 30s
+        else:
+            written += len(data)  # hset monitor
+            snapshot, last_delta = message, None
+            snapshots += 1
+            if codec.dumps(task) != task_definition:
+                task_definition = codec.dumps(task)
+                written += len(task_definition)
+        # 读取方合并后与完整status一致
+        merged = merge_status(snapshot, last_delta)
+        assert {key: value for key, value in merged.items() if key != 'type'} == status_obj
+    return written, snapshots
+
+
+if __name__ == '__main__':
+    strategies = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    task = create_task(strategies)
+    statuses = create_statuses(task)
+    legacy_bytes, _ = legacy(task, statuses)
+    delta_bytes, snapshots = delta(task, statuses)
+    print(f'legacy          {legacy_bytes / 1024:9.1f} KB/task/hour')
+    print(f'snapshot/delta  {delta_bytes / 1024:9.1f} KB/task/hour ({snapshots} snapshots), '
+          f'{legacy_bytes / delta_bytes:.1f}x less')
@@ -0,0 +1,55 @@
+# encoding: utf-8
+# 每个tick的下单规则计算: coin_config查找+format_price/format_amount(原实现) vs SymbolRules
+# 用法: python benchmark/bench_symbol_rules.py [rounds]
+import os
+import sys
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+import random
+import time
+
+from util.symbol_rules import SymbolRules
+from util.util import format_amount, format_price, get_amount_precision, get_min_order_size, get_price_precision
+
+TASK = {'exchange': 'Binance', 'symbol': ['BTCUSDT', 'BTC', 'USDT'],
+        'coin_config': {'BTCUSDT': {'price_precision': 0.01, 'size_precision': 1e-06,
+                                    'base_min_order_size': 0.0001, 'quote_min_order_size': 10}}}
+
+
+def legacy(price, amount):
+    # Iceberg.on_orderbook_ready原来的写法
+    price_precision = get_price_precision(TASK, TASK['exchange'], TASK['symbol'][0])
+    amount_precision = get_amount_precision(TASK, TASK['exchange'], TASK['symbol'][0])
+    base_min_order_size, quote_min_order_size = get_min_order_size(TASK, TASK['exchange'], TASK['symbol'][0])
+    price = format_price(price, price_precision)
+    min_order_size = max(base_min_order_size, quote_min_order_size / price)
+    return price, format_amount(amount, amount_precision), min_order_size
+
+
+def with_rules(rules, price, amount):
+    price = rules.format_price(price)
+    return price, rules.format_amount(amount), rules.min_order_size(price)
+
+
+if __name__ == '__main__':
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    values = [(random.uniform(7000, 9000), random.uniform(0.001, 2)) for _ in range(rounds)]
+
+    t0 = time.perf_counter()
+    for price, amount in values:
+        legacy(price, amount)
+    cost = (time.perf_counter() - t0) / rounds * 1e9
+    print(f'legacy        {cost:6.0f} ns/tick')
+
+    t0 = time.perf_counter()
+    rules = SymbolRules.from_coin_config(TASK['exchange'], 'BTCUSDT', TASK['coin_config']['BTCUSDT'])
+    for price, amount in values:
+        with_rules(rules, price, amount)
+    cost = (time.perf_counter() - t0) / rounds * 1e9
+    print(f'SymbolRules   {cost:6.0f} ns/tick')
+
+    # 只有离十进制的半tick(8000.015)不到10^-GUARD_DIGITS个tick的价格会不同, 见tests/test_fixed_point.py
+    differ = sum(with_rules(rules, price, amount)[0] != legacy(price, amount)[0] for price, amount in values[:10000])
+    print(f'price differs from legacy: {differ} / 10000')
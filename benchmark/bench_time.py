@@ -0,0 +1,77 @@
+# encoding: utf-8
+# 每条行情的时间判断: datetime.now()+字符串解析(原实现) vs time_service的缓存时钟和整数毫秒
+# 用法: python benchmark/bench_time.py [rounds]
+import os
+import sys
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+import time
+from datetime import datetime, timedelta
+
+from util.time_service import time_service
+from util.util import get_datetime, str_to_datetime
+
+START_TIME = '2019-12-01 13:01:02'
+
+
+def legacy_book(timestamp, last_order_time):
+    # on_book的时效性检查 + Iceberg.on_orderbook_ready的开始时间和发单间隔检查
+    valid = (datetime.now() - get_datetime(timestamp)).total_seconds() <= 3
+    started = (datetime.now() - str_to_datetime(START_TIME)).total_seconds() >= 0
+    wait = (datetime.now() - last_order_time).total_seconds() < 5
+    return valid, started, wait
+
+
+def service_book(timestamp, start_ms, last_order_time):
+    now_ms = time_service.tick()
+    valid = now_ms - time_service.pdt_to_ms(timestamp) <= 3000
+    started = now_ms >= start_ms
+    wait = time_service.monotonic - last_order_time < 5
+    return valid, started, wait
+
+
+def legacy_trade_check(trade_list):
+    for trade in trade_list:
+        if (datetime.now() - str_to_datetime(trade[1])).total_seconds() > 60:
+            trade_list.remove(trade)
+
+
+def service_trade_check(trade_list):
+    return [_ for _ in trade_list if time_service.now_ms - _[0] <= 60 * 1000]
+
+
+if __name__ == '__main__':
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    now = datetime.now()
+    timestamps = [(now - timedelta(milliseconds=i)).strftime('%Y%m%d%H%M%S%f')[:17] for i in range(rounds)]
+
+    t0 = time.perf_counter()
+    last_order_time = datetime.now()
+    for timestamp in timestamps:
+        legacy_book(timestamp, last_order_time)
+    legacy = (time.perf_counter() - t0) / rounds * 1e6
+
+    t0 = time.perf_counter()
+    start_ms = time_service.str_to_ms(START_TIME)
+    last_order_time = time.monotonic()
+    for timestamp in timestamps:
+        service_book(timestamp, start_ms, last_order_time)
+    service = (time.perf_counter() - t0) / rounds * 1e6
+    print(f'per orderbook:        legacy {legacy:6.2f} us   time_service {service:6.2f} us')
+
+    # 1分钟内的3000笔成交, 每3秒检查一次过期
+    trades = [['1', (now - timedelta(milliseconds=20 * i)).strftime('%Y%m%d%H%M%S%f')[:17], 100, 'buy', 0.1]
+              for i in range(3000)]
+    t0 = time.perf_counter()
+    for _ in range(10):
+        legacy_trade_check(list(trades))
+    legacy = (time.perf_counter() - t0) / 10 * 1e3
+    parsed = [(time_service.pdt_to_ms(trade[1]), trade) for trade in trades]
+    time_service.tick()
+    t0 = time.perf_counter()
+    for _ in range(10):
+        service_trade_check(parsed)
+    service = (time.perf_counter() - t0) / 10 * 1e3
+    print(f'trade_check (3000):   legacy {legacy:6.2f} ms   time_service {service:6.2f} ms')
@@ -0,0 +1,81 @@
+# encoding: utf-8
+# 时间戳解析: 原get_datetime/str_to_datetime/strptime列表推导 vs util.timestamp的整数运算和向量化
+# 用法: python benchmark/bench_timestamp.py [count]
+import os
+import sys
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+import random
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from util import timestamp
+
+
+def legacy_get_datetime(timestamp):
+    if not isinstance(timestamp, str):
+        timestamp = str(timestamp)
+    year = int(timestamp[0:4])
+    month = int(timestamp[4:6])
+    day = int(timestamp[6:8])
+    hour = int(timestamp[8:10])
+    minute = int(timestamp[10:12])
+    second = int(timestamp[12:14])
+    milisec = int(timestamp[14:17]) * 1000
+    return datetime(year, month, day, hour, minute, second, milisec)
+
+
+def legacy_str_to_datetime(string):
+    for char in ['_', '-', ':', '.', ' ']:
+        string = string.replace(char, '')
+    if len(string) == 8:
+        return datetime.strptime(string, '%Y%m%d')
+    elif len(string) == 14:
+        return datetime.strptime(string, '%Y%m%d%H%M%S')
+    elif len(string) == 17:
+        return datetime.strptime(string, '%Y%m%d%H%M%S%f')
+    return None
+
+
+def run(name, func, values):
+    t0 = time.perf_counter()
+    func(values)
+    cost = time.perf_counter() - t0
+    print(f'{name:<52} {cost * 1e3:9.2f} ms  {cost / len(values) * 1e9:8.0f} ns/value')
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    start = datetime(2019, 12, 1, 13, 1, 1)
+    # 行情时间戳: 递增, 大约每毫秒一条, 有重复
+    pdt = [(start + timedelta(milliseconds=i // 2)).strftime('%Y%m%d%H%M%S%f')[:17] for i in range(count)]
+    # 订单的update_time: 秒级, 随机分布在一天中
+    update_times = [(start + timedelta(seconds=random.randint(0, 86400))).strftime('%Y-%m-%d %H:%M:%S')
+                    for _ in range(count)]
+    print(f'{count} values')
+
+    run('get_datetime         legacy', lambda v: [legacy_get_datetime(x) for x in v], pdt)
+    timestamp.pdt_to_datetime.cache_clear()
+    run('get_datetime         timestamp.pdt_to_datetime', lambda v: [timestamp.pdt_to_datetime(x) for x in v], pdt)
+    run('epoch ms             legacy(datetime.timestamp)',
+        lambda v: [int(legacy_get_datetime(x).timestamp() * 1000) for x in v], pdt)
+    timestamp.second_to_ms.cache_clear()
+    run('epoch ms             timestamp.pdt_to_ms', lambda v: [timestamp.pdt_to_ms(x) for x in v], pdt)
+    run('epoch ms             timestamp.pdt_array_to_ms', timestamp.pdt_array_to_ms, pdt)
+    run('str_to_datetime      legacy', lambda v: [legacy_str_to_datetime(x) for x in v], update_times)
+    timestamp.pdt_to_datetime.cache_clear()
+    run('str_to_datetime      timestamp.str_to_datetime',
+        lambda v: [timestamp.str_to_datetime(x) for x in v], update_times)
+    run('update_time column   strptime list',
+        lambda v: pd.Series([datetime.strptime(x, '%Y-%m-%d %H:%M:%S') for x in v]), update_times)
+    run('update_time column   timestamp.str_series_to_datetime', timestamp.str_series_to_datetime, pd.Series(update_times))
+
+    for x in pdt[:1000] + [pdt[-1]]:
+        assert timestamp.pdt_to_datetime(x) == legacy_get_datetime(x)
+        assert timestamp.pdt_to_ms(x) == round(legacy_get_datetime(x).timestamp() * 1000)
+    for x in update_times[:1000]:
+        assert timestamp.str_to_datetime(x) == legacy_str_to_datetime(x)
@@ -0,0 +1,75 @@
+# encoding: utf-8
+# Iceberg最近1分钟成交量: trade_list + list.remove + 每个orderbook求和(原实现) vs TradeWindow
+# 用法: python benchmark/bench_trade_window.py [trades_per_second]
+import os
+import sys
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+import random
+import time
+from datetime import datetime, timedelta
+
+from util.timestamp import pdt_to_ms
+from util.trade_window import TradeWindow
+from util.util import str_to_datetime
+
+SECONDS = 180  # 模拟3分钟, 每秒一条trade消息, 每100ms一个orderbook, 每3秒一次on_timer
+
+
+def create_trades(rate):
+    start = datetime.now() - timedelta(seconds=SECONDS)
+    messages = []
+    for second in range(SECONDS):
+        ts = [(start + timedelta(seconds=second, milliseconds=1000 * i // rate)).strftime('%Y%m%d%H%M%S%f')[:17]
+              for i in range(rate)]
+        messages.append([['1', t, 100.0, random.choice(['buy', 'sell']), random.uniform(0.01, 1)] for t in ts])
+    return start, messages
+
+
+def legacy(start, messages):
+    trade_list = []
+    tr_s = 0
+    for second, trades in enumerate(messages):
+        now = start + timedelta(seconds=second + 1)
+        for _ in trades:
+            if (now - str_to_datetime(_[1])).total_seconds() <= 60:
+                trade_list.append(_)
+        for _ in range(10):
+            tr_s = sum([_[4] for _ in trade_list])
+        if second % 3 == 0:
+            for trade in trade_list:
+                if (now - str_to_datetime(trade[1])).total_seconds() > 60:
+                    trade_list.remove(trade)
+    return tr_s
+
+
+def window(start, messages):
+    trade_window = TradeWindow()
+    start_ms = int(start.timestamp() * 1000)
+    tr_s = 0
+    for second, trades in enumerate(messages):
+        now_ms = start_ms + (second + 1) * 1000
+        trade_window.add_trades(trades, now_ms)
+        for _ in range(10):
+            trade_window.expire(now_ms)
+            tr_s = trade_window.size
+    return tr_s
+
+
+if __name__ == '__main__':
+    rate = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    start, messages = create_trades(rate)
+    for name, func in [('legacy', legacy), ('TradeWindow', window)]:
+        t0 = time.perf_counter()
+        tr_s = func(start, messages)
+        cost = time.perf_counter() - t0
+        print(f'{name:<12} {cost * 1e3:9.2f} ms for {SECONDS}s of {rate} trades/s, last volume {tr_s:.4f}')
+    # 窗口内成交量与逐笔求和一致
+    trade_window = TradeWindow()
+    now_ms = int(start.timestamp() * 1000) + SECONDS * 1000
+    trade_window.add_trades([t for trades in messages for t in trades], now_ms)
+    expected = [t for trades in messages for t in trades if now_ms - pdt_to_ms(t[1]) <= 60 * 1000]
+    assert trade_window.count == len(expected)
+    assert abs(trade_window.size - sum(t[4] for t in expected)) < 1e-9
@@ -14,13 +14,60 @@ sentry = Client('http://39b1c2f2f89d40d7bad906157a1c5bef@172.31.228.60:9000/2')
 
 CONFIG_GLOBAL = {
     "TIME_INTERVAL": 3,  # 定时任务的时间间隔
+    "DRIVER_MAX_TASKS": 20,  # 每个driver进程同时运行的最大task数, 所有task共用redis连接和订阅
+    "DRIVER_PROCESS_NUM": 0,  # master保持的driver进程数, 0表示cpu核数
+    "SUPERVISOR_RESTART_MIN_DELAY": 0.1,  # 子进程退出后的重启等待时间(秒), 连续快速退出时按2倍退避
+    "SUPERVISOR_RESTART_MAX_DELAY": 30,  # 子进程重启的最大等待时间(秒)
+    "SUPERVISOR_STABLE_TIME": 60,  # 子进程运行超过该时间(秒)后退出, 立即重启并复位退避时间
+    "SUPERVISOR_STATS_INTERVAL": 60,  # master输出子进程cpu/rss的间隔(秒)
+    "MASTER_HEARTBEAT_INTERVAL": 60,  # master向alarm redis发送心跳的间隔(秒)
+    "DRIVER_SPAWN_MODE": "exec",  # exec: 每个driver启动新的python进程; zygote: 由预先导入所有模块的zygote进程fork
+    "DRIVER_PROCESS_NAME": "eaas_driver",  # zygote fork的driver的进程名, 命令行和zygote相同, 用于区分
+    "ZYGOTE_SOCKET": "/tmp/eaas_zygote.sock",  # master向zygote请求fork的unix domain socket
+    "ZYGOTE_CONNECT_TIMEOUT": 30,  # 等待zygote启动完成的最长时间(秒)
+    "FEED_CHECK_INTERVAL": 30,  # 检查行情/order_update是否断流的间隔(秒)
+    "SCHEDULER_STATS_INTERVAL": 300,  # 定时任务耗时统计写入日志的间隔(秒)
+    "REDIS_RETRY_MIN_DELAY": 0.5,  # redis监听出错后的初始重试间隔(秒), 按2倍退避
+    "REDIS_RETRY_MAX_DELAY": 30,  # redis监听出错后的最大重试间隔(秒)
+    "PIPELINE_STATS_INTERVAL": 60,  # 写入redis pipeline统计信息的间隔(秒)
+    "MARKET_RELAY_ENABLED": True,  # driver通过本机relay进程接收行情, relay不可用时直接订阅pdt redis
+    "MARKET_RELAY_SOCKET": "/tmp/eaas_market_relay.sock",  # relay的unix domain socket
+    "MARKET_RELAY_BUFFER": 4 * 1024 * 1024,  # relay给每个driver缓存的最大字节数, 超过后丢弃行情
+    "MARKET_RELAY_STATS_INTERVAL": 60,  # relay按频道输出行情统计的间隔(秒)
+    "BOOK_STORE_ENABLED": True,  # driver把收到的orderbook写入本机共享内存, 见util/book_store.py
+    "BOOK_STORE_DEPTH": 20,  # 共享内存中每边保存的档数
+    "BOOK_STORE_PREFIX": "eaas_book",  # 共享内存名字的前缀
+    "BOOK_STORE_LOCK_DIR": "/tmp",  # 每个symbol写入锁文件的目录
+    "LOG_QUEUE_SIZE": 50000,  # 日志队列容量(行), 满了之后按级别丢弃, 不阻塞主循环
+    "LOG_SHIP_INTERVAL": 1,  # 后台线程合并写入oss的最小间隔(秒)
+    "LOG_LEVEL": {"oss": "INFO", "file": "DEBUG", "stdout": "DEBUG"},  # 每个输出端的日志级别, DEBUG/INFO/WARNING/ERROR
+    "LOG_FILE_FORMAT": "text",  # 本地日志文件格式, text/json(json lines)
+    "ORDER_JOURNAL_COMPACT_SIZE": 5000,  # 订单journal记录数超过该值时在定时任务中压缩成快照
+    "JSON_CODEC": "auto",  # redis消息的json库, auto/orjson/msgspec/ujson/json
 
     "REDIS_ADD_TASK_QUEUE": "eaas_add_task",  # 任务队列
     "REDIS_TASK_STATUS": "eaas_task_status",  # 定时向外部推送task的状态信息
     "REDIS_TASK_COMMAND": "eaas_task_command",  # 控制task的暂停, 恢复, 删除
     "REDIS_TASK_COMMAND_RESP": "eaas_task_command_response",  # 控制命令返回信息
     "REDIS_NOTIFICATION": "eaas_notification",  # UI 通知通道
-    "REDIS_STATUS_MONITOR": "eaas_status_monitor",  # hash表, 存着所有task最新的status
+    "REDIS_STATUS_MONITOR": "eaas_status_monitor",  # hash表, 存着所有task最新的status snapshot
+    "REDIS_STATUS_DELTA": "eaas_status_delta",  # hash表, 存着所有task相对snapshot变化的字段
+    "REDIS_TASK_DEFINITION": "eaas_task_definition",  # hash表, 存着所有task的原始定义, 只在变化时写入
+    "REDIS_TASK_STATUS_MAX_LEN": 100000,  # REDIS_TASK_STATUS列表保留的最大长度
+    "STATUS_SNAPSHOT_INTERVAL": 300,  # 状态没有变化时, 定期推送完整snapshot的间隔(秒)
+    "STATUS_DELTA_INTERVAL": 30,  # REDIS_STATUS_DELTA中delta的最小写入间隔(秒)
+    "ORDER_INSPECT_CHECK_INTERVAL": 1,  # 检查哪些active订单需要inspect的间隔(秒)
+    "ORDER_UPDATE_STALE": 60,  # 支持on_order_update的交易所, 订单超过该时间(秒)没有任何回报才inspect
+    "ORDER_INSPECT_STALE": 6,  # 其他交易所的inspect间隔(秒), 价格穿过盘口的订单减半
+    # 同一个exchange|account所有driver进程共用的发单/撤单/查询限频 [每秒请求数, 突发容量], 令牌桶存在REDIS_PDT
+    # 超出限频的发单/撤单请求在driver中排队, 按顺序延后推送; inspect令牌由order_tracker预取, 按优先级选择订单
+    "REDIS_RATE_LIMIT": "eaas_rate_limit",
+    "PDT_RATE_LIMIT": {
+        "default": {"place_order": [10, 20], "cancel_order": [10, 20], "inspect_order": [5, 10]},
+        "Binance": {"place_order": [10, 50], "cancel_order": [10, 50], "inspect_order": [10, 20]},
+        "Bitfinex": {"place_order": [1, 10], "cancel_order": [1, 10], "inspect_order": [1, 5]},
+    },
+    "RATE_LIMIT_DRAIN_TIMEOUT": 10,  # 任务退出前等待排队中请求推送的最长时间(秒)
 
     "REDIS_MASTER_COMMAND": "eaas_master_command",  # 控制master执行任务
     "REDIS_MASTER_COMMAND_RESP": "eaas_master_command_response",  # master控制命令返回信息
@@ -31,6 +78,8 @@ CONFIG_GLOBAL = {
     "BALANCE_HANDLER": "balance.py",
     "ORDER_HANDLER": "order_control.py",
     "MASTER_HANDLER": "master.py",
+    "RELAY_HANDLER": "relay.py",
+    "ZYGOTE_HANDLER": "zygote.py",
 
     # "REDIS_UI": ["172.31.228.82", 55556, "YjFfcxyfUfwk1CZf", 0],  # eaas1.0 test
     # "REDIS_UI": ["172.31.228.82", 55554, "k2iENg2cyjzP#s8y", 0],  # eaas2.0 test
@@ -119,6 +119,16 @@ class SpreadTradeExecutionAction(Enum):
     BALANCE = "balance"
 
 
+class JobPriority(Enum):
+    # on_timer中定时任务的执行顺序, 越小越先执行
+    TASK = 0
+    INSPECT = 10
+    MONITOR = 20
+    STATUS = 30
+    STRATEGY = 40
+    PERSIST = 50
+
+
 class OrderType(Enum):
     LIMIT = "limit"
     MARKET = "market"
@@ -162,6 +172,7 @@ class MasterCommand(Enum):
     GET_BALANCE = 'get_balance'
     DOWNLOAD = 'download'
     INSPECT = 'inspect'
+    ORDERBOOK = 'orderbook'
 
 
 class FeedSubscriptionAction(Enum):
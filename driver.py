@@ -1,17 +1,29 @@
 # encoding: utf-8
 import asyncio
-import json
+import contextvars
+import functools
 import signal
 import os
 import platform
 import sys
+import time
+from collections import deque
 from datetime import datetime
 
+from aredis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+
 from config.config import *
 from config.enums import *
+from util import codec
 from util.alioss import alioss
 from util.aredis import RedisHandler
-from util.logger import logger
+from util.book_store import book_store
+from util.logger import EaasLog, logger
+from util.market_message import MarketMessage
+from util.market_relay import RelayClient
+from util.rate_limiter import SharedRateLimiter
+from util.records import OrderRequest, encode_record
+from util.task_status import DELTA
 from util.util import get_ip, get_pid, get_git_msg
 from strategy.strategy_master import StrategyMaster
 
@@ -70,40 +82,103 @@ task_mock = {
 }
 
 
-class Driver:
-    def __init__(self):
-        self.task = {}
-        self.config = CONFIG_GLOBAL
-        self.r_ui, self.p_ui = RedisHandler().connect(CONFIG_GLOBAL['REDIS_UI'])
-        self.r_pdt, self.p_pdt = RedisHandler().connect(CONFIG_GLOBAL['REDIS_PDT'])
-        self.r_alarm, self.p_alarm = RedisHandler().connect(CONFIG_GLOBAL['REDIS_ALARM'])
+
+
+class TaskRunner:
+    """
+    one task hosted by Driver: strategy_master with its own log, request queue and timer;
+    every callback of the task runs in the context of the task, so logger writes to the log file of the task
+    """
+
+    def __init__(self, driver, task):
+        self.driver = driver
+        self.loop = driver.loop
+        self.task = task
+        self.task_id = task['task_id']
+        self.log = EaasLog()
+        self.context = contextvars.Context()  # logger.current() of this context is self.log
+        self.context.run(logger.bind, self.log)
         self.strategy_master = None  # strategy_master instance
-        self.redis_monitor = ''  # used to record latest push info to ui
-        self.execute_time = datetime.now()  # algo on_timer invoke time, init set to now()
-        # 注册程序关闭事件
-        for sig in [signal.SIGINT, signal.SIGTERM]:
-            signal.signal(sig, self.signal_handler)
+        prefix = "test_" if task.get("test_mode") else ""
+        self.redis_monitor = f'{prefix}{CONFIG_GLOBAL["REDIS_STATUS_MONITOR"]}'  # used to record latest push info to ui
+        self.redis_status_delta = f'{prefix}{CONFIG_GLOBAL["REDIS_STATUS_DELTA"]}'  # hash of status delta since latest snapshot
+        self.redis_task_definition = f'{prefix}{CONFIG_GLOBAL["REDIS_TASK_DEFINITION"]}'  # hash of task definition
+        self.task_definition = None  # task definition written to redis_task_definition
+        self.status_delta_time = 0  # last time of writing status delta to redis_status_delta
+        self.request_event = asyncio.Event()  # set when strategy_master has requests to push
+        self.timer_handle = None  # handle of the on_timer callback scheduled by loop.call_later
+        self.finished = False  # set by Exit request
+        self.deferred = {}  # (exchange|account, action) -> deque of requests waiting for tokens
+        self.deferred_handle = None  # handle of loop.call_later which wakes up request_process for deferred requests
+        self.rate_limit_stats = {'deferred': 0, 'max_queue': 0}
+        self.filling = False  # inspect tokens of order_tracker are being taken from the shared rate limiter
+        self.stats_report_time = time.time()  # last time of writing rate limit stats to log
 
-        if platform.system() == "Linux":
-            signal.signal(signal.SIGHUP, self.signal_handler)
+    def init(self):
+        """
+        init log and strategy_master of task, run in the context of task
+        """
+        # 接收到task之后初始化阿里云OSS
+        local_debug = False
+        if 'local_debug' in self.task and self.task['local_debug']:
+            local_debug = True
 
-    def signal_handler(self, signum, frame):
+        alioss.init(local_debug)
+        try:
+            log_name = f'{"TEST_" if self.task["test_mode"] else "EAAS_"}{self.task_id}.txt'
+            logger.init(log_name, local_debug)
+            logger.debug("====================START LINE====================")
+            logger.debug(f'IP: {get_ip()} PID: {get_pid()} GIT: {get_git_msg()}')
+
+            # 拿到无状态的任务时, 开始初始化策略
+            self.strategy_master = StrategyMaster()
+            self.strategy_master.on_init(CONFIG_GLOBAL, self.task)
+        except Exception as e:
+            logger.error(e)
+            sentry.captureException()
+            self.strategy_master.error_handler(TaskStatus.ERROR.value, '程序初始化意外终止')
+        finally:
+            logger.flush()
+
+    async def serve(self):
         """
-        algo exit when receive abnormal signal of linux
-        :param signum: type: int
-        :param frame: not used
+        event driven loop of an initialized strategy_master until the task exits:
+        request_process wakes up on send_request, on_timer is scheduled by loop.call_later at the next due job,
+        redis messages are dispatched by Driver
         """
-        exit_msg = f'Received abort signal({signum}) and exit success'
-        logger.error(exit_msg)
-        logger.flush()
-        if self.strategy_master is not None:
-            self.strategy_master.error_handler(TaskStatus.ERROR.value, '程序意外终止 ' + exit_msg)
-        else:
-            sys.exit(0)
+        self.strategy_master.request_notify = self.request_event.set
+        self.request_event.set()  # on_init阶段已经产生的request
+        self.timer_handle = self.loop.call_later(self.timer_delay(), self.on_timer, context=self.context)
+        try:
+            await self.request_process()
+        finally:
+            await self.close()
+
+    async def close(self):
+        """
+        release resources of finished task, the process keeps serving other tasks
+        """
+        if self.timer_handle is not None:
+            self.timer_handle.cancel()
+        if self.deferred_handle is not None:
+            self.deferred_handle.cancel()
+        await self.driver.remove_task(self)
+        # 同步写出剩余日志, 放到线程中执行, 不阻塞其他task
+        await self.loop.run_in_executor(None, self.log.close)
+
+    def handle(self, handler, message):
+        """
+        call redis message handler of strategy_master, an exception only affects this task
+        """
+        try:
+            handler(message)
+        except Exception as e:
+            logger.error(e)
+            sentry.captureException()
 
-    async def process_request(self, req):
+    async def process_request(self, req, pipes):
         """
-        request handle
+        request handle, publish commands are staged into per-connection pipelines and sent by flush_pipelines
         :param req:{
            rtype: request type, in Subscribe、Alarm、Status、Exit、Publish(default)
            channel:　pdt/ui, use for diff redis
@@ -112,106 +187,651 @@ class Driver:
               body: redis publish data, must be str format(json.dumps(body)) in python
            }
         }
+        :param pipes: pipelines of current batch, {PublishChannel: pipeline}
         """
         rtype = req['rtype']
         channel = req['channel']
         keyword, body = req['request']
-        logger.file(f'ProcessRequest => rtype: {rtype} channel: {channel} key: {keyword} body: {body}')
+        logger.file('ProcessRequest => rtype:', rtype, 'channel:', channel, 'key:', keyword, 'body:', body)
         if rtype == 'Subscribe':
-            # 策略初始化结束后开始执行redis订阅
-            await self.p_pdt.subscribe(**body)
-            await self.p_ui.subscribe(**{CONFIG_GLOBAL['REDIS_TASK_COMMAND']: self.strategy_master.on_command})
+            # 订阅前先把已经缓存的request推送出去
+            await self.driver.flush_pipelines(pipes)
+            # 策略初始化结束后开始执行redis订阅, 订阅失败时任务无法收到行情和命令, 直接以错误结束
+            try:
+                await self.driver.subscribe(self, body, {CONFIG_GLOBAL['REDIS_TASK_COMMAND']: self.strategy_master.on_command})
+            except Exception as e:
+                logger.error('Subscribe failed:', e)
+                sentry.captureException()
+                self.strategy_master.error_handler(TaskStatus.ERROR.value, f'redis订阅失败: {e}')
             return
 
         if rtype == 'Status':
-            if body['status'] == TaskStatus.ERROR.value:
-                await self.r_ui.publish(CONFIG_GLOBAL['REDIS_NOTIFICATION'], json.dumps({
-                    'type': body['status'],
-                    'message': body["name"],
-                    'description': f'{datetime.now().strftime("%Y-%m-%d %H:%M:%S")} {body["status_msg"]}'
-                }))
-            await self.r_ui.rpush(CONFIG_GLOBAL['REDIS_TASK_STATUS'], json.dumps(body))
-            body['task'] = self.strategy_master.task
-            await self.r_ui.hset(self.redis_monitor, self.task["task_id"], json.dumps(body))
+            await self.process_status(body, pipes)
             return
 
         if not isinstance(body, str):
-            body = json.dumps(body)
+            body = codec.dumps(body, default=encode_record)
 
         if rtype == 'Alarm':
             # Alarm使用了不同的redis
-            await self.r_alarm.publish(keyword, body)
+            pipe = await self.driver.get_pipeline(pipes, PublishChannel.ALARM.value)
+            await pipe.publish(keyword, body)
             return
         if rtype == 'Exit':
-            logger.flush()
-            sys.exit(0)
+            # 退出前保证之前的request都已经推送, 包括因为限频排队的request
+            await self.drain_deferred(pipes)
+            await self.driver.flush_pipelines(pipes)
+            self.finished = True
+            return
 
-        if channel == PublishChannel.PDT.value:
-            await self.r_pdt.publish(keyword, body)
-        elif channel == PublishChannel.UI.value:
-            await self.r_ui.publish(keyword, body)
+        if channel in [PublishChannel.PDT.value, PublishChannel.UI.value]:
+            pipe = await self.driver.get_pipeline(pipes, channel)
+            await pipe.publish(keyword, body)
 
-    async def main_process(self):
+    async def process_status(self, body, pipes):
         """
-        main process, listen data from pdt/ui, invoke on_timer of algo
+        status of task is snapshot or delta, see util.task_status;
+        snapshot replaces the monitor hash, delta is kept in a separate hash and merged by the reader,
+        task definition is written only when it changes
+        :param body: status message built by StrategyMaster.send_status
+        :param pipes: pipelines of current batch
         """
-        # 在任务队列里抢单, 抢到之后开始执行
-        task = await self.r_ui.blpop(CONFIG_GLOBAL['REDIS_ADD_TASK_QUEUE'])
-        self.task = json.loads(task[1])
-        # self.task = task_mock
-        self.redis_monitor = f'{"test_" if self.task["test_mode"] else ""}{CONFIG_GLOBAL["REDIS_STATUS_MONITOR"]}'
-        # 接收到task之后初始化阿里云OSS
-        local_debug = False
-        if 'local_debug' in self.task and self.task['local_debug']:
-            local_debug = True
+        pipe = await self.driver.get_pipeline(pipes, PublishChannel.UI.value)
+        task_id = self.task_id
+        message = codec.dumps(body, default=encode_record)
+        await pipe.rpush(CONFIG_GLOBAL['REDIS_TASK_STATUS'], message)
+        # 所有task共用一个列表, 只保留最近的记录
+        await pipe.ltrim(CONFIG_GLOBAL['REDIS_TASK_STATUS'], -CONFIG_GLOBAL['REDIS_TASK_STATUS_MAX_LEN'], -1)
+        if body['type'] == DELTA:
+            # monitor只在UI丢失状态时使用(balance.py INSPECT), delta按间隔写入
+            if time.monotonic() - self.status_delta_time >= CONFIG_GLOBAL['STATUS_DELTA_INTERVAL']:
+                self.status_delta_time = time.monotonic()
+                await pipe.hset(self.redis_status_delta, task_id, message)
+            return
 
-        alioss.init(local_debug)
+        if body['status'] == TaskStatus.ERROR.value:
+            await pipe.publish(CONFIG_GLOBAL['REDIS_NOTIFICATION'], codec.dumps({
+                'type': body['status'],
+                'message': body["name"],
+                'description': f'{datetime.now().strftime("%Y-%m-%d %H:%M:%S")} {body["status_msg"]}'
+            }))
+        await pipe.hset(self.redis_monitor, task_id, message)
+        await pipe.hdel(self.redis_status_delta, task_id)
+        self.status_delta_time = time.monotonic()
+        # RESUME会修改task, 所以在每次snapshot时比较一次
+        task_definition = codec.dumps(self.strategy_master.task, default=encode_record)
+        if task_definition != self.task_definition:
+            self.task_definition = task_definition
+            await pipe.hset(self.redis_task_definition, task_id, task_definition)
+
+    @staticmethod
+    def rate_limit_key(req):
+        """
+        :return: (exchange|account, action) of send/cancel request, None for other requests
+        """
+        if req['rtype'] != 'PDT' or req['channel'] != PublishChannel.PDT.value:
+            return None
+        body = req['request'][1]
+        # inspect的令牌在order_tracker选择订单时已经从共享令牌桶取得, 不再排队
+        if not isinstance(body, OrderRequest) or body['action'] == RequestActions.INSPECT_ORDER.value:
+            return None
+        metadata = body['metadata']
+        return f"{metadata['exchange']}|{metadata['account_id']}", body['action']
+
+    async def admit_requests(self, requests):
+        """
+        take tokens of shared rate limiter for order requests, requests over the limit are queued, not dropped
+        :param requests: new requests of strategy_master
+        :return: (requests to push now, seconds until the next deferred request may be pushed or None)
+        """
+        current = set()
+        for req in requests:
+            key = self.rate_limit_key(req)
+            if key is not None:
+                # 排在已经排队的request之后, 同一个key按顺序推送
+                self.deferred.setdefault(key, deque()).append(req)
+                current.add(id(req))
+
+        released = []
+        wait = None
+        for key, queue in list(self.deferred.items()):
+            granted, delay = await self.driver.rate_limiter.acquire(*key, len(queue))
+            for _ in range(granted):
+                released.append(queue.popleft())
+            if not queue:
+                del self.deferred[key]
+                continue
+            wait = delay if wait is None else min(wait, delay)
+            self.rate_limit_stats['max_queue'] = max(self.rate_limit_stats['max_queue'], len(queue))
+
+        self.rate_limit_stats['deferred'] += sum(1 for req in requests if id(req) in current) - \
+            sum(1 for req in released if id(req) in current)
+        released_ids = {id(req) for req in released}
+        # 之前排队的request先推送, 本批次的request保持原来的顺序
+        admitted = [req for req in released if id(req) not in current]
+        admitted += [req for req in requests if id(req) not in current or id(req) in released_ids]
+        return admitted, wait
+
+    def wake_up_deferred(self, wait):
+        """
+        schedule request_process to push deferred requests after wait seconds
+        """
+        if self.deferred_handle is not None:
+            self.deferred_handle.cancel()
+        self.deferred_handle = self.loop.call_later(wait, self.request_event.set)
+
+    async def drain_deferred(self, pipes):
+        """
+        push deferred requests before exit, wait for tokens at most RATE_LIMIT_DRAIN_TIMEOUT seconds
+        """
+        deadline = time.monotonic() + CONFIG_GLOBAL['RATE_LIMIT_DRAIN_TIMEOUT']
+        while self.deferred:
+            admitted, wait = await self.admit_requests([])
+            for req in admitted:
+                await self.process_request(req, pipes)
+            if wait is None:
+                break
+            if time.monotonic() + wait > deadline:
+                dropped = sum(len(queue) for queue in self.deferred.values())
+                logger.error(f'{dropped} requests are not pushed because of rate limit before exit')
+                break
+            await self.driver.flush_pipelines(pipes)
+            await asyncio.sleep(wait)
+
+    def report_rate_limit_stats(self):
+        """
+        write rate limit counters to log file, max values are reset after each report
+        """
+        stats = self.rate_limit_stats
+        if stats['deferred']:
+            logger.file(f'RateLimitStats => deferred: {stats["deferred"]} '
+                        f'queued: {sum(len(queue) for queue in self.deferred.values())} '
+                        f'max_queue: {stats["max_queue"]}')
+            stats['max_queue'] = 0
+
+    async def request_process(self):
+        """
+        push requests of strategy_master in order, wait on request_event when queue is empty
+        """
+        while not self.finished:
+            await self.request_event.wait()
+            self.request_event.clear()
+            # 先取出再清空, 推送过程中新产生的request会在下一轮处理
+            requests = self.strategy_master.get_request()
+            self.strategy_master.clear_request()
+            # 超出限频的发单/撤单/查询请求排队, 等到有令牌时再唤醒推送
+            requests, wait = await self.admit_requests(requests)
+            if wait is not None:
+                self.wake_up_deferred(wait)
+            pipes = {}
+            for req in requests:
+                try:
+                    await self.process_request(req, pipes)
+                except Exception as e:
+                    logger.error(e)
+                    sentry.captureException()
+                if self.finished:
+                    break
+            # 一批request按redis连接合并成pipeline, 每个连接一次round-trip
+            await self.driver.flush_pipelines(pipes)
+
+    def on_timer(self):
+        """
+        invoke on_timer of algo when its next job is due, scheduled by loop.call_later
+        """
         try:
-            log_name = f'{"TEST_" if self.task["test_mode"] else "EAAS_"}{self.task["task_id"]}.txt'
-            logger.init(log_name, local_debug)
-            logger.debug("====================START LINE====================")
-            logger.debug(f'IP: {get_ip()} PID: {get_pid()} GIT: {get_git_msg()}')
+            self.strategy_master.on_timer()
+            tracker = self.strategy_master.order_tracker
+            if tracker is not None and tracker.tokens.wanted and not self.filling:
+                self.filling = True
+                asyncio.ensure_future(self.fill_inspect_tokens())
+            if time.time() - self.stats_report_time >= CONFIG_GLOBAL['PIPELINE_STATS_INTERVAL']:
+                self.stats_report_time = time.time()
+                self.report_rate_limit_stats()
+            logger.flush()
+        except Exception as e:
+            logger.error(e)
+            logger.flush()
+            sentry.captureException()
+        finally:
+            if not self.finished:
+                self.timer_handle = self.loop.call_later(self.timer_delay(), self.on_timer, context=self.context)
 
-            # 拿到无状态的任务时, 开始初始化策略
-            self.strategy_master = StrategyMaster()
-            self.strategy_master.on_init(CONFIG_GLOBAL, self.task)
+    async def fill_inspect_tokens(self):
+        """
+        take tokens from the shared rate limiter for the inspections order_tracker had to defer,
+        then select orders again so that the tokens are spent in priority order
+        """
+        try:
+            if await self.strategy_master.order_tracker.tokens.fill(self.driver.rate_limiter) and not self.finished:
+                self.strategy_master.inspect_orders()
         except Exception as e:
             logger.error(e)
             sentry.captureException()
-            self.strategy_master.error_handler(TaskStatus.ERROR.value, '程序初始化意外终止')
         finally:
-            logger.flush()
+            self.filling = False
+
+    def timer_delay(self):
+        """
+        seconds until the earliest job of strategy_master scheduler, at most TIME_INTERVAL
+        so that jobs registered later are not delayed
+        """
+        next_due = self.strategy_master.scheduler.next_due()
+        if next_due is None:
+            return CONFIG_GLOBAL["TIME_INTERVAL"]
+        return min(CONFIG_GLOBAL["TIME_INTERVAL"], max(0.0, next_due - time.monotonic()))
+
+
+class Driver:
+    """
+    one process hosts up to DRIVER_MAX_TASKS tasks on one event loop;
+    redis connections and pubsub are shared, messages of a channel are dispatched to every task subscribing it
+    """
+
+    def __init__(self):
+        self.config = CONFIG_GLOBAL
+        self.loop = asyncio.get_event_loop()
+        # 注册程序关闭事件, 由loop回调处理, 保证退出请求能及时唤醒推送协程
+        for sig in [signal.SIGINT, signal.SIGTERM]:
+            self.loop.add_signal_handler(sig, self.signal_handler, sig, None)
+
+        if platform.system() == "Linux":
+            self.loop.add_signal_handler(signal.SIGHUP, self.signal_handler, signal.SIGHUP, None)
+
+        self.r_ui, self.p_ui = RedisHandler().connect(CONFIG_GLOBAL['REDIS_UI'])
+        self.r_pdt, self.p_pdt = RedisHandler().connect(CONFIG_GLOBAL['REDIS_PDT'])
+        self.r_alarm, self.p_alarm = RedisHandler().connect(CONFIG_GLOBAL['REDIS_ALARM'])
+        self.max_tasks = CONFIG_GLOBAL['DRIVER_MAX_TASKS']
+        self.runners = {}  # task_id -> TaskRunner
+        self.serving = {}  # task_id -> asyncio task of TaskRunner.serve
+        self.capacity = asyncio.Semaphore(self.max_tasks)  # 达到上限后不再从任务队列抢任务
+        self.intake = None  # asyncio task of take_tasks
+        self.stopping = False  # set after abort signal, no more tasks are taken
+        self.driver_log = False  # whether the process log is initialized
+        # 每个订阅频道的handler: channel -> {task_id: (runner, handler)}, 同一个频道只订阅一次
+        self.handlers = {PublishChannel.PDT.value: {}, PublishChannel.UI.value: {}}
+        self.pubsubs = {PublishChannel.PDT.value: self.p_pdt, PublishChannel.UI.value: self.p_ui}
+        self.subscribed = asyncio.Event()  # set after the first redis subscription finished
+        self.stats_handle = None  # handle of report_stats scheduled by loop.call_later
+        self.redis_conns = {
+            PublishChannel.PDT.value: self.r_pdt,
+            PublishChannel.UI.value: self.r_ui,
+            PublishChannel.ALARM.value: self.r_alarm
+        }
+        # pipeline计数: 推送次数, 命令数, 最大batch, 推送耗时(ms)
+        self.pipeline_stats = {channel: {
+            'flush_count': 0, 'command_count': 0, 'max_batch': 0, 'total_latency': 0, 'max_latency': 0
+        } for channel in self.redis_conns}
+        # 发单/撤单/查询请求按 exchange|account 和 action 限频, 令牌桶在pdt redis中, 所有driver进程共用
+        self.rate_limiter = SharedRateLimiter(self.r_pdt, CONFIG_GLOBAL['PDT_RATE_LIMIT'],
+                                              CONFIG_GLOBAL['REDIS_RATE_LIMIT'])
+        # 行情频道通过本机relay接收, relay不可用时直接订阅pdt redis
+        self.relay = RelayClient(CONFIG_GLOBAL['MARKET_RELAY_SOCKET']) if CONFIG_GLOBAL['MARKET_RELAY_ENABLED'] else None
+        self.relay_active = False  # whether market channels are subscribed on relay
+        self.market_prefix = f'{IntercomScope.MARKET.value}:'
+        self.relay_stats = {}  # channel -> [count, total latency(ms), max latency(ms)] from relay to driver
+        # 收到的orderbook写入本机共享内存, 同一个symbol只有一个进程写入
+        self.book_store = book_store if CONFIG_GLOBAL['BOOK_STORE_ENABLED'] else None
+
+    def signal_handler(self, signum, frame):
+        """
+        algo exit when receive abnormal signal of linux, every running task ends with error
+        :param signum: type: int
+        :param frame: not used
+        """
+        exit_msg = f'Received abort signal({signum}) and exit success'
+        logger.error(exit_msg)
+        logger.flush()
+        if not self.runners:
+            logger.close()
+            sys.exit(0)
+        self.stopping = True
+        if self.intake is not None:
+            self.intake.cancel()
+        for runner in list(self.runners.values()):
+            if runner.strategy_master is not None:
+                runner.context.run(runner.strategy_master.error_handler, TaskStatus.ERROR.value, '程序意外终止 ' + exit_msg)
+
+    def init_driver_log(self, local_debug):
+        """
+        log of the process itself: pipeline stats and errors outside of tasks
+        """
+        if self.driver_log:
+            return
+        self.driver_log = True
+        alioss.init(local_debug)
+        logger.init(f'EAAS_DRIVER_{get_ip()}_{get_pid()}.txt', local_debug)
+        logger.debug(f'IP: {get_ip()} PID: {get_pid()} GIT: {get_git_msg()} MAX_TASKS: {self.max_tasks}')
+
+    async def take_tasks(self):
+        """
+        take tasks from task queue while the number of running tasks is below DRIVER_MAX_TASKS
+        """
+        while not self.stopping:
+            await self.capacity.acquire()
+            # 在任务队列里抢单, 抢到之后开始执行
+            task = await self.r_ui.blpop(CONFIG_GLOBAL['REDIS_ADD_TASK_QUEUE'])
+            try:
+                task = codec.loads(task[1])
+                # task = task_mock
+                self.init_driver_log(bool(task.get('local_debug')))
+                self.start_task(task)
+            except Exception as e:
+                # 一个task启动失败不影响进程中的其他task
+                logger.error('Start task failed:', e)
+                sentry.captureException()
+                self.capacity.release()
+
+    def start_task(self, task):
+        """
+        init strategy_master of task in its own context and start serving it
+        """
+        runner = TaskRunner(self, task)
+        runner.context.run(runner.init)
+        self.runners[runner.task_id] = runner
+        logger.info(f'Task started => {runner.task_id} running: {len(self.runners)}')
+        # 新建的asyncio task复制runner的context, 其中的日志写入task自己的日志
+        self.serving[runner.task_id] = runner.context.run(self.loop.create_task, runner.serve())
+        return runner
+
+    async def remove_task(self, runner):
+        """
+        unsubscribe channels no other task uses and release the slot of task
+        """
+        self.runners.pop(runner.task_id, None)
+        self.serving.pop(runner.task_id, None)
+        self.capacity.release()
+        for channel_type, table in self.handlers.items():
+            unused = []
+            for channel in list(table):
+                table[channel].pop(runner.task_id, None)
+                if not table[channel]:
+                    del table[channel]
+                    unused.append(channel)
+            if channel_type == PublishChannel.PDT.value:
+                self.release_books(unused)
+            if unused:
+                try:
+                    if channel_type == PublishChannel.PDT.value and self.relay_active:
+                        market = [channel for channel in unused if channel.startswith(self.market_prefix)]
+                        unused = [channel for channel in unused if not channel.startswith(self.market_prefix)]
+                        if market:
+                            await self.relay.unsubscribe(market)
+                    if unused:
+                        await self.pubsubs[channel_type].unsubscribe(*unused)
+                except Exception as e:
+                    logger.error('Unsubscribe failed:', e)
+                    sentry.captureException()
+        logger.info(f'Task finished => {runner.task_id} running: {len(self.runners)}')
+
+    async def subscribe(self, runner, pdt_handlers, ui_handlers):
+        """
+        register handlers of a task, channels which are not subscribed yet are subscribed with dispatch
+        :param pdt_handlers: {channel: handler} on pdt redis
+        :param ui_handlers: {channel: handler} on ui redis
+        """
+        for channel_type, handlers in [(PublishChannel.PDT.value, pdt_handlers), (PublishChannel.UI.value, ui_handlers)]:
+            table = self.handlers[channel_type]
+            new = [channel for channel in handlers if channel not in table]
+            for channel, handler in handlers.items():
+                table.setdefault(channel, {})[runner.task_id] = (runner, handler)
+            if channel_type == PublishChannel.PDT.value:
+                market = [channel for channel in new if channel.startswith(self.market_prefix)]
+                new = [channel for channel in new if not channel.startswith(self.market_prefix)]
+                if market:
+                    await self.subscribe_market(market)
+            if new:
+                dispatch = functools.partial(self.dispatch, table)
+                await self.pubsubs[channel_type].subscribe(**{channel: dispatch for channel in new})
+        self.subscribed.set()
+
+    async def subscribe_market(self, channels):
+        """
+        subscribe market channels on relay, or on pdt redis when relay is not available
+        """
+        if self.relay_active:
+            try:
+                await self.relay.subscribe(channels)
+                return
+            except Exception as e:
+                # relay_process发现连接断开后会把所有行情频道切回redis
+                logger.error('Relay subscribe failed:', e)
+        await self.p_pdt.subscribe(**{channel: self.dispatch_market for channel in channels})
+
+    async def move_market_channels(self, to_relay):
+        """
+        move subscriptions of all market channels between relay and pdt redis
+        """
+        channels = [channel for channel in self.handlers[PublishChannel.PDT.value] if channel.startswith(self.market_prefix)]
+        if to_relay:
+            # 先在relay订阅再取消redis订阅, 切换期间的重复行情不影响策略
+            await self.relay.subscribe(channels)
+            self.relay_active = True
+            if channels:
+                await self.p_pdt.unsubscribe(*channels)
+        else:
+            self.relay_active = False
+            if channels:
+                await self.p_pdt.subscribe(**{channel: self.dispatch_market for channel in channels})
+
+    async def relay_process(self):
+        """
+        receive market data from relay of this host, reconnect with backoff after relay exits
+        """
+        retry_delay = CONFIG_GLOBAL['REDIS_RETRY_MIN_DELAY']
+        while True:
+            try:
+                await self.relay.connect()
+                await self.move_market_channels(to_relay=True)
+                logger.info('Market relay connected')
+                while True:
+                    channel, data, relay_time = await self.relay.read()
+                    # 收到行情之后才认为relay恢复, 连接后立即断开时继续退避
+                    retry_delay = CONFIG_GLOBAL['REDIS_RETRY_MIN_DELAY']
+                    self.on_relay_message(channel, data, relay_time)
+            except Exception as e:
+                # relay没有启动或者退出时直接订阅redis, 同一次故障只记录一次
+                if self.relay_active or retry_delay == CONFIG_GLOBAL['REDIS_RETRY_MIN_DELAY']:
+                    logger.warning('Market relay unavailable:', repr(e))
+                self.relay.close()
+                if self.relay_active:
+                    try:
+                        await self.move_market_channels(to_relay=False)
+                    except Exception as e:
+                        logger.error('Resubscribe market data failed:', e)
+                        sentry.captureException()
+            await asyncio.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, CONFIG_GLOBAL['REDIS_RETRY_MAX_DELAY'])
+
+    def on_relay_message(self, channel, data, relay_time):
+        latency = (time.time() - relay_time) * 1000
+        stats = self.relay_stats.get(channel)
+        if stats is None:
+            stats = self.relay_stats[channel] = [0, 0, 0]
+        stats[0] += 1
+        stats[1] += latency
+        stats[2] = max(stats[2], latency)
+        self.dispatch_market({'channel': channel, 'data': data})
+
+    def dispatch_market(self, message):
+        """
+        market data is parsed once into MarketMessage and shared by all tasks, depth is decoded at most once;
+        orderbook is also written to the shared book store of this host
+        """
+        market_data = message['market'] = MarketMessage(message['data'])
+        if self.book_store is not None and market_data.data_type == MarketDataType.ORDERBOOK.value:
+            self.book_store.write_message(market_data)
+        self.dispatch(self.handlers[PublishChannel.PDT.value], message)
+
+    def release_books(self, channels):
+        """
+        stop writing shared orderbooks of market channels no task of this process subscribes
+        """
+        if self.book_store is None:
+            return
+        for channel in channels:
+            if not channel.startswith(self.market_prefix):
+                continue
+            fields = channel[len(self.market_prefix):].split('|')
+            if len(fields) > 3 and fields[3] == MarketDataType.ORDERBOOK.value:
+                self.book_store.release(*fields[:3])
+
+    @staticmethod
+    def dispatch(table, message):
+        """
+        fan out a redis message to all tasks subscribing its channel, each handler runs in the context of its task
+        """
+        for runner, handler in list(table.get(message['channel'], {}).values()):
+            runner.context.run(runner.handle, handler, message)
+
+    async def get_pipeline(self, pipes, channel):
+        """
+        get pipeline of redis connection in current batch, create it if not exist
+        :param pipes: pipelines of current batch
+        :param channel: PublishChannel value
+        :return: aredis pipeline
+        """
+        if channel not in pipes:
+            pipes[channel] = await self.redis_conns[channel].pipeline(transaction=False)
+        return pipes[channel]
+
+    async def flush_pipelines(self, pipes):
+        """
+        send all pipelines of current batch, one round-trip per connection;
+        commands in the same pipeline keep their order, different connections are sent concurrently
+        :param pipes: pipelines of current batch, cleared after flush
+        """
+        if not pipes:
+            return
+        channels = list(pipes.keys())
+        results = await asyncio.gather(*[self.flush_pipeline(channel, pipes[channel]) for channel in channels],
+                                       return_exceptions=True)
+        pipes.clear()
+        for channel, result in zip(channels, results):
+            if isinstance(result, Exception):
+                logger.error(f'Pipeline {channel} flush failed:', result)
+                sentry.captureException(exc_info=(type(result), result, result.__traceback__))
+
+
+    async def flush_pipeline(self, channel, pipe):
+        """
+        execute one pipeline and record batch size and flush latency
+        :param channel: PublishChannel value
+        :param pipe: aredis pipeline
+        """
+        batch_size = len(pipe.command_stack)
+        if batch_size == 0:
+            return
+        start = time.perf_counter()
+        try:
+            await pipe.execute()
+        finally:
+            latency = (time.perf_counter() - start) * 1000
+            stats = self.pipeline_stats[channel]
+            stats['flush_count'] += 1
+            stats['command_count'] += batch_size
+            stats['max_batch'] = max(stats['max_batch'], batch_size)
+            stats['total_latency'] += latency
+            stats['max_latency'] = max(stats['max_latency'], latency)
 
+    async def listen(self, pubsub):
+        """
+        listen redis channels, message is dispatched to the tasks subscribing its channel by dispatch
+        :param pubsub: aredis pubsub instance
+        """
+        await self.subscribed.wait()
+        retry_delay = CONFIG_GLOBAL['REDIS_RETRY_MIN_DELAY']
         while True:
+            if not pubsub.subscribed:
+                # 没有订阅任何频道时listen()会直接返回, 需要让出loop避免空转
+                await asyncio.sleep(CONFIG_GLOBAL['REDIS_RETRY_MIN_DELAY'])
+                continue
             try:
-                # 收集策略发出的request, 并且顺序推送至PDT
-                requests = self.strategy_master.get_request()
-                if len(requests) > 0:
-                    for req in requests:
-                        await self.process_request(req)
-                    self.strategy_master.clear_request()
-                # 异步监听redis频道, 往对应的策略handler中推送
-                await self.p_pdt.get_message(timeout=0.1)
-                await self.p_ui.get_message(timeout=0.0001)
-                await asyncio.sleep(0.001)
-
-                # 策略定时执行函数, 默认3秒一次
-                cur_time = datetime.now()
-                if (cur_time - self.execute_time).total_seconds() > CONFIG_GLOBAL["TIME_INTERVAL"]:
-                    self.execute_time = cur_time
-                    self.strategy_master.on_timer()
-                    logger.flush()
+                # 阻塞等待直到有消息到达, 不再按1ms轮询
+                await pubsub.listen()
+            except (RedisConnectionError, RedisTimeoutError) as e:
+                # redis断开时退避重试, 同一次故障只记录一次
+                if retry_delay == CONFIG_GLOBAL['REDIS_RETRY_MIN_DELAY']:
+                    logger.error('Redis listen error:', e)
+                    sentry.captureException()
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, CONFIG_GLOBAL['REDIS_RETRY_MAX_DELAY'])
             except Exception as e:
+                # handler内部异常, 不影响后续消息
                 logger.error(e)
-                logger.flush()
                 sentry.captureException()
+            else:
+                if retry_delay != CONFIG_GLOBAL['REDIS_RETRY_MIN_DELAY']:
+                    logger.info('Redis listen recovered')
+                    retry_delay = CONFIG_GLOBAL['REDIS_RETRY_MIN_DELAY']
+
+    def report_pipeline_stats(self):
+        """
+        write pipeline counters to log file, max values are reset after each report
+        """
+        for channel, stats in self.pipeline_stats.items():
+            if stats['flush_count'] == 0:
+                continue
+            logger.file(f'PipelineStats => {channel} flush: {stats["flush_count"]} '
+                        f'commands: {stats["command_count"]} '
+                        f'avg_batch: {stats["command_count"] / stats["flush_count"]:.2f} '
+                        f'max_batch: {stats["max_batch"]} '
+                        f'avg_latency: {stats["total_latency"] / stats["flush_count"]:.3f}ms '
+                        f'max_latency: {stats["max_latency"]:.3f}ms')
+            stats['max_batch'] = 0
+            stats['max_latency'] = 0
+
+    def report_relay_stats(self):
+        """
+        latency from relay to this process of each market channel, reset after each report
+        """
+        for channel, stats in self.relay_stats.items():
+            if stats[0] == 0:
+                continue
+            logger.file(f'RelayStats => {channel} msgs: {stats[0]} '
+                        f'avg_latency: {stats[1] / stats[0]:.3f}ms max_latency: {stats[2]:.3f}ms')
+        self.relay_stats = {}
+
+    def report_stats(self):
+        """
+        write process level stats to the process log, scheduled every PIPELINE_STATS_INTERVAL
+        """
+        try:
+            logger.file(f'DriverStats => tasks: {len(self.runners)}/{self.max_tasks} '
+                        f'channels: {sum(len(table) for table in self.handlers.values())}')
+            self.report_pipeline_stats()
+            self.report_relay_stats()
+            logger.flush()
+        except Exception as e:
+            logger.error(e)
+            sentry.captureException()
+        finally:
+            self.stats_handle = self.loop.call_later(CONFIG_GLOBAL['PIPELINE_STATS_INTERVAL'], self.report_stats)
+
+    async def main_process(self):
+        """
+        main process, take tasks from task queue and listen data from pdt/ui for all tasks
+        """
+        self.stats_handle = self.loop.call_later(CONFIG_GLOBAL['PIPELINE_STATS_INTERVAL'], self.report_stats)
+        listeners = [self.loop.create_task(self.listen(self.p_pdt)), self.loop.create_task(self.listen(self.p_ui))]
+        if self.relay is not None:
+            listeners.append(self.loop.create_task(self.relay_process()))
+        self.intake = self.loop.create_task(self.take_tasks())
+        try:
+            await self.intake
+        except asyncio.CancelledError:
+            pass
+        # 收到退出信号后, 等待所有task推送完剩余request
+        await asyncio.gather(*self.serving.values(), return_exceptions=True)
+        for listener in listeners:
+            listener.cancel()
 
     def run(self):
         """
         start of eaas
         """
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(self.main_process())
+        self.loop.run_until_complete(self.main_process())
+        logger.close()
 
 
 if __name__ == '__main__':
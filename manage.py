@@ -8,19 +8,25 @@ handler_order = {
     CONFIG_GLOBAL['MASTER_HANDLER']: 1,
     CONFIG_GLOBAL['BALANCE_HANDLER']: 2,
     CONFIG_GLOBAL['ORDER_HANDLER']: 3,
-    CONFIG_GLOBAL['TASK_HANDLER']: 4
+    CONFIG_GLOBAL['RELAY_HANDLER']: 4,
+    CONFIG_GLOBAL['ZYGOTE_HANDLER']: 5,
+    CONFIG_GLOBAL['TASK_HANDLER']: 6
 }
 
 
 def ps_filter():
     eaas = []
-    for proc in psutil.process_iter(attrs=['pid', 'open_files', 'cmdline', 'connections']):
+    for proc in psutil.process_iter(attrs=['pid', 'open_files', 'cmdline', 'connections', 'name']):
         cmdline = proc.info['cmdline']
         if len(cmdline) == 3 and cmdline[0] == 'python' and cmdline[2] == '2.0':
             if CONFIG_GLOBAL['TASK_HANDLER'] in cmdline[1] or CONFIG_GLOBAL['BALANCE_HANDLER'] in cmdline[1] or \
-                    CONFIG_GLOBAL['ORDER_HANDLER'] in cmdline[1] or CONFIG_GLOBAL['MASTER_HANDLER'] in cmdline[1]:
+                    CONFIG_GLOBAL['ORDER_HANDLER'] in cmdline[1] or CONFIG_GLOBAL['MASTER_HANDLER'] in cmdline[1] or \
+                    CONFIG_GLOBAL['RELAY_HANDLER'] in cmdline[1] or CONFIG_GLOBAL['ZYGOTE_HANDLER'] in cmdline[1]:
                 if cmdline[1][0:2] == './':
                     cmdline[1] = cmdline[1][2:]
+                if proc.info['name'] == CONFIG_GLOBAL['DRIVER_PROCESS_NAME']:
+                    # zygote fork的driver命令行和zygote相同, 按driver处理
+                    cmdline[1] = CONFIG_GLOBAL['TASK_HANDLER']
                 eaas.append(proc.info)
     return sorted(eaas, key=lambda d: handler_order[d['cmdline'][1]])
 
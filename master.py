@@ -1,53 +1,201 @@
 import os
-import json
 import time
 import asyncio
+
+import psutil
+
 from config.config import *
 from config.enums import *
 from util.aredis import RedisHandler
-from subprocess import call, check_output
+from util import codec
+from util.fork_server import ZygoteClient
+
+
+class Child:
+    """
+    one supervised process slot: driver/balance/order/relay, restarted with backoff after it exits
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.process = None  # asyncio.subprocess.Process, None for process adopted from previous master
+        self.forked = False  # driver forked by zygote, its exit is reported by zygote
+        self.ps = None  # psutil.Process, used for cpu/rss statistics and watching adopted process
+        self.started = 0  # monotonic time when the process was started or adopted
+        self.restarts = 0
+        self.delay = CONFIG_GLOBAL['SUPERVISOR_RESTART_MIN_DELAY']  # 下一次重启前等待的时间, 连续快速退出时按2倍退避
+
+    @property
+    def pid(self):
+        return self.ps.pid if self.ps is not None else None
 
 
 class Master:
+    """
+    supervisor of all eaas processes on this host:
+        1. 启动时同时拉起所有driver/balance/order/relay, 已经在运行的(上一个master留下的)进程直接接管
+        2. 子进程由asyncio的child watcher在退出时回收, 不再轮询ps, 稳定运行时不fork任何进程
+           DRIVER_SPAWN_MODE为zygote时driver由zygote进程fork, 退出由zygote回收后通知master
+        3. 子进程退出后按退避时间重启, 运行超过SUPERVISOR_STABLE_TIME后退避时间复位
+        4. 定时输出每个子进程的cpu/rss
+    """
+
     def __init__(self):
-        self.process_num = 4 * os.cpu_count()
+        # 每个driver进程可以运行DRIVER_MAX_TASKS个task, 不再需要为每个task保留一个空闲进程
+        self.process_num = CONFIG_GLOBAL['DRIVER_PROCESS_NUM'] or os.cpu_count()
         self.config = CONFIG_GLOBAL
         self.r_alarm, self.p_alarm = RedisHandler().connect(CONFIG_GLOBAL['REDIS_ALARM'])
+        handlers = [CONFIG_GLOBAL['TASK_HANDLER']] * self.process_num
+        handlers += [CONFIG_GLOBAL['BALANCE_HANDLER'], CONFIG_GLOBAL['ORDER_HANDLER']]
+        if CONFIG_GLOBAL['MARKET_RELAY_ENABLED']:
+            handlers.append(CONFIG_GLOBAL['RELAY_HANDLER'])
+        self.zygote = None
+        if CONFIG_GLOBAL['DRIVER_SPAWN_MODE'] == 'zygote':
+            # driver由zygote fork, 不需要重新启动python和导入所有模块
+            self.zygote = ZygoteClient(CONFIG_GLOBAL['ZYGOTE_SOCKET'])
+            self.zygote_lock = asyncio.Lock()
+            handlers.append(CONFIG_GLOBAL['ZYGOTE_HANDLER'])
+        self.children = [Child(handler) for handler in handlers]
 
-    async def main_process(self):
-        print(f'Start EAAS2.0 master process with core number {self.process_num} \n')
+    def adopt(self):
+        """
+        take over eaas processes left by previous master, e.g. drivers still running tasks after manage.py restart
+        """
+        free = {}
+        for child in self.children:
+            free.setdefault(child.handler, []).append(child)
+        for proc in psutil.process_iter(attrs=['pid', 'cmdline', 'name']):
+            cmdline = proc.info['cmdline'] or []
+            if proc.info['pid'] == os.getpid() or len(cmdline) != 3 or cmdline[0] != 'python' or cmdline[2] != '2.0':
+                continue
+            handler = cmdline[1][2:] if cmdline[1][0:2] == './' else cmdline[1]
+            if proc.info['name'] == CONFIG_GLOBAL['DRIVER_PROCESS_NAME']:
+                # zygote fork的driver命令行和zygote相同, 通过进程名区分
+                handler = CONFIG_GLOBAL['TASK_HANDLER']
+            if free.get(handler):
+                child = free[handler].pop()
+                child.ps = proc
+                child.started = time.monotonic()
+                print(f'Adopt {handler} pid {proc.pid}')
+
+    async def spawn(self, child):
+        if self.zygote is not None and child.handler == CONFIG_GLOBAL['TASK_HANDLER']:
+            await self.connect_zygote()
+            pid = await self.zygote.fork()
+            child.forked = True
+        else:
+            # 命令行和原来保持一致, manage.py通过 python ./xxx.py 2.0 识别eaas进程
+            child.process = await asyncio.create_subprocess_exec('python', f'./{child.handler}', '2.0')
+            pid = child.process.pid
+        child.ps = psutil.Process(pid)
+        child.started = time.monotonic()
+        print(f'Start {child.handler} pid {child.pid}')
+
+    async def connect_zygote(self):
+        """
+        wait until zygote started by its own slot is listening, zygote needs about 1s to import all modules
+        """
+        async with self.zygote_lock:
+            deadline = time.monotonic() + CONFIG_GLOBAL['ZYGOTE_CONNECT_TIMEOUT']
+            while not self.zygote.connected:
+                try:
+                    await self.zygote.connect()
+                except (FileNotFoundError, ConnectionRefusedError):
+                    if time.monotonic() > deadline:
+                        raise
+                    await asyncio.sleep(0.05)
 
-        cmd_common = "ps jxf | awk '$1==1{print $0}' | grep"
-        cmd_driver_check = f"{cmd_common} '{CONFIG_GLOBAL['TASK_HANDLER']} 2.0' | wc -l"
-        cmd_balance_check = f"{cmd_common} '{CONFIG_GLOBAL['BALANCE_HANDLER']} 2.0' | wc -l"
-        cmd_order_check = f"{cmd_common} '{CONFIG_GLOBAL['ORDER_HANDLER']} 2.0' | wc -l"
-        heartbeat_count = 60
+    async def wait(self, child):
+        """
+        :return: exit code, None for adopted process which is not a child of master
+        """
+        if child.forked:
+            try:
+                return await self.zygote.wait(child.pid)
+            except ConnectionError:
+                # zygote退出后它fork的driver继续运行, 改为检查进程状态
+                child.forked = False
+        elif child.process is not None:
+            return await child.process.wait()
+        # 接管的进程不是master的子进程, 不能waitpid, 每秒检查一次是否还在运行
         while True:
-            # 保证Driver的数量
-            driver_num = int(check_output(cmd_driver_check, shell=True))
-            if driver_num < self.process_num:
-                call(f"python ./{CONFIG_GLOBAL['TASK_HANDLER']} 2.0 &", shell=True)
-
-            balance_num = int(check_output(cmd_balance_check, shell=True))
-            if balance_num < 1:
-                call(f"python ./{CONFIG_GLOBAL['BALANCE_HANDLER']} 2.0 &", shell=True)
-
-            oms_num = int(check_output(cmd_order_check, shell=True))
-            if oms_num < 1:
-                call(f"python ./{CONFIG_GLOBAL['ORDER_HANDLER']} 2.0 &", shell=True)
-
-            if heartbeat_count >= 60:
-                heartbeat_count = 0
-                alarm_msg = {
-                    "timestamp": int(time.time() * 1000),
-                    "status": "normal",
-                    "service": "SERVER_STATUS",
-                    "server": "EAAS_PROD",
-                    "type": "message"
-                }
-                await self.r_alarm.publish(IntercomScope.ED.value + ':' + IntercomChannel.SERVER_STATUS.value, json.dumps(alarm_msg))
-            heartbeat_count += 1
-            time.sleep(1)
+            try:
+                if child.ps.status() == psutil.STATUS_ZOMBIE:
+                    return None
+            except psutil.NoSuchProcess:
+                return None
+            await asyncio.sleep(1)
+
+    async def supervise(self, child):
+        while True:
+            if child.ps is None:
+                try:
+                    await self.spawn(child)
+                except Exception as e:
+                    print(f'Start {child.handler} failed: {e}')
+                    sentry.captureException()
+                    await self.backoff(child, 0)
+                    continue
+            returncode = await self.wait(child)
+            lifetime = time.monotonic() - child.started
+            print(f'{child.handler} pid {child.pid} exited with {returncode} after {lifetime:.1f}s')
+            child.process = None
+            child.forked = False
+            child.ps = None
+            await self.backoff(child, lifetime)
+
+    @staticmethod
+    async def backoff(child, lifetime):
+        child.restarts += 1
+        if lifetime >= CONFIG_GLOBAL['SUPERVISOR_STABLE_TIME']:
+            # 稳定运行过一段时间, 立即重启
+            child.delay = CONFIG_GLOBAL['SUPERVISOR_RESTART_MIN_DELAY']
+            return
+        await asyncio.sleep(child.delay)
+        child.delay = min(child.delay * 2, CONFIG_GLOBAL['SUPERVISOR_RESTART_MAX_DELAY'])
+
+    def report_stats(self):
+        now = time.monotonic()
+        for child in self.children:
+            if child.ps is None:
+                print(f'SupervisorStats => {child.handler} not running restarts: {child.restarts}')
+                continue
+            try:
+                with child.ps.oneshot():
+                    # 第一次调用cpu_percent返回0, 之后是距离上一次调用的平均值
+                    cpu = child.ps.cpu_percent(None)
+                    rss = child.ps.memory_info().rss
+            except psutil.Error:
+                continue
+            print(f'SupervisorStats => {child.handler} pid: {child.pid} cpu: {cpu:.1f}% rss: {rss / 1024 / 1024:.1f}MB '
+                  f'uptime: {now - child.started:.0f}s restarts: {child.restarts}')
+
+    async def stats_process(self):
+        while True:
+            await asyncio.sleep(CONFIG_GLOBAL['SUPERVISOR_STATS_INTERVAL'])
+            self.report_stats()
+
+    async def heartbeat_process(self):
+        while True:
+            alarm_msg = {
+                "timestamp": int(time.time() * 1000),
+                "status": "normal",
+                "service": "SERVER_STATUS",
+                "server": "EAAS_PROD",
+                "type": "message"
+            }
+            try:
+                await self.r_alarm.publish(IntercomScope.ED.value + ':' + IntercomChannel.SERVER_STATUS.value, codec.dumps(alarm_msg))
+            except Exception as e:
+                print(e)
+                sentry.captureException()
+            await asyncio.sleep(CONFIG_GLOBAL['MASTER_HEARTBEAT_INTERVAL'])
+
+    async def main_process(self):
+        print(f'Start EAAS2.0 master process with core number {self.process_num} \n')
+        self.adopt()
+        await asyncio.gather(self.heartbeat_process(), self.stats_process(),
+                             *[self.supervise(child) for child in self.children])
 
     def run(self):
         loop = asyncio.get_event_loop()
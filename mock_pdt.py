@@ -2,7 +2,6 @@
 # 主要模拟PDT在交易模块的API
 
 import asyncio
-import json
 import uuid
 import time
 import sys
@@ -12,6 +11,7 @@ import copy
 from config.enums import *
 from config.config import CONFIG_GLOBAL
 from util.aredis import RedisHandler
+from util import codec
 
 
 class PDT:
@@ -80,7 +80,7 @@ class PDT:
         try:
             message = message['data']
             print('balance_handler---------------', message)
-            task = json.loads(message)
+            task = codec.loads(message)
             self.Contracts[task['symbol'][0]] = [task['symbol'][1], task['symbol'][2]]
             symbols = [task['symbol'][1], task['symbol'][2]]
             if 'median' in task and task["median"] != "":
@@ -107,7 +107,7 @@ class PDT:
                 acc_balance["result"] = True
                 acc_balance["account_id"] = acc
                 self.PublishQueue.append([
-                    redis_key, json.dumps({
+                    redis_key, codec.dumps({
                         "exchange": exch,
                         "account_id": acc,
                         "global_balances": {
@@ -132,7 +132,7 @@ class PDT:
             }
 
         self.PublishQueue.append([
-            f'Test{IntercomScope.TRADE.value}:{self.strategy_name}_response', json.dumps({
+            f'Test{IntercomScope.TRADE.value}:{self.strategy_name}_response', codec.dumps({
                 "ref_id": request['ref_id'],
                 "action": RequestActions.QUERY_BALANCE.value,
                 "metadata": {"metadata": acc_balance}
@@ -252,7 +252,7 @@ class PDT:
 
     def trade_handler(self, request):
         try:
-            request = json.loads(request['data'])
+            request = codec.loads(request['data'])
             print('trade_handler------------', request)
             if request['action'] == RequestActions.QUERY_BALANCE.value:
                 return self.balance_request_handler(request)
@@ -262,7 +262,7 @@ class PDT:
             body = self.match_engine(request['action'], order)
             body['request'] = request
             self.PublishQueue.append([
-                f'Test{IntercomScope.TRADE.value}:{self.strategy_name}_response', json.dumps({
+                f'Test{IntercomScope.TRADE.value}:{self.strategy_name}_response', codec.dumps({
                     "ref_id": request['ref_id'],
                     "action": request['action'],
                     "strategy": self.strategy_name,
@@ -6,6 +6,7 @@ from config.enums import *
 from config.config import ROOT_PATH
 from config.config import CONFIG_GLOBAL
 from util.aredis import RedisHandler
+from util import codec
 from util.util import *
 
 
@@ -36,19 +37,19 @@ class OMS:
             order_data = json.load(f)
             if command['type'] == Command.OMS_ORDER_STATUS.value:
                 resp_data['msg'] = order_data
-                await self.r_ui.publish(CONFIG_GLOBAL['REDIS_TASK_COMMAND_RESP'], json.dumps(resp_data))
+                await self.r_ui.publish(CONFIG_GLOBAL['REDIS_TASK_COMMAND_RESP'], codec.dumps(resp_data))
             elif command['type'] == Command.OMS_UNFINISHED_ORDERS.value:
                 resp_data['msg'] = {
                     'pending_orders': order_data['pending_orders'],
                     'active_orders': order_data['active_orders'],
                 }
-                await self.r_ui.publish(CONFIG_GLOBAL['REDIS_TASK_COMMAND_RESP'], json.dumps(resp_data))
+                await self.r_ui.publish(CONFIG_GLOBAL['REDIS_TASK_COMMAND_RESP'], codec.dumps(resp_data))
             elif command['type'] == Command.OMS_FINISHED_ORDERS.value:
                 resp_data['msg'] = {
                     'link': '',
                     'finished_orders': order_data['finished_orders'],
                 }
-                await self.r_ui.publish(CONFIG_GLOBAL['REDIS_TASK_COMMAND_RESP'], json.dumps(resp_data))
+                await self.r_ui.publish(CONFIG_GLOBAL['REDIS_TASK_COMMAND_RESP'], codec.dumps(resp_data))
             elif command['type'] == Command.STATISTICS.value:
                 strat_info = {}
                 flag = False
@@ -67,7 +68,7 @@ class OMS:
                     )
                 resp_data['msg'] = strat_info
                 resp_data['result'] = flag
-                await self.r_ui.publish(CONFIG_GLOBAL['REDIS_TASK_COMMAND_RESP'], json.dumps(resp_data))
+                await self.r_ui.publish(CONFIG_GLOBAL['REDIS_TASK_COMMAND_RESP'], codec.dumps(resp_data))
 
             elif command['type'] == Command.EXPORT_STATISTICS.value:
                 base = command['symbol'][1]
@@ -85,7 +86,7 @@ class OMS:
                     "type": Command.EXPORT_STATISTICS.value,
                     'msg': link
                 }
-                await self.r_ui.publish(CONFIG_GLOBAL['REDIS_TASK_COMMAND_RESP'], json.dumps(resp_data))
+                await self.r_ui.publish(CONFIG_GLOBAL['REDIS_TASK_COMMAND_RESP'], codec.dumps(resp_data))
 
             elif command['type'] == Command.DOWNLOAD.value:
                 all_links, _ = create_execution_report(command, order_data)
@@ -96,13 +97,13 @@ class OMS:
                     "type": Command.DOWNLOAD.value,
                     'msg': all_links
                 }
-                await self.r_ui.publish(CONFIG_GLOBAL['REDIS_TASK_COMMAND_RESP'], json.dumps(resp_data))
+                await self.r_ui.publish(CONFIG_GLOBAL['REDIS_TASK_COMMAND_RESP'], codec.dumps(resp_data))
 
     def command_handler(self, command):
         """
         接收来自PDTUI的命令, 推送至队列等待处理
         """
-        command = json.loads(command['data'])
+        command = codec.loads(command['data'])
         if command['type'] not in [Command.OMS_ORDER_STATUS.value, Command.OMS_UNFINISHED_ORDERS.value,
                                    Command.OMS_FINISHED_ORDERS.value, Command.STATISTICS.value, Command.DOWNLOAD.value,
                                    Command.EXPORT_STATISTICS.value]:
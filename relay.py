@@ -0,0 +1,147 @@
+# encoding: utf-8
+import asyncio
+import os
+import time
+
+from aredis import StrictRedis
+from aredis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+
+from config.config import *
+from util.market_message import TIMESTAMP_RE
+from util.market_relay import SUBSCRIBE, UNSUBSCRIBE, encode_frame, read_frame
+from util.time_service import time_service
+
+
+class MarketRelay:
+    """
+    每台机器一个的行情转发进程:
+        1. 本机所有driver通过unix domain socket订阅行情, 每个行情频道在pdt redis上只订阅一次
+        2. redis消息不解码, 原始bytes加上frame头直接写给订阅该频道的driver
+        3. 按频道统计消息数, 行情延迟(pdt时间戳到relay收到), 慢消费者丢弃的消息数
+    """
+
+    def __init__(self):
+        conf = CONFIG_GLOBAL['REDIS_PDT']
+        # 不解码redis消息, 转发时不需要再编码
+        self.r_pdt = StrictRedis(host=conf[0], port=conf[1], password=conf[2], db=conf[3], decode_responses=False)
+        self.p_pdt = self.r_pdt.pubsub(ignore_subscribe_messages=True)
+        self.path = CONFIG_GLOBAL['MARKET_RELAY_SOCKET']
+        self.buffer_limit = CONFIG_GLOBAL['MARKET_RELAY_BUFFER']
+        self.subscribers = {}  # channel(bytes) -> set of StreamWriter
+        self.subscribed = asyncio.Event()
+        # channel -> [消息数, 字节数, 延迟总和(ms), 最大延迟(ms), 丢弃数]
+        self.topic_stats = {}
+
+    async def serve_client(self, reader, writer):
+        """
+        one connected driver: read subscribe/unsubscribe commands until it disconnects
+        """
+        channels = set()
+        try:
+            while True:
+                command, channel, _ = await read_frame(reader)
+                if command == SUBSCRIBE:
+                    channels.add(channel)
+                    await self.subscribe(channel, writer)
+                elif command == UNSUBSCRIBE:
+                    channels.discard(channel)
+                    await self.unsubscribe(channel, writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for channel in channels:
+                await self.unsubscribe(channel, writer)
+            writer.close()
+
+    async def subscribe(self, channel, writer):
+        writers = self.subscribers.get(channel)
+        if writers is None:
+            writers = self.subscribers[channel] = set()
+            await self.p_pdt.subscribe(**{channel.decode(): self.on_message})
+            self.subscribed.set()
+        writers.add(writer)
+
+    async def unsubscribe(self, channel, writer):
+        writers = self.subscribers.get(channel)
+        if writers is None:
+            return
+        writers.discard(writer)
+        if not writers:
+            # 没有driver使用的频道取消订阅
+            del self.subscribers[channel]
+            await self.p_pdt.unsubscribe(channel)
+
+    def on_message(self, message):
+        channel, data = message['channel'], message['data']
+        now = time.time()
+        frame = encode_frame(channel, data, now)
+        stats = self.topic_stats.get(channel)
+        if stats is None:
+            stats = self.topic_stats[channel] = [0, 0, 0, 0, 0]
+        stats[0] += 1
+        stats[1] += len(data)
+        match = TIMESTAMP_RE.search(data[-64:].decode(errors='ignore'))
+        if match is not None:
+            latency = now * 1000 - time_service.pdt_to_ms(match.group(1))
+            stats[2] += latency
+            stats[3] = max(stats[3], latency)
+        for writer in self.subscribers.get(channel, ()):
+            # driver处理不过来时丢弃行情, 不能让一个driver拖慢其他driver
+            if writer.transport.get_write_buffer_size() > self.buffer_limit:
+                stats[4] += 1
+                continue
+            writer.writelines(frame)
+
+    def report_stats(self):
+        for channel, stats in self.topic_stats.items():
+            count = stats[0]
+            if count == 0:
+                continue
+            print(f'RelayStats => {channel.decode()} msgs: {count} bytes: {stats[1]} '
+                  f'subscribers: {len(self.subscribers.get(channel, ()))} '
+                  f'avg_latency: {stats[2] / count:.1f}ms max_latency: {stats[3]:.1f}ms dropped: {stats[4]}')
+            self.topic_stats[channel] = [0, 0, 0, 0, 0]
+
+    async def listen(self):
+        await self.subscribed.wait()
+        retry_delay = CONFIG_GLOBAL['REDIS_RETRY_MIN_DELAY']
+        while True:
+            if not self.p_pdt.subscribed:
+                await asyncio.sleep(CONFIG_GLOBAL['REDIS_RETRY_MIN_DELAY'])
+                continue
+            try:
+                await self.p_pdt.listen()
+            except (RedisConnectionError, RedisTimeoutError) as e:
+                if retry_delay == CONFIG_GLOBAL['REDIS_RETRY_MIN_DELAY']:
+                    print(f'Redis listen error: {e}')
+                    sentry.captureException()
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, CONFIG_GLOBAL['REDIS_RETRY_MAX_DELAY'])
+            except Exception as e:
+                print(e)
+                sentry.captureException()
+            else:
+                retry_delay = CONFIG_GLOBAL['REDIS_RETRY_MIN_DELAY']
+
+    async def stats_process(self):
+        while True:
+            await asyncio.sleep(CONFIG_GLOBAL['MARKET_RELAY_STATS_INTERVAL'])
+            self.report_stats()
+
+    async def main_process(self):
+        # 上一个relay进程退出后留下的socket文件
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        server = await asyncio.start_unix_server(self.serve_client, self.path)
+        print(f'Start market relay on {self.path}')
+        async with server:
+            await asyncio.gather(self.listen(), self.stats_process())
+
+    def run(self):
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(self.main_process())
+
+
+if __name__ == '__main__':
+    relay_instance = MarketRelay()
+    relay_instance.run()
@@ -1,11 +1,13 @@
 # encoding: utf-8
 #
 import random
-from datetime import datetime
+import time
 
 from config.enums import *
 from strategy.strategy_base import StrategyBase
 from util.logger import logger
+from util.time_service import time_service
+from util.trade_window import TradeWindow
 from util.util import *
 
 
@@ -15,13 +17,12 @@ class Iceberg(StrategyBase):
         self.trading = True
         self.market_data = {}  # latest market data
         self.trade_data = {}  # trade data store
-        self.last_order_time = None  # latest send order time
-        self.aggressive_order_time = datetime.now()  # used to execute aggressive mode of iceberg in specific interval
+        self.last_order_time = None  # latest send order time, monotonic seconds
+        self.aggressive_order_time = time.monotonic()  # used to execute aggressive mode of iceberg in specific interval
         self.aggressive_price_overflow = 0.01  # price more or less than price threshold in amplitude
         self.aggressive_interval = 120  # set aggressive execute interval to 2 minutes
         self.order_interval = 5  # order interval is at least 5s
-        self.trade_size_in_last_minute = 0  # trade size in last minute
-        self.trade_list = []  # trade list in last minute
+        self.trade_window = TradeWindow()  # trades in last minute
 
     def on_init(self, config, task, master_ptr):
         """
@@ -38,12 +39,12 @@ class Iceberg(StrategyBase):
         iceberg main logic, driven by orderbook data
         :param orderbook: data format reference strategy_base
         """
-        if (datetime.now() - str_to_datetime(self.task['start_time'])).total_seconds() < 0:
+        if not self.is_started():
             # Time didn't come to start time
             return
         key = '|'.join([orderbook['exchange'], orderbook['symbol'], orderbook['contract_type'], 'orderbook'])
         self.market_data[key] = orderbook
-        if self.last_order_time and (datetime.now() - self.last_order_time).total_seconds() < self.order_interval:
+        if self.last_order_time and time_service.monotonic - self.last_order_time < self.order_interval:
             # order interval is too close, wait
             return
 
@@ -62,14 +63,13 @@ class Iceberg(StrategyBase):
             return
             
         symbol = self.task['symbol'][0]
-   
-        price_precision = get_price_precision(self.task, self.task['exchange'], self.task['symbol'][0])
-        amount_precision = get_amount_precision(self.task, self.task['exchange'], self.task['symbol'][0])
+        rules = self.symbol_rules[symbol]
+        price_precision = rules.price_precision
         contract_type = self.task['contract_type'] if 'contract_type' in self.task else 'spot'
-        base_min_order_size, quote_min_order_size = get_min_order_size(self.task, self.task['exchange'], self.task['symbol'][0])
         post_only = True if self.task['trade_role'] == 'Maker' else False
         ob_s = 0
-        tr_s = sum([_[4] for _ in self.trade_list])
+        self.trade_check()
+        tr_s = self.trade_window.size
         if orderbook['exchange'] == self.task['exchange'] and orderbook['symbol'] == symbol:
             asks = orderbook['metadata']['asks']
             bids = orderbook['metadata']['bids']
@@ -89,7 +89,7 @@ class Iceberg(StrategyBase):
                 price = price
             else:
                 price = price + price_precision if self.task['direction'] == Direction.BUY.value else price - price_precision
-            price = format_price(price, price_precision)
+            price = rules.format_price(price)
             # normally iceberg only have one active order, detect whether our order is at best place
             if len(self.active_orders) > 0:
                 for ref_id, order_info in self.active_orders.items():
@@ -115,7 +115,7 @@ class Iceberg(StrategyBase):
             if not price or price <= 0:
                 logger.warning(f"{self.task['symbol'][0]} price is not valid: {price}")
                 return
-            min_order_size = max(base_min_order_size, quote_min_order_size / price)
+            min_order_size = rules.min_order_size(price)
             logger.info(f'diff:{diff}; residual_amount: {residual_amount}; price: {price}; min_order_size: {min_order_size}')
             if abs(diff) >= self.task['total_size'] or residual_amount < min_order_size:
                 self.on_iceberg_finish()
@@ -128,7 +128,7 @@ class Iceberg(StrategyBase):
                 amount = residual_amount
             amount = min(residual_amount, amount)
 
-            amount = format_amount(amount, amount_precision)
+            amount = rules.format_amount(amount)
             
             if not amount or amount <= min_order_size:
                 # parameter is illegal
@@ -141,7 +141,7 @@ class Iceberg(StrategyBase):
                     self.send_order(self.task['exchange'], symbol, contract_type, price, amount,
                                     self.task['direction'], OrderType.LIMIT.value,
                                     self.task['account'], 'Iceberg', None, post_only)
-                    self.last_order_time = datetime.now()
+                    self.last_order_time = time_service.monotonic
             else:
                 # no price limit
                 self.send_order(self.task['exchange'], symbol, contract_type, price, amount,
@@ -150,16 +150,10 @@ class Iceberg(StrategyBase):
 
     def on_trade_ready(self, trade):
         if trade['exchange'] == self.task['exchange'] and trade['symbol'] == self.task['symbol'][0]:
-            if len(trade['metadata']) > 0:
-                for _ in trade['metadata']:
-                    if (datetime.now() - str_to_datetime(_[1])).total_seconds() <= 60:
-                        self.trade_list.append(_)
+            self.trade_window.add_trades(trade['metadata'], time_service.now_ms)
 
     def trade_check(self):
-        if len(self.trade_list) > 0:
-            for trade in self.trade_list:
-                if (datetime.now() - str_to_datetime(trade[1])).total_seconds() > 60:
-                    self.trade_list.remove(trade)
+        self.trade_window.expire(time_service.now_ms)
 
 
     def on_response(self, response):
@@ -173,7 +167,7 @@ class Iceberg(StrategyBase):
         self.trade_check()
 
         if self.task['execution_mode'] == 'Aggressive':
-            if (datetime.now() - str_to_datetime(self.task['start_time'])).total_seconds() < 0:
+            if not self.is_started():
                 # Time didn't come to start time
                 return
 
@@ -191,7 +185,7 @@ class Iceberg(StrategyBase):
                 logger.file(f"There have {len(self.active_orders)} active orders, wait")
                 return
 
-            if (datetime.now() - self.aggressive_order_time).total_seconds() > self.aggressive_interval:
+            if time_service.monotonic - self.aggressive_order_time > self.aggressive_interval:
                 # balance computed by order response limit to specific exchange;
                 iceberg_balance = self.balance
                 if not iceberg_balance:
@@ -200,8 +194,7 @@ class Iceberg(StrategyBase):
                     return
                 symbol = self.task['symbol'][0]
                 contract_type = self.task['contract_type'] if 'contract_type' in self.task else 'spot'
-                price_precision = get_price_precision(self.task, self.task['exchange'], symbol)
-                amount_precision = get_amount_precision(self.task, self.task['exchange'], symbol)
+                rules = self.symbol_rules[symbol]
 
                 key = '|'.join([self.task['exchange'], symbol, contract_type, 'orderbook'])
                 if key not in self.market_data:
@@ -212,13 +205,11 @@ class Iceberg(StrategyBase):
                     price, amount = orderbook['metadata']['bids'][0]
                 else:
                     price, amount = orderbook['metadata']['asks'][0]
-                price = format_price(price, price_precision)
+                price = rules.format_price(price)
                 if not price or price <= 0:
                     return
 
-                base_min_order_size, quote_min_order_size = get_min_order_size(self.task, self.task['exchange'],
-                                                                               self.task['symbol'][0])
-                min_order_size = max(base_min_order_size, quote_min_order_size / price)
+                min_order_size = rules.min_order_size(price)
                 if amount < min_order_size:
                     logger.warning("Order amount didn't meet min order size")
                     amount = min_order_size
@@ -236,7 +227,7 @@ class Iceberg(StrategyBase):
                     self.on_iceberg_finish()
                     return
                 amount = min(residual_amount, amount)
-                amount = format_amount(amount, amount_precision)
+                amount = rules.format_amount(amount)
                 if self.task['price_threshold'] is not None:
                     if (self.task['direction'] == Direction.BUY.value and price < self.task['price_threshold']) \
                             or (self.task['direction'] == Direction.SELL.value and price > self.task['price_threshold']):
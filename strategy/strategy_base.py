@@ -5,7 +5,11 @@ from datetime import datetime
 
 from config.config import sentry
 from config.enums import *
-from util.logger import logger
+from util.book_store import book_store
+from util.fixed_point import BalanceBook
+from util.logger import logger, Lazy
+from util.symbol_rules import DEFAULT_RULES, SymbolRules
+from util.time_service import time_service
 from util.util import *
 
 
@@ -14,6 +18,9 @@ class StrategyBase:
     def __init__(self):
         self.task_id = ''
         self.task = {}  # task, dict; get from ui
+        self.start_ms = 0  # task['start_time']的epoch ms, 见set_task
+        self.end_ms = None  # task['end_time']的epoch ms, 没有end_time时为None
+        self.symbol_rules = {}  # symbol/median/anchor的下单规则, 见set_task
         self.strategy_id = ''
         self.config = {}  # config info
         self.valid_symbols = {}
@@ -24,11 +31,11 @@ class StrategyBase:
         self.active_orders = None  # 发单收到PDT回复, 有order_id, 需要定时inspect查询状态, 以ref_id为key
         self.finished_orders = None  # 所有已经完结的订单, filled/cancelled/rejected
 
-        self.balance = {}  # 策略维护自己独立的balance, 根据回报计算
+        self.balance = BalanceBook()  # 策略维护自己独立的balance, 根据回报计算, 定点数账本
         self.global_balance = {}  # 绑定strategy_master中的全局balance, 已经合并balance推送和根据回报计算的balance, 根据exchange自动调整
         self.status = TaskStatus.RUNNING.value  # algo status
         self.status_msg = '任务正在运行'  # algo status msg
-        self.time_control = {}  # now only support inspect time frequency control
+        self.scheduler = None  # scheduler of master, set in register_jobs
 
         self.deal_size = 0  # deal size of algo
         self.deal_size_not_updated_time = 0  # deal size not updated time
@@ -49,7 +56,7 @@ class StrategyBase:
         :return:
         """
         self.config = config
-        self.task = task
+        self.set_task(task)
         self.handler = master_ptr
         self.task_id = task['task_id']
         self.strategy_id = task['strategy_id']
@@ -63,31 +70,50 @@ class StrategyBase:
             self.valid_symbols[task['anchor'][0]] = task['anchor']
 
         for currency in self.task['initial_balance']:
-            self.balance[currency] = {
-                "total": self.task['initial_balance'][currency],
-                "available": self.task['initial_balance'][currency],
-                "reserved": 0, "shortable": 0
-            }
+            self.balance.set_total(currency, self.task['initial_balance'][currency])
 
         exch_acc = f"{task['exchange']}|{task['account']}"
         self.global_balance = self.handler.balance[exch_acc]
         if task['exchange'] in BALANCE_BY_ORDER_RES_EX and BALANCE_BY_ORDER_RES_EX[task['exchange']]:
             self.global_balance = self.handler.balance_by_order_res[exch_acc]
 
-        self.time_control = {
-            'on_time_count': 0,
-            'inspect_time': config['TIME_INTERVAL'],
-        }
-        # 当交易所使用on_order_update的时候, 大幅度降低主动inspect的频率
-        if task['exchange'] in ORDER_UPDATE_EX and ORDER_UPDATE_EX[task['exchange']]:
-            self.time_control['inspect_time'] = 20 * config['TIME_INTERVAL']
-
         # Binding master orders
         self.orders = self.handler.orders[self.strategy_id]
         self.pending_orders = self.handler.pending_orders[self.strategy_id] if self.strategy_id in self.handler.pending_orders else {}
         self.active_orders = self.handler.active_orders[self.strategy_id] if self.strategy_id in self.handler.active_orders else {}
         self.finished_orders = self.handler.finished_orders[self.strategy_id] if self.strategy_id in self.handler.finished_orders else {}
 
+    def set_task(self, task):
+        """
+        set task and precompute start/end time and trading rules, also called when task is updated on resume
+        """
+        self.task = task
+        self.start_ms = time_service.str_to_ms(task['start_time']) if task.get('start_time') else 0
+        self.end_ms = time_service.str_to_ms(task['end_time']) if task.get('end_time') else None
+        self.symbol_rules = {}
+        for key in ['symbol', 'median', 'anchor']:
+            if key in task and task[key][0] in task['coin_config']:
+                symbol = task[key][0]
+                self.symbol_rules[symbol] = SymbolRules.from_coin_config(task['exchange'], symbol, task['coin_config'][symbol])
+
+    def is_started(self):
+        """
+        whether start_time of task has come
+        """
+        return time_service.now_ms >= self.start_ms
+
+    def get_book(self, exchange=None, symbol=None, contract_type=None):
+        """
+        latest orderbook of this host from shared memory, written by whichever driver receives the feed
+        :param exchange: default task['exchange']
+        :param symbol: default task['symbol'][0]
+        :param contract_type: default task['contract_type'] or spot
+        :return: {'asks': [[price, size], ...], 'bids': [[price, size], ...], 'timestamp_ms': int, 'seq': int},
+                 None when no process on this host has written the book
+        """
+        return book_store.read(exchange or self.task['exchange'], symbol or self.task['symbol'][0],
+                               contract_type or self.task.get('contract_type', 'spot'))
+
     def on_book(self, market_data):
         """
         listen market data from pdt; check data delay, if more than 3, send alarm to desk quant
@@ -261,6 +287,15 @@ class StrategyBase:
 
         self.balance_management(response)
 
+    def register_jobs(self, scheduler):
+        """
+        register periodic jobs of strategy, job name is prefixed with strategy_id;
+        subclasses add their own jobs (e.g. twap slice) after calling super
+        """
+        self.scheduler = scheduler
+        scheduler.add_job(f'{self.strategy_id}|on_timer', self.on_timer, self.config['TIME_INTERVAL'],
+                          priority=JobPriority.STRATEGY.value)
+
     def on_timer(self):
         """
         regular execute
@@ -274,8 +309,8 @@ class StrategyBase:
             return
         if self.status == TaskStatus.PAUSED.value:
             return
-        if 'end_time' in self.task and self.task['end_time'] is not None:
-            if (datetime.now() - str_to_datetime(self.task['end_time'])).total_seconds() > 300:
+        if self.end_ms is not None:
+            if time_service.now_ms - self.end_ms > 300 * 1000:
                 self.alarm('Execution has not ended after end_time', AlarmCode.EXECUTE_ABNORMAL.value)
 
     def check_middle_size(self):
@@ -312,16 +347,17 @@ class StrategyBase:
         :param post_only: bool, true means only send 'maker' order
         """
         _, base, quote = self.valid_symbols[symbol]
-        increase_reserved_amount(self.balance, base, quote, direction, quantity, price)
+        increase_reserved_amount(self.balance, self.symbol_rules.get(symbol, DEFAULT_RULES), base, quote, direction, quantity, price)
         self.handler.send_order(exchange, symbol, contract_type, price, quantity, direction,
                                 order_type, account_id, strategy_key, delay, post_only, self.strategy_id)
 
     def inspect_order(self, ref_id):
         """
         inspect order by ref_id, order info is stored in active_orders ,key is ref_id
+        sent when the inspect rate limit of the account allows
         :param ref_id: type string
         """
-        self.handler.inspect_order(self.strategy_id, ref_id)
+        self.handler.request_inspect(self.strategy_id, ref_id)
 
     def clear_timeout_pending_orders(self):
         self.handler.clear_timeout_pending_orders(self.strategy_id)
@@ -374,18 +410,6 @@ class StrategyBase:
         else:
             self.status = status
 
-    def inspect_order_on_time(self):
-        self.time_control['on_time_count'] += 1
-        if self.time_control['on_time_count'] * self.config['TIME_INTERVAL'] < self.time_control['inspect_time']:
-            return
-        self.time_control['on_time_count'] = 0
-        for ref_id in self.active_orders:
-            self.inspect_order(ref_id)
-
-    def process_frequency_error(self):
-        self.time_control['inspect_time'] += self.config['TIME_INTERVAL']
-        logger.warning(f'WARNING => 发现交易所限频, 降低{self.strategy_id}inspect频率至{self.time_control["inspect_time"]}秒一次')
-
     def check_deal_size(self):
         if self.status == TaskStatus.PAUSED.value:
             return
@@ -438,6 +462,7 @@ class StrategyBase:
         _, base, quote = self.valid_symbols[response["symbol"]]
         origin_order = self.orders[response["ref_id"]]
 
-        ret = balance_management_common_process(self.balance, response, base, quote, origin_order)
+        rules = self.symbol_rules.get(response["symbol"], DEFAULT_RULES)
+        ret = balance_management_common_process(self.balance, rules, response, base, quote, origin_order)
         if ret:
-            logger.debug("Strategy Balance => ", json.dumps(self.balance))
+            logger.debug("Strategy Balance => ", Lazy(json.dumps, self.balance))
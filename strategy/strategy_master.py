@@ -1,9 +1,20 @@
-import copy
 from datetime import datetime
 
 from config.config import sentry
 from config.enums import *
-from util.logger import logger
+from util.fixed_point import BalanceBook, from_units, to_units
+from util.logger import logger, Lazy
+from util import codec
+from util.market_message import MarketMessage, MarketRoute
+from util.order_journal import OrderJournal
+from util.order_store import OrderStore, PENDING, ACTIVE, FINISHED
+from util.order_tracker import OrderTracker
+from util.rate_limiter import TokenReserve
+from util.records import Order, OrderRequest, OrderResponse, encode_record
+from util.scheduler import Scheduler
+from util.symbol_rules import DEFAULT_RULES, SymbolRules
+from util.task_status import StatusTracker
+from util.time_service import time_service
 from util.util import *
 from strategy.iceberg import Iceberg
 from strategy.sample import Sample
@@ -21,12 +32,24 @@ STRATEGYS = {
     'T-ICEBERG': TriangleIceberg
 }
 
+# 行情类型对应的策略回调函数
+MARKET_DATA_HANDLERS = {
+    MarketDataType.QUOTE.value: 'on_quote_ready',
+    MarketDataType.ORDERBOOK.value: 'on_orderbook_ready',
+    MarketDataType.TRADE.value: 'on_trade_ready',
+    MarketDataType.FUNDING.value: 'on_funding_ready',
+    MarketDataType.INDEX.value: 'on_index_ready',
+    MarketDataType.KLINE.value: 'on_kline_ready',
+    MarketDataType.QUOTETICKER.value: 'on_quote_ticker_ready',
+}
+
 
 class StrategyMaster:
     def __init__(self):
         self.ip = get_ip()  # server ip where algo is running
         self.pid = get_pid()  # pid info of algo
         self.requests = []  # requests queue
+        self.request_notify = None  # callback set by driver, wake up driver to push requests
         self.strategies = {}
         self.task = {}  # task, dict; get from ui
         self.task_id = ''  # task_id
@@ -34,6 +57,8 @@ class StrategyMaster:
         self.strategy_name = ''  # strategy_name, must be enabled in pdt, otherwise can't do the trade
         self.trade_request_key = ''  # trade key for push trade info (orders) to pdt
         self.subscribe_key = {'trade': {}, 'market_data': {}, 'balance': {}, 'order_update': {}}
+        self.market_routes = {}  # (exchange, symbol, data_type) -> MarketRoute, 收到第一条行情时建立
+        self.symbol_rules = {}  # (exchange, symbol) -> SymbolRules, 见get_symbol_rules
 
         self.valid_exchanges = {}
         self.valid_account_id = {}
@@ -46,11 +71,18 @@ class StrategyMaster:
         self.status_msg = '任务正在运行'  # algo status msg
 
         self.order_count = 0  # order cum count, start from 0
-        self.orders = {}  # 所有策略的发单记录
-        self.pending_orders = {}  # 已经发单到PDT, 但是暂时还没有收到PDT回复, 没有order_id, 以ref_id为key
-        self.active_orders = {}  # 发单收到PDT回复, 有order_id, 需要定时inspect查询状态, 以ref_id为key
-        self.finished_orders = {}  # 所有已经完结的订单, filled/cancelled/rejected
-        self.strategy_order_map = {}  # store order_id by send_order, used to map order_id from on_order_update
+        # 订单状态的转移统一由order_store完成, 下面的字典只读, 且不会被替换
+        self.order_store = OrderStore()
+        self.orders = self.order_store.orders  # 所有策略的发单记录
+        self.pending_orders = self.order_store.pending_orders  # 已经发单到PDT, 但是暂时还没有收到PDT回复, 没有order_id, 以ref_id为key
+        self.active_orders = self.order_store.active_orders  # 发单收到PDT回复, 有order_id, 需要定时inspect查询状态, 以ref_id为key
+        self.finished_orders = self.order_store.finished_orders  # 所有已经完结的订单, filled/cancelled/rejected
+        self.order_notes = {}  # strategy_id -> notes, 同一策略的订单共用一个notes字典
+        self.order_journal = OrderJournal()  # 订单状态变化日志, driver重启后恢复订单
+        self.order_tracker = None  # active订单的inspect调度和限频, on_init时按配置生成
+        self.top_of_book = {}  # (exchange, symbol) -> 最新一档行情, 用于inspect排序
+        self.scheduler = Scheduler()  # on_timer中按各自周期执行的定时任务
+        self.status_tracker = StatusTracker()  # 状态变化时推送snapshot, 其他时候推送delta
 
         self.error_count = 0
         self.last_warning_time = datetime.now()
@@ -70,6 +102,10 @@ class StrategyMaster:
         self.config = config
         self.task = task
         self.task_id = task['task_id']
+        self.status_tracker.snapshot_interval = config['STATUS_SNAPSHOT_INTERVAL']
+        # inspect令牌由driver从所有进程共用的PDT_RATE_LIMIT令牌桶中预取
+        self.order_tracker = OrderTracker(TokenReserve(RequestActions.INSPECT_ORDER.value),
+                                          config['ORDER_UPDATE_STALE'], config['ORDER_INSPECT_STALE'])
         self.strategy_name = config['STRATEGY_NAME']
         self.trade_request_key = f'{IntercomScope.TRADE.value}:{self.strategy_name}_request'
         if task['test_mode']:
@@ -78,14 +114,10 @@ class StrategyMaster:
         # 初始化计算balance
         for exch_acc in self.task['initial_balance']:
             self.balance[exch_acc] = {}
-            self.balance_by_order_res[exch_acc] = {}
+            # 根据回报计算的balance使用定点数账本, 对外仍是同样的dict结构
+            self.balance_by_order_res[exch_acc] = BalanceBook(self.task['initial_balance'][exch_acc])
             self.balance_status[exch_acc] = False
             for currency in self.task['initial_balance'][exch_acc]:
-                self.balance_by_order_res[exch_acc][currency] = {
-                    "total": self.task['initial_balance'][exch_acc][currency],
-                    "available": self.task['initial_balance'][exch_acc][currency],
-                    "reserved": 0, "shortable": 0
-                }
                 self.balance[exch_acc][currency] = {
                     "total": self.task['initial_balance'][exch_acc][currency],
                     "available": self.task['initial_balance'][exch_acc][currency],
@@ -93,19 +125,7 @@ class StrategyMaster:
                 }
 
         # 从文件缓存中回滚历史订单信息
-        order_path = os.path.join(ROOT_PATH, 'orders', f'{self.task_id}.json')
-        if os.path.isfile(order_path):  # 当存在订单缓存文件的时候, 重载进内存, 并删除文件
-            logger.debug('Start loading order cache file...')
-            with open(order_path, 'r') as f:
-                order_his_data = json.load(f)
-                self.pending_orders = order_his_data['pending_orders']
-                self.rebuild_orders(self.pending_orders)
-                self.active_orders = order_his_data['active_orders']
-                self.rebuild_orders(self.active_orders)
-                self.finished_orders = order_his_data['finished_orders']
-                self.rebuild_orders(self.finished_orders)
-            os.remove(order_path)
-            logger.debug('Delete order cache file success')
+        self.load_order_cache()
 
         for strategy_id in task['strategies']:
             st_task = task['strategies'][strategy_id]
@@ -115,7 +135,9 @@ class StrategyMaster:
             strategy = STRATEGYS[st_task['algorithm']]()
             strategy.on_init(config, st_task, self)
             self.strategies[strategy_id] = strategy
- 
+
+        self.register_jobs()
+
         subscribe_obj = {}
         # 执行订阅行情
         for mkey in self.subscribe_key['market_data']:
@@ -148,13 +170,61 @@ class StrategyMaster:
             'task': self.task
         })
 
+    def load_order_cache(self):
+        """
+        reload orders from orders/<task_id>.json (saved on finish) and order journal (written on every transition),
+        then start a new journal with the reloaded orders as snapshot
+        """
+        order_his_data = None
+        order_path = os.path.join(ROOT_PATH, 'orders', f'{self.task_id}.json')
+        if os.path.isfile(order_path):  # 当存在订单缓存文件的时候, 重载进内存, 并删除文件
+            logger.debug('Start loading order cache file...')
+            with open(order_path, 'r') as f:
+                order_his_data = json.load(f)
+
+        self.order_journal.open(self.task_id)
+        journal_data = self.order_journal.load()
+        if journal_data is not None:  # driver异常退出时, 以journal中的订单为准
+            logger.debug('Replay order journal...')
+            order_his_data = journal_data
+
+        if order_his_data is not None:
+            self.rebuild_orders(order_his_data)
+            logger.debug('Reload orders success, order count:', self.order_count)
+
+        # 先写入快照再删除缓存文件, 任何时刻磁盘上都有完整的订单信息
+        self.order_journal.start(self.get_order_books())
+        if os.path.isfile(order_path):
+            os.remove(order_path)
+            logger.debug('Delete order cache file success')
+
+    def get_order_books(self):
+        return self.order_store.to_dict()
+
+    def journal_order(self, strategy_id, ref_id, book):
+        """
+        record order state transition
+        :param book: 'pending_orders'/'active_orders'/'finished_orders', None means order is removed
+        """
+        try:
+            self.order_journal.record(strategy_id, ref_id, book, self.orders[strategy_id].get(ref_id))
+        except Exception as e:
+            logger.error('journal order error:', e)
+            sentry.captureException()
+
     def rebuild_orders(self, his_orders):
-        for strategy_id in his_orders:
-            for ref_id in his_orders[strategy_id]:
-                order_count = int(str.split(ref_id, '_')[-1])
-                if order_count > self.order_count:
-                    self.order_count = order_count
-                self.orders[strategy_id][ref_id] = his_orders[strategy_id][ref_id]
+        """
+        :param his_orders: {'pending_orders': {}, 'active_orders': {}, 'finished_orders': {}}
+        """
+        self.order_store.load(his_orders, Order.from_dict)
+        for strategy_id, ref_id in self.order_store.entries:
+            order_count = int(str.split(ref_id, '_')[-1])
+            if order_count > self.order_count:
+                self.order_count = order_count
+            order = self.orders[strategy_id][ref_id]
+            # 恢复on_order_update需要的order_id映射
+            if 'order_id' in order and ORDER_UPDATE_EX.get(order['exchange']):
+                self.order_store.set_order_id(strategy_id, ref_id, f"{order['exchange']}|{order['symbol']}|{order['order_id']}")
 
     def on_order_update(self, updated_order):
         """
@@ -177,29 +247,29 @@ class StrategyMaster:
             }
         }
         """
-        updated_order = json.loads(updated_order['data'])
+        updated_order = codec.loads(updated_order['data'])
 
         ex_sy_order_id = f"{updated_order['exchange']}|{updated_order['symbol']}|{updated_order['metadata']['order_id']}"
-        if ex_sy_order_id in self.strategy_order_map:
+        entry = self.order_store.find_by_order_id(ex_sy_order_id)
+        if entry is not None:
             order_update_key = f"{IntercomScope.TRADE.value}:{self.task['exchange']}|{self.task['account']}"
-            self.subscribe_key['order_update'][order_update_key]['update_time'] = datetime.now()
-            maped_info = self.strategy_order_map[ex_sy_order_id]
-            origin_order = self.orders[maped_info['strategy_id']][maped_info['ref_id']]
-            response = {
-                'strategy_id': maped_info['strategy_id'],
-                'ref_id': maped_info['ref_id'],
-                'action': RequestActions.INSPECT_ORDER.value,
-                'exchange': updated_order['exchange'],
-                'symbol': updated_order['symbol'],
-                'contract_type': updated_order['contract_type'],
-                'direction': origin_order['direction'],
-                'original_amount': updated_order['order_info']['original_amount'],
-                'original_price': origin_order['price'],
-                'status': updated_order['order_info']['status'],
-                'timestamp': updated_order['timestamp'],
-                'filled': updated_order['order_info']['filled'],
-                'avg_executed_price': updated_order['order_info']['avg_executed_price']
-            }
+            self.subscribe_key['order_update'][order_update_key]['update_time'] = time.monotonic()
+            origin_order = entry.order
+            response = OrderResponse(
+                strategy_id=entry.strategy_id,
+                ref_id=entry.ref_id,
+                action=RequestActions.INSPECT_ORDER.value,
+                exchange=updated_order['exchange'],
+                symbol=updated_order['symbol'],
+                contract_type=updated_order['contract_type'],
+                direction=origin_order['direction'],
+                original_amount=updated_order['order_info']['original_amount'],
+                original_price=origin_order['price'],
+                status=updated_order['order_info']['status'],
+                timestamp=updated_order['timestamp'],
+                filled=updated_order['order_info']['filled'],
+                avg_executed_price=updated_order['order_info']['avg_executed_price']
+            )
             origin_order['update_time'] = get_datetime(updated_order['timestamp']).strftime('%Y-%m-%d %H:%M:%S')
             self.on_response(response)
 
@@ -213,10 +283,7 @@ class StrategyMaster:
             self.valid_symbols[st_task['anchor'][0]] = st_task['anchor']
 
     def init_master_orders(self, strategy_id):
-        self.orders.setdefault(strategy_id, {})
-        self.pending_orders.setdefault(strategy_id, {})
-        self.active_orders.setdefault(strategy_id, {})
-        self.finished_orders.setdefault(strategy_id, {})
+        self.order_store.add_strategy(strategy_id)
 
     def prepare_with_subscription(self, st_task):
         test_mode = st_task['test_mode']
@@ -237,10 +304,10 @@ class StrategyMaster:
                 order_update_key = f"{st_task['exchange']}|{st_task['account']}"
                 self.send_request([
                     f'{IntercomScope.TRADE.value}:{IntercomChannel.ORDER_UPDATE_SUBSCRIPTION_REQUEST.value}',
-                    json.dumps(order_update_key)
+                    codec.dumps(order_update_key)
                 ])
                 self.subscribe_key['order_update'][f'{IntercomScope.TRADE.value}:{order_update_key}'] = {
-                    'update_time': datetime.now(),
+                    'update_time': time.monotonic(),
                     'count': 0
                 }
 
@@ -254,97 +321,111 @@ class StrategyMaster:
         if st_task['algorithm'] not in [Algorithms.TRIANGLE_ICEBERG.value, Algorithms.TRIANGLE_TWAP.value]:
             market_key = f'{IntercomScope.MARKET.value}:{st_task["exchange"]}|{st_task["symbol"][0]}|spot|orderbook|20'
             self.subscribe_key['market_data'][market_key] = {
-                'update_time': datetime.now(),
+                'update_time': time.monotonic(),
                 'count': 0
             }
 
         if 'median' in st_task:
             median_key = f'{IntercomScope.MARKET.value}:{st_task["exchange"]}|{st_task["median"][0]}|spot|orderbook|20'
             self.subscribe_key['market_data'][median_key] = {
-                'update_time': datetime.now(),
+                'update_time': time.monotonic(),
                 'count': 0
             }
 
         if 'anchor' in st_task:
             anchor_key = f'{IntercomScope.MARKET.value}:{st_task["exchange"]}|{st_task["anchor"][0]}|spot|orderbook|20'
             self.subscribe_key['market_data'][anchor_key] = {
-                'update_time': datetime.now(),
+                'update_time': time.monotonic(),
                 'count': 0
             }
 
         if st_task['algorithm'] in [Algorithms.ICEBERG.value]:  # now only iceberg uses trade data
             trade_key = f'{IntercomScope.MARKET.value}:{st_task["exchange"]}|{st_task["symbol"][0]}|spot|trade'
             self.subscribe_key['market_data'][trade_key] = {
-                'update_time': datetime.now(),
+                'update_time': time.monotonic(),
                 'count': 0
             }
 
         if st_task['algorithm'] in [Algorithms.VWAP.value]:
             kline_key = f'{IntercomScope.MARKET.value}:{st_task["exchange"]}|{st_task["symbol"][0]}|spot|kline||1m'
             self.subscribe_key['market_data'][kline_key] = {
-                'update_time': datetime.now(),
+                'update_time': time.monotonic(),
                 'count': 0
             }
 
     def on_book(self, market_data):
-        market_data = json.loads(market_data['data'])
+        # 只解析消息头, 深度数据在策略用到时才解析; driver已经解析的MarketMessage由进程中所有task共用
+        market_data = market_data.get('market') or MarketMessage(market_data['data'])
         try:
-            if market_data['symbol'] not in self.valid_symbols or market_data['exchange'] not in self.valid_exchanges:
+            if market_data.symbol not in self.valid_symbols or market_data.exchange not in self.valid_exchanges:
                 return  # 不是我们订阅的行情, 忽略之
-            if not str(market_data['timestamp']).isdigit() or len(str(market_data['timestamp'])) != 17:
-                logger.error(f"timestamp value error: {market_data['timestamp']}")
+            time_service.tick()
+            if not str(market_data.timestamp).isdigit() or len(str(market_data.timestamp)) != 17:
+                logger.error(f"timestamp value error: {market_data.timestamp}")
                 return
-            if market_data['data_type'] == MarketDataType.ORDERBOOK.value:
-                self.cal_current_price(market_data)
-                if not self.check_trade_precision(market_data):
+            route_key = (market_data.exchange, market_data.symbol, market_data.data_type)
+            route = self.market_routes.get(route_key)
+            if route is None:
+                route = self.build_market_route(*route_key)
+            if market_data.data_type == MarketDataType.ORDERBOOK.value:
+                self.top_of_book[(market_data.exchange, market_data.symbol)] = market_data.top_of_book()
+                self.cal_current_price(market_data, route.strategy_ids)
+                if not self.check_trade_precision(market_data, route.rules):
                     return
             if self.status == TaskStatus.PAUSED.value:
-                return
+                return  # 暂停时只用到了第一档
 
             # 当前行情的时效性不够
-            if not market_data_validate(market_data, 3):
+            if time_service.now_ms - market_data.timestamp_ms > 3000:
                 msg = f"{market_data['exchange']} {market_data['symbol']} market info didn't update from " \
                       f"{get_datetime(market_data['timestamp'])} to {datetime.now()}"
                 logger.file(msg)
                 self.alarm(msg, AlarmCode.DATA_OUTDATED.value)
 
-            for strategy_id in self.strategies:
-                st = self.strategies[strategy_id]
-                if market_data['symbol'] not in st.valid_symbols:
-                    continue
-
-                if market_data['data_type'] == MarketDataType.QUOTE.value:
-                    st.on_quote_ready(market_data)
-                elif market_data['data_type'] == MarketDataType.ORDERBOOK.value:
-                    key = '|'.join([market_data['exchange'], market_data['symbol'], market_data['contract_type'],
-                                    market_data['data_type'], '20'])
-                    key = f'{IntercomScope.MARKET.value}:{key}'
-                    self.subscribe_key['market_data'][key]['update_time'] = datetime.now()
-                    st.on_orderbook_ready(market_data)
-                elif market_data['data_type'] == MarketDataType.TRADE.value:
-                    key = '|'.join([market_data['exchange'], market_data['symbol'], market_data['contract_type'],
-                                    market_data['data_type']])
-                    key = f'{IntercomScope.MARKET.value}:{key}'
-                    self.subscribe_key['market_data'][key]['update_time'] = datetime.now()
-                    st.on_trade_ready(market_data)
-                elif market_data['data_type'] == MarketDataType.FUNDING.value:
-                    st.on_funding_ready(market_data)
-                elif market_data['data_type'] == MarketDataType.INDEX.value:
-                    st.on_index_ready(market_data)
-                elif market_data['data_type'] == MarketDataType.KLINE.value:
-                    key = '|'.join([market_data['exchange'], market_data['symbol'], market_data['contract_type'],
-                                    market_data['data_type'], '|1m'])
-                    key = f'{IntercomScope.MARKET.value}:{key}'
-                    self.subscribe_key['market_data'][key]['update_time'] = datetime.now()
-                    st.on_kline_ready(market_data)
-                elif market_data['data_type'] == MarketDataType.QUOTETICKER.value:
-                    st.on_quote_ticker_ready(market_data)
-                else:
-                    logger.error(market_data)
-                    logger.error(f'wrong type of market data: {market_data["data_type"]}')
+            if route.handlers is None:
+                logger.error(market_data)
+                logger.error(f'wrong type of market data: {market_data.data_type}')
+                return
+            # 每条行情只更新一次订阅的时效性
+            if route.subscription is not None:
+                route.subscription['update_time'] = time.monotonic()
+            for handler in route.handlers:
+                handler(market_data)
         except Exception as e:
             logger.error(e)
             sentry.captureException()
+
+    def build_market_route(self, exchange, symbol, data_type):
+        """
+        find subscription record and strategy handlers of market data, called once for each (exchange, symbol, data_type)
+        :return: MarketRoute, handlers is None when data_type is unknown
+        """
+        subscription = None
+        for key, channel_info in self.subscribe_key['market_data'].items():
+            # key: 'Md_beta05:Binance|BTCUSDT|spot|orderbook|20'
+            fields = key.split(':', 1)[1].split('|')
+            if fields[0] == exchange and fields[1] == symbol and fields[3] == data_type:
+                subscription = channel_info
+                break
+
+        # 交易对是策略的symbol/median/anchor之一
+        strategy_ids = [strategy_id for strategy_id, st in self.strategies.items() if symbol in st.valid_symbols]
+        handlers = None
+        if data_type in MARKET_DATA_HANDLERS:
+            handlers = [getattr(self.strategies[strategy_id], MARKET_DATA_HANDLERS[data_type]) for strategy_id in strategy_ids]
+        route = MarketRoute(subscription, strategy_ids, handlers, self.get_symbol_rules(exchange, symbol))
+        self.market_routes[(exchange, symbol, data_type)] = route
+        return route
+
+    def get_symbol_rules(self, exchange, symbol):
+        """
+        trading rules of symbol built from coin_config of task once, None when symbol is not in coin_config
+        """
+        key = (exchange, symbol)
+        if key not in self.symbol_rules:
+            coin_config = self.task['coin_config'].get(exchange, {}).get(symbol)
+            self.symbol_rules[key] = SymbolRules.from_coin_config(exchange, symbol, coin_config) if coin_config else None
+        return self.symbol_rules[key]
     
     def check_task_status(self):
         # 如果所有子策略status都是finished，则认为task结束
@@ -354,20 +435,53 @@ class StrategyMaster:
             self.status_msg = "Task has finished"
             self.on_finish()
             
-    def on_timer(self):
+    def register_jobs(self):
+        """
+        periodic jobs of master and strategies, executed by on_timer only when due
+        """
+        interval = self.config['TIME_INTERVAL']
         # 定时检查task是否结束
-        self.check_task_status()
-        # 定时对active_order查询状态
-        self.inspect_order_on_time()
-        # 定时检查市场数据是否更新
-        self.check_market_data()
-        # 定时检查是否成交
-        self.check_deal_size()
+        self.scheduler.add_job('check_task_status', self.check_task_status, interval, priority=JobPriority.TASK.value)
+        # 只inspect没有收到推送的active订单, 按优先级和每个账户的令牌桶发送
+        self.scheduler.add_job('inspect_orders', self.inspect_orders, self.config['ORDER_INSPECT_CHECK_INTERVAL'],
+                               priority=JobPriority.INSPECT.value)
+        # 定时检查市场数据是否更新, 断流的阈值是分钟级, 不需要每次on_timer都检查
+        self.scheduler.add_job('check_market_data', self.check_market_data, self.config['FEED_CHECK_INTERVAL'],
+                               priority=JobPriority.MONITOR.value)
+        # 定时检查是否成交, 未成交时间按TIME_INTERVAL累加
+        self.scheduler.add_job('check_deal_size', self.check_deal_size, interval, priority=JobPriority.MONITOR.value)
         # 定时向PDT UI后端返回目前的订单完成信息
-        self.send_status()
-
+        self.scheduler.add_job('send_status', self.send_status, interval, priority=JobPriority.STATUS.value)
+        # 子策略的定时任务
         for strategy_id in self.strategies:
-            self.strategies[strategy_id].on_timer()
+            self.strategies[strategy_id].register_jobs(self.scheduler)
+        # 批量fsync订单journal, 过大时压缩成快照
+        self.scheduler.add_job('sync_order_journal', self.sync_order_journal, interval, priority=JobPriority.PERSIST.value)
+        self.scheduler.add_job('report_job_stats', self.report_job_stats, self.config['SCHEDULER_STATS_INTERVAL'],
+                               priority=JobPriority.PERSIST.value)
+
+    def on_timer(self):
+        time_service.tick()
+        self.scheduler.run_due(time_service.monotonic)
+
+    def report_job_stats(self):
+        """
+        write runtime/overrun counters of periodic jobs to log file, max values are reset after each report
+        """
+        for name, stats in self.scheduler.stats().items():
+            logger.file(f'JobStats => {name} period: {stats["period"]}s runs: {stats["runs"]} '
+                        f'errors: {stats["errors"]} overruns: {stats["overruns"]} '
+                        f'avg: {stats["avg_ms"]:.3f}ms max: {stats["max_ms"]:.3f}ms '
+                        f'max_lag: {stats["max_lag_ms"]:.3f}ms')
+        self.scheduler.reset_stats()
+        logger.file(f'InspectStats => {self.order_tracker.stats} reserved: {self.order_tracker.tokens.tokens}')
+
+    def sync_order_journal(self):
+        try:
+            self.order_journal.sync(self.get_order_books())
+        except Exception as e:
+            logger.error('sync order journal error:', e)
+            sentry.captureException()
 
     def check_deal_size(self):
         """
@@ -393,9 +507,9 @@ class StrategyMaster:
         for channel in self.subscribe_key['market_data']:
             interval = 60 * 5 if 'trade' not in channel else 60 * 60
             channel_info = self.subscribe_key['market_data'][channel]
-            if (datetime.now() - channel_info['update_time']).total_seconds() > interval:
+            if time.monotonic() - channel_info['update_time'] > interval:
                 # market data status check
-                channel_info['update_time'] = datetime.now()
+                channel_info['update_time'] = time.monotonic()
                 channel_info['count'] += 1
 
                 msg = f"{channel} didn't receive market data from pdt for 5 mins"
@@ -409,19 +523,19 @@ class StrategyMaster:
         for channel in self.subscribe_key['order_update']:
             # on order update status check
             channel_info = self.subscribe_key['order_update'][channel]
-            if (datetime.now() - channel_info['update_time']).total_seconds() > 60 * 5:
-                channel_info['update_time'] = datetime.now()
+            if time.monotonic() - channel_info['update_time'] > 60 * 5:
+                channel_info['update_time'] = time.monotonic()
                 channel_info['count'] += 1
                 self.send_request([
                     f'{IntercomScope.TRADE.value}:{IntercomChannel.ORDER_UPDATE_SUBSCRIPTION_REQUEST.value}',
-                    json.dumps(channel.split(':')[1])
+                    codec.dumps(channel.split(':')[1])
                 ])
                 msg = f"{channel} didn't receive order_update data from pdt for 5 mins"
                 if channel_info['count'] == 1:
                     self.alarm(msg, AlarmCode.DATA_UNRECEIVED.value)
 
     def on_finish(self):
-        self.send_status()
+        self.send_status(force_snapshot=True)
         for strategy_id in self.strategies:
             self.strategies[strategy_id].on_finish()
 
@@ -473,7 +587,7 @@ class StrategyMaster:
         command = command['data']
         print('command: ', command)
         try:
-            data = json.loads(command)
+            data = codec.loads(command)
             if data['task_id'] != self.task_id:
                 return
             logger.debug(f"GetCommand => {json.dumps(data)}")
@@ -494,8 +608,11 @@ class StrategyMaster:
                             self.send_command_response(data, info, False)
                             logger.error('参数更新失败: ' + info)
                             return
-                        self.strategies[strategy_id].task = st_task
+                        self.strategies[strategy_id].set_task(st_task)
                     self.task = data['task']
+                    # coin_config可能有变化, 重新建立行情路由和下单规则
+                    self.market_routes.clear()
+                    self.symbol_rules.clear()
                 self.status = TaskStatus.RUNNING.value
                 self.update_status(TaskStatus.RUNNING.value, '任务正在运行')
                 logger.warning('Algorithm is resumed')
@@ -555,7 +672,7 @@ class StrategyMaster:
                 self.cancel_order(data['strategy_id'], data['ref_id'], True)
                 self.send_command_response(data, '已经向交易所发送撤单请求')
             elif data['type'] == Command.OMS_INSPECT_ORDER.value:
-                self.inspect_order(data['strategy_id'], data['ref_id'])
+                self.request_inspect(data['strategy_id'], data['ref_id'])
                 self.send_command_response(data, '已经向交易所发送查单请求')
             elif data['type'] == Command.OMS_CANCEL_ALL_ORDER.value:
                 # 撤销在交易所的所有挂单
@@ -666,6 +783,8 @@ class StrategyMaster:
             'channel': channel,
             'request': req
         })
+        if self.request_notify is not None:
+            self.request_notify()
 
     def send_order(self, exchange=None, symbol=None, contract_type=None, price=None, quantity=None, direction=None,
                    order_type=None, account_id=None, strategy_key=None, delay=None, post_only=False, strategy_id=None):
@@ -684,43 +803,47 @@ class StrategyMaster:
         :param delay: int, used in fak, unit is ms | 6000(6s)
         :param post_only: bool, true means only send 'maker' order
         """
-        order = {
-            "exchange": exchange,
-            "symbol": symbol,
-            "account_type": AccountType.EXCHANGE.value,
-            "contract_type": contract_type,
-            "price": price,
-            "quantity": quantity,
-            "direction": direction,
-            "order_type": order_type,
-            "account_id": account_id,
-            "strategy_key": strategy_key,
-            "delay": delay if delay is not None else 59000,
-            "post_only": post_only,
-            "filled": 0,
-            "avg_price": 0,
-            "create_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            # notes 字段会以json写入数据库
-            "notes": {"task_id": self.task_id, "strategy_id": strategy_id}
-        }
+        # notes 字段会以json写入数据库, 内容只和策略有关, 所有订单共用, 不可修改
+        notes = self.order_notes.get(strategy_id)
+        if notes is None:
+            notes = self.order_notes[strategy_id] = {"task_id": self.task_id, "strategy_id": strategy_id}
+        order = Order(
+            exchange=exchange,
+            symbol=symbol,
+            account_type=AccountType.EXCHANGE.value,
+            contract_type=contract_type,
+            price=price,
+            quantity=quantity,
+            direction=direction,
+            order_type=order_type,
+            account_id=account_id,
+            strategy_key=strategy_key,
+            delay=delay if delay is not None else 59000,
+            post_only=post_only,
+            filled=0,
+            avg_price=0,
+            create_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            notes=notes
+        )
 
         self.order_count += 1
-        request = {
-            'strategy': self.strategy_name,
-            'task_id': self.task_id,
-            "strategy_id": strategy_id,
-            'ref_id': f'{time.strftime("%Y%m%d%H%M%S", time.localtime())}_{self.order_count:08}',
-            'action': OrderActions.SEND.value,
-            'metadata': order
-        }
+        request = OrderRequest(
+            strategy=self.strategy_name,
+            task_id=self.task_id,
+            strategy_id=strategy_id,
+            ref_id=f'{time.strftime("%Y%m%d%H%M%S", time.localtime())}_{self.order_count:08}',
+            action=OrderActions.SEND.value,
+            metadata=order
+        )
         order_info = f"{order['account_id']} {order['strategy_key']} {order['exchange']} {order['symbol']} " \
                      f"{order['order_type']} {order['direction']} {order['quantity']}@{order['price']}"
         logger.info(f"SendOrder => {strategy_id} {request['ref_id']} {order_info} {request['strategy']} {request['task_id']}")
         # 发单的时候增加资金占用量
         _, base, quote = self.get_base_quote_name(symbol)
-        increase_reserved_amount(self.balance_by_order_res[f"{exchange}|{account_id}"], base, quote, direction, quantity, price)
-        self.orders[strategy_id][request['ref_id']] = order
-        self.pending_orders[strategy_id][request['ref_id']] = order
+        rules = self.get_symbol_rules(exchange, symbol) or DEFAULT_RULES
+        increase_reserved_amount(self.balance_by_order_res[f"{exchange}|{account_id}"], rules, base, quote, direction, quantity, price)
+        self.order_store.add(strategy_id, request['ref_id'], order)
+        self.journal_order(strategy_id, request['ref_id'], PENDING)
         self.send_request([self.trade_request_key, request])
 
     def on_response_process(self, response):
@@ -733,7 +856,7 @@ class StrategyMaster:
             metadata: metadata
         }
         """
-        response = json.loads(response['data'])
+        response = codec.loads(response['data'])
 
         # 其他非发单相关的回报, 直接丢掉就好
         if 'request' not in response['metadata'] or 'task_id' not in response['metadata']['request']:
@@ -743,25 +866,25 @@ class StrategyMaster:
             return
 
         try:
-            logger.file(f'OriginalResponse => {json.dumps(response)}')
+            logger.file('OriginalResponse =>', Lazy(json.dumps, response))
             strategy_id = response['metadata']['request']['strategy_id']
-            order_response = {
-                'ref_id': response['ref_id'],
-                'strategy_id': strategy_id,
-                'action': response['action'],
-                'task_id': response['metadata']['request']['task_id'],
-                'exchange': response['metadata']['exchange'],
-                'account_id': response['metadata']['metadata']['account_id'],
-                'symbol': response['metadata']['symbol'],
-                'contract_type': response['metadata']['contract_type'],
-                'timestamp': response['metadata']['timestamp'],
-                'status': None,
-                'direction': Direction.BUY.value,
-                'original_amount': 0,
-                'original_price': 0,
-                'filled': 0,
-                'avg_executed_price': 0
-            }
+            order_response = OrderResponse(
+                ref_id=response['ref_id'],
+                strategy_id=strategy_id,
+                action=response['action'],
+                task_id=response['metadata']['request']['task_id'],
+                exchange=response['metadata']['exchange'],
+                account_id=response['metadata']['metadata']['account_id'],
+                symbol=response['metadata']['symbol'],
+                contract_type=response['metadata']['contract_type'],
+                timestamp=response['metadata']['timestamp'],
+                status=None,
+                direction=Direction.BUY.value,
+                original_amount=0,
+                original_price=0,
+                filled=0,
+                avg_executed_price=0
+            )
             order_info = response['metadata']['metadata']
             origin_order = self.orders[strategy_id][order_response['ref_id']]
             self.origin_order_update_response(order_response, origin_order)
@@ -777,10 +900,7 @@ class StrategyMaster:
                 else:  # 发单成功, 收到交易所回报
                     if order_response['exchange'] in ORDER_UPDATE_EX and ORDER_UPDATE_EX[order_response['exchange']]:
                         ex_sy_order_id = f"{order_response['exchange']}|{order_response['symbol']}|{order_info['order_id']}"
-                        self.strategy_order_map[ex_sy_order_id] = {
-                            'strategy_id': strategy_id,
-                            "ref_id": response['ref_id'],
-                        }
+                        self.order_store.set_order_id(strategy_id, response['ref_id'], ex_sy_order_id)
                     order_response['order_id'] = order_info['order_id']
                     order_response['status'] = OrderStatus.PENDING.value
                 self.on_response(order_response)
@@ -794,13 +914,13 @@ class StrategyMaster:
                     origin_order['pending_cancel'] = False
                     # TODO 撤单失败的多种原因
                     self.pdt_error_handler(response, strategy_id)
-                    self.inspect_order(strategy_id, response['ref_id'])
+                    self.request_inspect(strategy_id, response['ref_id'])
                     return
 
                 # order_response['status'] = OrderStatus.CANCELLED.value
                 # self.on_response(order_response)
                 # 撤单回报中没有已经成交的量, 所以需要再inspect一次
-                self.inspect_order(strategy_id, order_response['ref_id'])
+                self.request_inspect(strategy_id, order_response['ref_id'])
 
             if response['metadata']['event'] == RequestActions.INSPECT_ORDER.value:
                 if order_response['ref_id'] not in self.active_orders[strategy_id]:  # 不是fak订单, 单纯的查询
@@ -811,6 +931,7 @@ class StrategyMaster:
                     if str(order_info['error_code'][3:]) != '535' or response['metadata']['exchange'] == 'Bitflyer':
                         self.pdt_error_handler(response, strategy_id)
                         return
+                else:
                     # 有些交易所订单已撤销，但是会返回不存在错误，需要特殊处理
                     detail_order_info = response['metadata']['order_info']
                     detail_order_info['status'] = OrderStatus.CANCELLED.value
@@ -884,6 +1005,8 @@ class StrategyMaster:
             'account_id': 'trader1'
         }
         """
+        time_service.tick()
+        self.order_tracker.on_update(response['strategy_id'], response['ref_id'])
         # 基类统一的balance管理
         self.balance_management(response)
 
@@ -928,7 +1051,7 @@ class StrategyMaster:
         # 获取定时的balance推送
         try:
             balance = balance['data']
-            data = json.loads(balance)
+            data = codec.loads(balance)
             if data['exchange'] in self.valid_exchanges and data['account_id'] in self.valid_account_id:
                 if 'spot_balance' in data['global_balances']:
                     spot_balance = data['global_balances']['spot_balance']
@@ -966,7 +1089,9 @@ class StrategyMaster:
             error_code_msg = '系统错误 ' + error_code_msg
         elif error_code[3:] == '502':
             if response['action'] == RequestActions.INSPECT_ORDER.value:
-                self.strategies[strategy_id].process_frequency_error()
+                exch_acc = f"{response['metadata']['exchange']}|{response['metadata']['metadata']['account_id']}"
+                self.order_tracker.on_rate_limited(exch_acc)
+                logger.warning(f'WARNING => 发现交易所限频, 放弃{exch_acc}已预取的inspect令牌, 请检查PDT_RATE_LIMIT配置')
                 error_code_msg = '用户请求频率过快 ' + error_code_msg
         else:
             error_code = '999999'
@@ -993,10 +1118,13 @@ class StrategyMaster:
         origin_order = self.orders[strategy_id][ref_id]
         ex_acc = f"{response['exchange']}|{response['account_id']}"
 
-        ret = balance_management_common_process(self.balance_by_order_res[ex_acc], response, base, quote, origin_order)
+        rules = self.get_symbol_rules(response['exchange'], response['symbol']) or DEFAULT_RULES
+        ret = balance_management_common_process(self.balance_by_order_res[ex_acc], rules, response, base, quote, origin_order)
         if ret:
             self.balance_status[ex_acc] = True
-            logger.debug("Master Balance => ", json.dumps(self.balance_by_order_res))
+            # 只记录本次成交涉及的两个币种
+            logger.debug("Master Balance => ", ex_acc, base, Lazy(json.dumps, self.balance_by_order_res[ex_acc][base]),
+                         quote, Lazy(json.dumps, self.balance_by_order_res[ex_acc][quote]))
 
     def order_management(self, response):
         """
@@ -1005,45 +1133,47 @@ class StrategyMaster:
         """
         strategy_id = response['strategy_id']
         ref_id = response['ref_id']
+        book = self.order_store.get_book(strategy_id, ref_id)
         if response['status'] == OrderStatus.REJECTED.value:  # 发单失败, 直接在pending删除对应订单
-            origin_order = self.pending_orders[strategy_id].pop(ref_id, None)
-            if origin_order is not None:
+            if book == PENDING:
+                origin_order = self.order_store.move(strategy_id, ref_id, FINISHED)
                 origin_order['status'] = OrderStatus.REJECTED.value
-                self.finished_orders[strategy_id][ref_id] = origin_order
+                self.journal_order(strategy_id, ref_id, FINISHED)
 
         elif response['status'] == OrderStatus.PENDING.value:  # 发单成功, 收到交易所回报, 添加订单信息, 转移到active_orders
-            origin_order = self.pending_orders[strategy_id].pop(ref_id, None)
-            if origin_order is not None:
+            if book == PENDING:
+                origin_order = self.order_store.move(strategy_id, ref_id, ACTIVE)
                 origin_order['order_id'] = response['order_id']
                 origin_order['account_id'] = response['account_id']
                 origin_order['status'] = OrderStatus.PENDING.value
-                self.active_orders[strategy_id][ref_id] = origin_order
+                self.journal_order(strategy_id, ref_id, ACTIVE)
 
         elif response['status'] == OrderStatus.CANCELLED.value:  # 撤单成功, 转移订单到finished_orders
-            origin_order = self.active_orders[strategy_id].pop(ref_id, None)
-            if origin_order is not None:
+            if book == ACTIVE:
+                origin_order = self.order_store.move(strategy_id, ref_id, FINISHED)
                 if response["filled"] > 0:
                     origin_order['filled'] = response["filled"]
                     origin_order['avg_price'] = response["avg_executed_price"]
                 origin_order['status'] = OrderStatus.CANCELLED.value
-                self.finished_orders[strategy_id][ref_id] = origin_order
+                self.journal_order(strategy_id, ref_id, FINISHED)
 
         elif response['status'] == OrderStatus.PARTIALLY_FILLED.value:  # 部分成交, 若为fak单, 需要转移到active_orders
-            if ref_id in self.active_orders[strategy_id]:
+            if book == ACTIVE:
                 origin_order = self.active_orders[strategy_id][ref_id]
                 if response["filled"] > 0:
                     origin_order['filled'] = response["filled"]
                     origin_order['avg_price'] = response["avg_executed_price"]
                 origin_order['status'] = OrderStatus.PARTIALLY_FILLED.value
+                self.journal_order(strategy_id, ref_id, ACTIVE)
 
         elif response['status'] == OrderStatus.FILLED.value:  # 完全成交, 转移订单到finished_orders
-            if ref_id in self.active_orders[strategy_id]:
-                origin_order = self.active_orders[strategy_id].pop(ref_id)
+            if book == ACTIVE:
+                origin_order = self.order_store.move(strategy_id, ref_id, FINISHED)
                 if response["filled"] > 0:
                     origin_order['filled'] = response["filled"]
                     origin_order['avg_price'] = response["avg_executed_price"]
                 origin_order['status'] = OrderStatus.FILLED.value
-                self.finished_orders[strategy_id][ref_id] = origin_order
+                self.journal_order(strategy_id, ref_id, FINISHED)
 
     def get_request(self):
         """
@@ -1075,13 +1205,13 @@ class StrategyMaster:
         if not force_cancel and 'pending_cancel' in origin_order and origin_order['pending_cancel']:
             return
         origin_order['pending_cancel'] = True
-        request = {
-            'strategy': self.strategy_name,
-            'task_id': self.task_id,
-            'strategy_id': strategy_id,
-            'ref_id': ref_id,
-            'action': OrderActions.CANCEL.value,
-            'metadata': {
+        request = OrderRequest(
+            strategy=self.strategy_name,
+            task_id=self.task_id,
+            strategy_id=strategy_id,
+            ref_id=ref_id,
+            action=OrderActions.CANCEL.value,
+            metadata={
                 'exchange': origin_order['exchange'],
                 'symbol': origin_order['symbol'],
                 'order_id': origin_order['order_id'],
@@ -1092,7 +1222,7 @@ class StrategyMaster:
                 'price': origin_order['price'],
                 'quantity': origin_order['quantity']
             }
-        }
+        )
         order_info = f"{origin_order['account_id']} {origin_order['strategy_key']} {origin_order['exchange']} " \
                      f"{origin_order['symbol']} {origin_order['direction']} {origin_order['quantity']}@{origin_order['price']}"
         logger.info(f"CancelOrder => {strategy_id} {request['ref_id']} {order_info} {request['strategy']} {request['task_id']}")
@@ -1110,13 +1240,13 @@ class StrategyMaster:
             return
 
         origin_order = self.active_orders[strategy_id][ref_id]
-        request = {
-            'strategy': self.strategy_name,
-            'task_id': self.task_id,
-            'ref_id': ref_id,
-            'strategy_id': strategy_id,
-            'action': OrderActions.INSPECT.value,
-            'metadata': {
+        request = OrderRequest(
+            strategy=self.strategy_name,
+            task_id=self.task_id,
+            ref_id=ref_id,
+            strategy_id=strategy_id,
+            action=OrderActions.INSPECT.value,
+            metadata={
                 'exchange': origin_order['exchange'],
                 'symbol': origin_order['symbol'],
                 'order_id': origin_order['order_id'],
@@ -1125,9 +1255,38 @@ class StrategyMaster:
                 'direction': origin_order['direction'],
                 'strategy_key': origin_order['strategy_key']
             }
-        }
+        )
         self.send_request([self.trade_request_key, request])
 
+    def request_inspect(self, strategy_id, ref_id):
+        """
+        inspect order as soon as the rate limit of its account allows, e.g. after cancel
+        """
+        origin_order = self.active_orders[strategy_id].get(ref_id)
+        if origin_order is None:
+            return
+        if self.order_tracker.acquire(f"{origin_order['exchange']}|{origin_order['account_id']}"):
+            self.inspect_order(strategy_id, ref_id)
+        else:
+            # 令牌不够时由inspect_orders优先发送
+            self.order_tracker.mark_urgent(strategy_id, ref_id)
+
+    def inspect_orders(self):
+        """
+        inspect active orders without recent update, orders of on_order_update exchanges are trusted for
+        ORDER_UPDATE_STALE seconds, see util.order_tracker
+        """
+        orders = {(strategy_id, ref_id): order for strategy_id, book in self.active_orders.items()
+                  for ref_id, order in book.items()}
+        for strategy_id, ref_id in self.order_tracker.select(orders, self.is_order_pushed, self.get_top_of_book):
+            self.inspect_order(strategy_id, ref_id)
+
+    def is_order_pushed(self, order):
+        return bool(ORDER_UPDATE_EX.get(order['exchange']))
+
+    def get_top_of_book(self, order):
+        return self.top_of_book.get((order['exchange'], order['symbol']))
+
     def get_base_quote_name(self, symbol):
         """
         get base, quote info by symbol
@@ -1136,9 +1295,10 @@ class StrategyMaster:
         """
         return self.valid_symbols[symbol]
 
-    def send_status(self):
+    def send_status(self, force_snapshot=False):
         """
-        send algo status to UI
+        send algo status to UI, full snapshot when state changes, otherwise only deal_size/current_price/attention
+        :param force_snapshot: bool, send full snapshot even if state is unchanged
         """
         if self.status_msg.split('|')[0] == TaskStatus.WARNING.value and \
                 (datetime.now() - self.last_warning_time).total_seconds() > 10 * 60:
@@ -1170,11 +1330,15 @@ class StrategyMaster:
                     base_currency = get_total_balance(self.balance[exch_acc], base)
                     quote_currency = get_total_balance(self.balance[exch_acc], quote)
                 factor = 1 if st_task['direction'] == Direction.SELL.value else -1
+                # 按交易对精度的定点数相减, 只在展示时round, 避免 1.0 - 0.9 = 0.09999999999999998
+                rules = strat.symbol_rules.get(st_task['symbol'][0], DEFAULT_RULES)
                 if st_task["currency_type"] == CurrencyType.BASE.value:
-                    strat.deal_size = initial_balance[base] - base_currency
+                    digits = rules.size_digits
+                    deal_units = to_units(initial_balance[base], digits) - to_units(base_currency, digits)
                 else:
-                    strat.deal_size = quote_currency - initial_balance[quote]
-                strat.deal_size *= factor
+                    digits = rules.quote_digits
+                    deal_units = to_units(quote_currency, digits) - to_units(initial_balance[quote], digits)
+                strat.deal_size = from_units(deal_units * factor, digits)
 
             strat.deal_size = round(strat.deal_size, get_formated_decimal_from_number(strat.deal_size, DEAL_SIZE_MAX_DISPLAY, True))
 
@@ -1196,60 +1360,53 @@ class StrategyMaster:
                 'status_msg': strat.status_msg,
             }
         status_obj['strategies'] = strategy_status
-        self.send_request([self.config['REDIS_TASK_STATUS'], status_obj], rtype='Status', channel=PublishChannel.UI.value)
+        message = self.status_tracker.build(status_obj, force_snapshot)
+        self.send_request([self.config['REDIS_TASK_STATUS'], message], rtype='Status', channel=PublishChannel.UI.value)
 
-    def cal_current_price(self, market_data):
-        asks = market_data['metadata']['asks']
-        bids = market_data['metadata']['bids']
-        for strategy_id in self.strategies:
+    def cal_current_price(self, market_data, strategy_ids=None):
+        """
+        :param market_data: MarketMessage of orderbook, only first level is used
+        :param strategy_ids: strategies using this symbol, None means all strategies
+        """
+        ask0, bid0 = market_data.top_of_book()
+        for strategy_id in (self.strategies if strategy_ids is None else strategy_ids):
             st_task = self.task['strategies'][strategy_id]
             strat = self.strategies[strategy_id]
 
             if st_task['algorithm'] in [Algorithms.SAMPLE.value, Algorithms.ICEBERG.value, Algorithms.VWAP.value, Algorithms.TWAP.value]:
                 if market_data['symbol'] == st_task['symbol'][0]:
-                    strat.current_price = asks[0][0] if st_task['direction'] == Direction.BUY.value else bids[0][0]
+                    strat.current_price = ask0[0] if st_task['direction'] == Direction.BUY.value else bid0[0]
 
             if 'median' in st_task and market_data['symbol'] == st_task['median'][0]:
                 if 'anchor_price' not in st_task or not st_task['anchor_price']:
                     # algo use price_threshold, didn't need to compute anchor price
-                    strat.current_price = asks[0][0] if st_task['direction'] == Direction.BUY.value else bids[0][0]
+                    strat.current_price = ask0[0] if st_task['direction'] == Direction.BUY.value else bid0[0]
 
                 if strat.anchor_price <= 0:
                     # Didn't receive anchor price yet
                     strat.current_price = None
 
-                median_price = format_price((asks[0][0] + bids[0][0]) / 2, get_price_precision(st_task, '', st_task['median'][0]))
+                median_price = strat.symbol_rules[st_task['median'][0]].format_price((ask0[0] + bid0[0]) / 2)
                 if st_task['median'][2] == st_task['symbol'][2]:
                     strat.current_price = round(median_price * strat.anchor_price, 8)
                 else:
                     strat.current_price = round(median_price / strat.anchor_price, 8)
 
             if 'anchor' in st_task and market_data['symbol'] == st_task['anchor'][0]:
-                strat.anchor_price = format_price((asks[0][0] + bids[0][0]) / 2, get_price_precision(st_task, '', st_task['anchor'][0]))
+                strat.anchor_price = strat.symbol_rules[st_task['anchor'][0]].format_price((ask0[0] + bid0[0]) / 2)
 
     def save_all_order_info(self):
-        all_order_info = {
-            'pending_orders': self.pending_orders,
-            'active_orders': self.active_orders,
-            'finished_orders': self.finished_orders,
-        }
-        save_orders(all_order_info, f'{self.task["task_id"]}.json')
-
-    def inspect_order_on_time(self):
-        """
-        timely inspect all active orders of algo
-        """
-        for strategy_id in self.strategies:
-            self.strategies[strategy_id].inspect_order_on_time()
+        save_orders(self.get_order_books(), f'{self.task["task_id"]}.json')
+        # 完整订单信息已保存, journal不再需要
+        self.order_journal.close(remove=True)
 
     def cancel_all_order(self):
         """
         cancel all orders of algo
         """
         # TODO 之后考虑一下频率控制
-        for strategy_id in self.strategies:
-            for ref_id in self.active_orders[strategy_id]:
-                self.cancel_order(strategy_id, ref_id, True)
+        for strategy_id, ref_id in self.order_store.iter_active():
+            self.cancel_order(strategy_id, ref_id, True)
 
     def alarm(self, alarm_msg, alarm_code='011111'):
         """
@@ -1295,17 +1452,17 @@ class StrategyMaster:
         for strategy_id in self.strategies:
             logger.file('pending orders -------------------')
             for ref_id in self.pending_orders[strategy_id]:
-                logger.file(ref_id + ' ' + json.dumps(self.pending_orders[strategy_id][ref_id]))
+                logger.file(ref_id + ' ' + json.dumps(self.pending_orders[strategy_id][ref_id], default=encode_record))
             logger.file('\n')
 
             logger.file('active orders -------------------')
             for ref_id in self.active_orders[strategy_id]:
-                logger.file(ref_id + ' ' + json.dumps(self.active_orders[strategy_id][ref_id]))
+                logger.file(ref_id + ' ' + json.dumps(self.active_orders[strategy_id][ref_id], default=encode_record))
             logger.file('\n')
 
             logger.file('finished orders -------------------')
             for ref_id in self.finished_orders[strategy_id]:
-                logger.file(ref_id + ' ' + json.dumps(self.finished_orders[strategy_id][ref_id]))
+                logger.file(ref_id + ' ' + json.dumps(self.finished_orders[strategy_id][ref_id], default=encode_record))
             logger.file('\n')
 
     def on_send_order_response(self, send_order_response):
@@ -1394,34 +1551,34 @@ class StrategyMaster:
         pending_orders = self.pending_orders[strategy_id]
         if clean_pending:
             for ref_id in list(pending_orders.keys()):
-                pending_orders.pop(ref_id)
+                self.order_store.move(strategy_id, ref_id, None)
+                self.journal_order(strategy_id, ref_id, None)
         else:
+            # pending_orders按发单顺序排列, 遇到未超时的订单即可停止
             for ref_id in list(pending_orders.keys()):
-                if (datetime.now() - str_to_datetime(pending_orders[ref_id]['create_time'])).total_seconds() > 10 * 60:
-                    pending_orders.pop(ref_id)
+                if time_service.now_ms - time_service.str_to_ms(pending_orders[ref_id]['create_time']) <= 10 * 60 * 1000:
+                    break
+                self.order_store.move(strategy_id, ref_id, None)
+                self.journal_order(strategy_id, ref_id, None)
                         
     def get_trade_orders(self):
-        trade_orders = copy.deepcopy(self.finished_orders)
-        for strategy_id in self.active_orders:
-            if strategy_id in self.finished_orders:
-                trade_orders[strategy_id].update(self.active_orders[strategy_id])
-            else:
-                trade_orders[strategy_id] = self.active_orders[strategy_id]
-        return trade_orders
+        """
+        read-only views of finished and active orders, orders are not copied
+        """
+        return self.order_store.trade_orders()
 
     def count_unfinished_order(self):
-        count = 0
-        for strategy_id in self.pending_orders:
-            count += len(self.pending_orders[strategy_id])
-        for strategy_id in self.active_orders:
-            count += len(self.active_orders[strategy_id])
-        return count
-
-    def check_trade_precision(self, market_data):
-        price_precision = self.task['coin_config'][market_data['exchange']][market_data['symbol']]['price_precision']
-        ask0 = market_data['metadata']['asks'][0][0]
-        if not check_precison_of_number(ask0, price_precision):
-            self.alarm(f'{market_data["exchange"]} {market_data["symbol"]} price precision error! Ask0: {ask0}, price precision: {price_precision}', AlarmCode.EXECUTE_ABNORMAL.value)
+        return self.order_store.unfinished_count
+
+    def check_trade_precision(self, market_data, rules):
+        """
+        :param rules: SymbolRules of market_data symbol, None when symbol is not in coin_config
+        """
+        if rules is None:
+            return True
+        ask0 = market_data.top_of_book()[0][0]
+        if not rules.is_on_tick(ask0):
+            self.alarm(f'{market_data["exchange"]} {market_data["symbol"]} price precision error! Ask0: {ask0}, price precision: {rules.price_precision}', AlarmCode.EXECUTE_ABNORMAL.value)
             self.update_status(TaskStatus.WARNING.value, f'{market_data["symbol"]} price precision error!')
             return False
         return True
@@ -1,12 +1,14 @@
 # encoding: utf-8
 
 import random
-from datetime import datetime
+import time
 
 from config.enums import *
 from strategy.strategy_base import StrategyBase
 from util.util import *
 from util.logger import *
+from util.time_service import time_service
+from util.trade_window import TradeWindow
 
 
 class TriangleIceberg(StrategyBase):
@@ -14,8 +16,8 @@ class TriangleIceberg(StrategyBase):
         super().__init__()
         self.trading = True
         self.market_data = {}  # latest market data snapshot
-        self.last_order_time = None  # last order time
-        self.aggressive_order_time = datetime.now()  # aggressive mode send_order time
+        self.last_order_time = None  # last order time, monotonic seconds
+        self.aggressive_order_time = time.monotonic()  # aggressive mode send_order time
         self.aggressive_price_overflow = 0.01  # price more or less than price threshold in amplitude
         self.aggressive_interval = 120  # 2minutes
         self.order_interval = 5  # order interval is at least 5s
@@ -24,22 +26,15 @@ class TriangleIceberg(StrategyBase):
         self.median_stop_status = False  # median symbol stop flag, default to False
         self.anchor_stop_status = False  # anchor symbol stop flag, default to False
         self.anchor_trading = False  # whether start to do anchor trade, default to False
-        self.trade_size_in_last_minute = 0  # trade size in last minute
-        self.trade_list = []  # trade list in last minute
+        self.trade_window = TradeWindow()  # trades in last minute
         self.last_m_amount = 0  # last median symbol order size
 
     def on_trade_ready(self, trade):
         if trade['exchange'] == self.task['exchange'] and trade['symbol'] == self.task['median'][0]:
-            if len(trade['metadata']) > 0:
-                for _ in trade['metadata']:
-                    if (datetime.now() - str_to_datetime(_[1])).total_seconds() <= 60:
-                        self.trade_list.append(_)
+            self.trade_window.add_trades(trade['metadata'], time_service.now_ms)
 
     def trade_check(self):
-        if len(self.trade_list) > 0:
-            for trade in self.trade_list:
-                if (datetime.now() - str_to_datetime(trade[1])).total_seconds() > 60:
-                    self.trade_list.remove(trade)
+        self.trade_window.expire(time_service.now_ms)
 
     def on_init(self, config, task, master_ptr):
         super().on_init(config, task, master_ptr)
@@ -53,7 +48,7 @@ class TriangleIceberg(StrategyBase):
         iceberg main logic, driven by orderbook data
         :param orderbook: data format reference strategy_base
         """
-        if (datetime.now() - str_to_datetime(self.task['start_time'])).total_seconds() < 0:
+        if not self.is_started():
             # Time didn't come to start time
             return
         
@@ -67,7 +62,7 @@ class TriangleIceberg(StrategyBase):
         self.market_data[key] = orderbook
 
         if orderbook['exchange'] == self.task['exchange'] and orderbook['symbol'] == self.task['median'][0]:
-            if self.last_order_time and (datetime.now() - self.last_order_time).total_seconds() < self.order_interval:
+            if self.last_order_time and time_service.monotonic - self.last_order_time < self.order_interval:
                 # order interval is too close, wait
                 return
 
@@ -77,14 +72,12 @@ class TriangleIceberg(StrategyBase):
                 return
 
             m_symbol = self.task['median'][0]
-            m_price_precision = get_price_precision(self.task, self.task['exchange'], m_symbol)
-            m_amount_precision = get_amount_precision(self.task, self.task['exchange'], m_symbol)
+            m_rules = self.symbol_rules[m_symbol]
+            m_price_precision = m_rules.price_precision
             m_contract_type = self.task['contract_type'] if 'contract_type' in self.task else 'spot'
             m_base, m_quote = self.task['median'][1:3]
             m_direction = compute_direction(self.task, 'median')
 
-            m_base_min_order_size, m_quote_min_order_size = get_min_order_size(self.task, self.task['exchange'],
-                                                                               m_symbol)
             s_base, s_quote = self.task['symbol'][1:3]
             mid_coin = compute_mid_coin(self.task)
             post_only = True if self.task['trade_role'] == 'Maker' else False
@@ -107,7 +100,7 @@ class TriangleIceberg(StrategyBase):
                 m_price = m_price
             else:
                 m_price = m_price + m_price_precision if m_direction == Direction.BUY.value else m_price - m_price_precision
-            m_price = format_price(m_price, m_price_precision)
+            m_price = m_rules.format_price(m_price)
 
             if not m_price or m_price <= 0:
                 # price exception detect
@@ -137,7 +130,7 @@ class TriangleIceberg(StrategyBase):
 
             self.anchor_trading = True
             self.last_m_price = m_price
-            m_min_order_size = max(m_base_min_order_size, m_quote_min_order_size / m_price)
+            m_min_order_size = m_rules.min_order_size(m_price)
             # normally iceberg only have one active order, detect whether our order is at best place
             if len(self.pending_orders) > 0:
                 for ref_id in self.pending_orders:
@@ -157,7 +150,8 @@ class TriangleIceberg(StrategyBase):
                             self.cancel_order(ref_id)
                             return
 
-            tr_s = sum([_[4] for _ in self.trade_list])
+            self.trade_check()
+            tr_s = self.trade_window.size
             m_amount = cal_order_size_by_ob_tr(ob_s, tr_s, m_min_order_size, MAX_SIZE_BY_QUOTE[m_quote] / m_price)
             logger.info(f"ob_s{ob_s}; tr_s: {tr_s}; min_order_size: {m_min_order_size}; max_order_size: {MAX_SIZE_BY_QUOTE[m_quote]/m_price}; amount: {m_amount}")
             self.last_m_amount = m_amount
@@ -212,21 +206,19 @@ class TriangleIceberg(StrategyBase):
                         return
 
             m_amount = min(residual_amount, m_amount)
-            m_amount = format_amount(m_amount, m_amount_precision)
+            m_amount = m_rules.format_amount(m_amount)
 
             self.send_order(self.task['exchange'], self.task['median'][0], m_contract_type, m_price, m_amount,
                             m_direction, OrderType.LIMIT.value,
                             self.task['account'], 'triangle_iceberg', None, post_only)
-            self.last_order_time = datetime.now()
+            self.last_order_time = time_service.monotonic
 
         if orderbook['exchange'] == self.task['exchange'] and orderbook['symbol'] == self.task['anchor'][0]:
             a_direction = compute_direction(self.task, 'anchor')
             a_symbol = self.task['anchor'][0]
             a_contract_type = self.task['contract_type'] if 'contract_type' in self.task else 'spot'
-            a_price_precision = get_price_precision(self.task, self.task['exchange'], a_symbol)
-            a_amount_precision = get_amount_precision(self.task, self.task['exchange'], a_symbol)
-            a_base_min_order_size, a_quote_min_order_size = get_min_order_size(self.task, self.task['exchange'],
-                                                                               a_symbol)
+            a_rules = self.symbol_rules[a_symbol]
+            a_price_precision = a_rules.price_precision
             a_base_currency, a_quote_currency = self.task['anchor'][1:3]
             s_base, s_quote = self.task['symbol'][1:3]
 
@@ -239,7 +231,7 @@ class TriangleIceberg(StrategyBase):
             else:
                 a_price, a_size = price_filter_by_volume(a_bids, None)
             a_price = a_price - a_price_precision if a_direction == Direction.BUY.value else a_price + a_price_precision
-            a_price = format_price(a_price, a_price_precision)
+            a_price = a_rules.format_price(a_price)
             if not a_price or a_price <= 0:
                 # price abnormal
                 logger.warning('price is invalid:  {}'.format(a_price))
@@ -249,7 +241,7 @@ class TriangleIceberg(StrategyBase):
                 return
             if 'transfer_coin' in self.task and self.task['transfer_coin'] is True:
 
-                a_min_order_size = max(a_base_min_order_size, a_quote_min_order_size / a_price)
+                a_min_order_size = a_rules.min_order_size(a_price)
                 a_amount = 0
                 if self.task['direction'] == Direction.SELL.value and self.task[
                     'currency_type'] == CurrencyType.BASE.value:
@@ -300,7 +292,7 @@ class TriangleIceberg(StrategyBase):
 
                         a_amount = min(residual_amount, a_amount)
 
-                        a_amount = format_amount(a_amount, a_amount_precision)
+                        a_amount = a_rules.format_amount(a_amount)
                         if a_amount < a_min_order_size:
                             logger.info('There has enough {} {}'.format(mid_balance, mid_coin))
                             return
@@ -331,7 +323,7 @@ class TriangleIceberg(StrategyBase):
                             logger.info('There has enough {} {}'.format(mid_balance, mid_coin))
                             return
 
-                a_amount = format_amount(a_amount, a_amount_precision)
+                a_amount = a_rules.format_amount(a_amount)
                 if self.pending_orders and len(self.pending_orders) > 0:
                     for ref_id in self.pending_orders:
                         # still has order not in response
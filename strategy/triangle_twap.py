@@ -1,4 +1,3 @@
-import random
 import time
 
 from config.enums import *
@@ -14,7 +13,6 @@ class TriangleTwap(StrategyBase):
         self.base_currency = 0
         self.median_currency = 0
         self.quote_currency = 0
-        self.last_trigger = 0
         self.anchor_bid0 = 0
         self.anchor_ask0 = 0
         self.median_bid0 = 0
@@ -78,28 +76,11 @@ class TriangleTwap(StrategyBase):
 
             # define: median and anchor offset
             offset_1 = 0
-            offset_2 = get_price_offset_from_prices(direction_2, ask0_2, bid0_2, task["coin_config"][median]["price_precision"], task['execution_mode'])
+            offset_2 = get_price_offset_from_prices(direction_2, ask0_2, bid0_2, self.symbol_rules[median].price_precision, task['execution_mode'])
 
             # define: precision, decimal, min trade size
-            anchor_describe = task["coin_config"][anchor]
-            median_describe = task["coin_config"][median]
-            # anchor
-            price_pre_1 = anchor_describe["price_precision"]
-            amount_pre_1 = anchor_describe["size_precision"]
-            price_dec_1 = get_decimal_from_precision(price_pre_1)
-            amount_dec_1 = get_decimal_from_precision(amount_pre_1)
-
-            min_size_1 = max(anchor_describe["base_min_order_size"], anchor_describe["quote_min_order_size"] / bid0_1)
-            min_size_1 = math.ceil(min_size_1 / amount_pre_1) * amount_pre_1
-
-            # median
-            price_pre_2 = median_describe["price_precision"]
-            amount_pre_2 = median_describe["size_precision"]
-            price_dec_2 = get_decimal_from_precision(price_pre_2)
-            amount_dec_2 = get_decimal_from_precision(amount_pre_2)
-
-            min_size_2 = max(median_describe["base_min_order_size"], median_describe["quote_min_order_size"] / bid0_2)
-            min_size_2 = math.ceil(min_size_2 / amount_pre_2) * amount_pre_2
+            rules_1 = self.symbol_rules[anchor]
+            rules_2 = self.symbol_rules[median]
 
             if 'price_threshold' in task and task['price_threshold'] is not None:
                 price_threshold_2 = task['price_threshold']
@@ -124,31 +105,12 @@ class TriangleTwap(StrategyBase):
             direction_2 = Direction.SELL.value if task['anchor'][1] == mid_coin else Direction.BUY.value
 
             # define: median and anchor offset
-            offset_1 = get_price_offset_from_prices(direction_1, ask0_1, bid0_1, task["coin_config"][median]["price_precision"], task['execution_mode'])
+            offset_1 = get_price_offset_from_prices(direction_1, ask0_1, bid0_1, self.symbol_rules[median].price_precision, task['execution_mode'])
             offset_2 = 0
 
             # define: precision, decimal, min trade size
-            anchor_describe = task["coin_config"][anchor]
-            median_describe = task["coin_config"][median]
-            # median
-            price_pre_1 = median_describe["price_precision"]
-            amount_pre_1 = median_describe["size_precision"]
-
-            price_dec_1 = get_decimal_from_precision(price_pre_1)
-            amount_dec_1 = get_decimal_from_precision(amount_pre_1)
-
-            min_size_1 = max(median_describe["base_min_order_size"], median_describe["quote_min_order_size"] / bid0_1)
-            min_size_1 = math.ceil(min_size_1 / amount_pre_1) * amount_pre_1
-
-            # anchor
-            price_pre_2 = anchor_describe["price_precision"]
-            amount_pre_2 = anchor_describe["size_precision"]
-
-            price_dec_2 = get_decimal_from_precision(price_pre_2)
-            amount_dec_2 = get_decimal_from_precision(amount_pre_2)
-
-            min_size_2 = max(anchor_describe["base_min_order_size"], anchor_describe["quote_min_order_size"] / bid0_2)
-            min_size_2 = math.ceil(min_size_2 / amount_pre_2) * amount_pre_2
+            rules_1 = self.symbol_rules[median]
+            rules_2 = self.symbol_rules[anchor]
 
             if 'price_threshold' in task and task['price_threshold'] is not None:
                 price_threshold_2 = False
@@ -160,6 +122,11 @@ class TriangleTwap(StrategyBase):
                 price_threshold_1 = False
                 price_threshold_2 = False
 
+        price_pre_1, amount_pre_1 = rules_1.price_precision, rules_1.size_precision
+        min_size_1 = rules_1.ceil_amount(rules_1.min_order_size(bid0_1))
+        price_pre_2, amount_pre_2 = rules_2.price_precision, rules_2.size_precision
+        min_size_2 = rules_2.ceil_amount(rules_2.min_order_size(bid0_2))
+
         if not self.triangle_twap_status:
             logger.info({
                 "symbol_1": symbol_1,
@@ -167,9 +134,9 @@ class TriangleTwap(StrategyBase):
                 "bid0_1|ask0_1": [bid0_1, ask0_1],
                 "offset_1": offset_1,
                 "price_precision_1": price_pre_1,
-                "price_decimal_1": price_dec_1,
+                "price_decimal_1": rules_1.price_decimal,
                 "amount_precision_1": amount_pre_1,
-                "amount_decimal_1": amount_dec_1,
+                "amount_decimal_1": rules_1.size_decimal,
                 "min_size_1": min_size_1,
                 "price_threshold_1": price_threshold_1,
 
@@ -178,9 +145,9 @@ class TriangleTwap(StrategyBase):
                 "bid0_2|ask0_2": [bid0_2, ask0_2],
                 "offset_2": offset_2,
                 "price_precision_2": price_pre_2,
-                "price_decimal_2": price_dec_2,
+                "price_decimal_2": rules_2.price_decimal,
                 "amount_precision_2": amount_pre_2,
-                "amount_decimal_2": amount_dec_2,
+                "amount_decimal_2": rules_2.size_decimal,
                 "min_size_2": min_size_2,
                 "price_threshold_2": price_threshold_2
             })
@@ -339,7 +306,7 @@ class TriangleTwap(StrategyBase):
                     amount_2 = mid_currency - mid_ini_balance
                 else:
                     price_2 = ask0_2
-                    amount_2 = math.floor((mid_currency - mid_ini_balance) / amount_pre_2) * amount_pre_2 / ask0_2
+                    amount_2 = rules_2.format_amount(mid_currency - mid_ini_balance) / ask0_2
 
                 market_price_2 = bid0_2
                 market_amount_2 = 0
@@ -400,7 +367,7 @@ class TriangleTwap(StrategyBase):
                     if direction_1 == Direction.SELL.value:
                         amount_1 = total_size - balance_diff
                     else:
-                        amount_1 = math.floor((total_size - balance_diff) / amount_pre_1) * amount_pre_1 / ask0_1
+                        amount_1 = rules_1.format_amount(total_size - balance_diff) / ask0_1
                     amount_2 = 0
                     market_amount_2 = (mid_currency - mid_ini_balance) / ask0_2
             else:
@@ -438,10 +405,10 @@ class TriangleTwap(StrategyBase):
             "should_trade": should_trade,
             "end_balance": end_balance
         })
-        self.send_formated_order(symbol_1, direction_1, price_1, amount_1, price_pre_1, amount_pre_1, min_size_1, price_threshold_1)
-        self.send_formated_order(symbol_1, direction_1, market_price_1, market_amount_1, price_pre_1, amount_pre_1, min_size_1, price_threshold_1)
-        self.send_formated_order(symbol_2, direction_2, price_2, amount_2, price_pre_2, amount_pre_2, min_size_2, price_threshold_2, mid_coin)
-        self.send_formated_order(symbol_2, direction_2, market_price_2, market_amount_2, price_pre_2, amount_pre_2, min_size_2, price_threshold_2, mid_coin)
+        self.send_formated_order(symbol_1, direction_1, price_1, amount_1, min_size_1, price_threshold_1)
+        self.send_formated_order(symbol_1, direction_1, market_price_1, market_amount_1, min_size_1, price_threshold_1)
+        self.send_formated_order(symbol_2, direction_2, price_2, amount_2, min_size_2, price_threshold_2, mid_coin)
+        self.send_formated_order(symbol_2, direction_2, market_price_2, market_amount_2, min_size_2, price_threshold_2, mid_coin)
         return
 
     def on_response(self, response):
@@ -449,18 +416,30 @@ class TriangleTwap(StrategyBase):
         super().on_response(response)
         pass
 
-    def on_timer(self):
-        super().on_timer()
+    def set_task(self, task):
+        super().set_task(task)
+        # RESUME可能修改下单间隔, 已经注册的slice job按新的间隔执行
+        if self.scheduler is not None:
+            self.scheduler.set_period(f'{self.strategy_id}|slice', *self.slice_interval())
+
+    def slice_interval(self):
+        """
+        :return: (period, jitter) of slice job in seconds, from fixed_interval/random_interval of task in milliseconds
+        """
         if 'fixed_interval' in self.task and 'random_interval' in self.task:
-            time_inverval = (self.task["fixed_interval"] + self.task["random_interval"] * random.random()) / 1000
-        else:
-            time_inverval = 60
-        if time.time() - self.last_trigger >= time_inverval:
-            self.last_trigger = time.time()
-            if self.status != TaskStatus.PAUSED.value:
-                self.triangle_twap_start(self.task)
-        else:
-            pass
+            return self.task["fixed_interval"] / 1000, self.task["random_interval"] / 1000
+        return 60, 0
+
+    def register_jobs(self, scheduler):
+        super().register_jobs(scheduler)
+        # 每隔 fixed_interval + random_interval * random() 毫秒下一次单, 第一次在启动TIME_INTERVAL秒之后, 等待行情到达
+        period, jitter = self.slice_interval()
+        scheduler.add_job(f'{self.strategy_id}|slice', self.on_slice, period, jitter,
+                          priority=JobPriority.STRATEGY.value, delay=self.config['TIME_INTERVAL'])
+
+    def on_slice(self):
+        if self.status != TaskStatus.PAUSED.value:
+            self.triangle_twap_start(self.task)
 
     def on_finish(self):
         super().on_finish()
@@ -470,18 +449,23 @@ class TriangleTwap(StrategyBase):
         self.update_status(TaskStatus.FINISHED.value, 'Triangle TWAP has finished!')
         self.on_finish()
 
-    def send_formated_order(self, symbol, direction, price, amount, price_precision, amount_precision, min_size, price_threshold=False, mid_coin=False):
-        price = format_price(price, price_precision)
-        amount = format_amount(amount, amount_precision)
-        if mid_coin:
-            amount = amount_adjust(amount, amount_precision, min_size) if amount > min_size else 0
+    def send_formated_order(self, symbol, direction, price, amount, min_size, price_threshold=False, mid_coin=False):
+        # 价格和数量按整数的tick/lot计算, 只在发单时换算成float
+        rules = self.symbol_rules[symbol]
+        ticks = rules.price_to_ticks(price)
+        lots = rules.amount_to_lots(amount)
+        if mid_coin and lots * rules.lot_units <= rules.size_units(min_size):
+            lots = 0
         else:
-            amount = amount_adjust(amount, amount_precision, min_size)
+            lots = rules.adjust_lots(lots, rules.ceil_lots(min_size))
         if price_threshold:
+            price_units = ticks * rules.tick_units
+            threshold_units = rules.price_units(price_threshold)
             if direction == Direction.SELL.value:
-                amount = 0 if price < price_threshold else amount
+                lots = 0 if price_units < threshold_units else lots
             else:
-                amount = 0 if price > price_threshold else amount
-        if amount:
-            self.send_order(self.task["exchange"], symbol, 'spot', price, amount, direction, OrderType.LIMIT.value, self.task["account"],
+                lots = 0 if price_units > threshold_units else lots
+        if lots:
+            self.send_order(self.task["exchange"], symbol, 'spot', rules.ticks_to_price(ticks), rules.lots_to_amount(lots), direction,
+                            OrderType.LIMIT.value, self.task["account"],
                             'TriangleTwap', self.order_delay)
\ No newline at end of file
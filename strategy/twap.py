@@ -1,5 +1,4 @@
 
-import random
 import time
 
 from config.enums import *
@@ -14,7 +13,6 @@ class Twap(StrategyBase):
         self.twap_status = False
         self.base_currency = 0
         self.quote_currency = 0
-        self.last_trigger = 0
         self.bid0 = 0
         self.ask0 = 0
         self.market_order_coefficient = 0.05
@@ -59,11 +57,10 @@ class Twap(StrategyBase):
             logger.error("ask0, bid0 value error!")
             return
 
-        sym_describe = task["coin_config"][symbol]
-        price_precision = sym_describe["price_precision"]
-        amount_precision = sym_describe["size_precision"]
-        min_size = max(sym_describe["base_min_order_size"], sym_describe["quote_min_order_size"] / bid0)
-        min_size = math.ceil(min_size / amount_precision) * amount_precision
+        rules = self.symbol_rules[symbol]
+        price_precision = rules.price_precision
+        amount_precision = rules.size_precision
+        min_size = rules.ceil_amount(rules.min_order_size(bid0))
 
         offset = get_price_offset_from_prices(direction, ask0, bid0, price_precision, task['execution_mode'])
         # 2. check time and account status
@@ -201,7 +198,7 @@ class Twap(StrategyBase):
                     if total_size - balance_diff <= 2 * max(single_amount, 2 * min_size * ask0):
                         amount = 0
                         market_price = ask0
-                        market_amount = math.floor((total_size - balance_diff) / market_price / amount_precision) * amount_precision
+                        market_amount = rules.format_amount((total_size - balance_diff) / market_price)
                 else:
                     balance_diff = base_currency - ini_balance
                     amount = 0 if balance_diff >= should_trade else single_amount
@@ -238,8 +235,8 @@ class Twap(StrategyBase):
             "should_trade": should_trade,
         })
         price_threshold = False if 'price_threshold' not in task or task["price_threshold"] is None else task["price_threshold"]
-        self.send_formated_order(symbol, direction, price, amount, price_precision, amount_precision, min_size, price_threshold)
-        self.send_formated_order(symbol, direction, market_price, market_amount, price_precision, amount_precision, min_size, price_threshold)
+        self.send_formated_order(symbol, direction, price, amount, min_size, price_threshold)
+        self.send_formated_order(symbol, direction, market_price, market_amount, min_size, price_threshold)
         return
 
     def on_response(self, response):
@@ -247,18 +244,30 @@ class Twap(StrategyBase):
         super().on_response(response)
         pass
 
-    def on_timer(self):
-        super().on_timer()
+    def set_task(self, task):
+        super().set_task(task)
+        # RESUME可能修改下单间隔, 已经注册的slice job按新的间隔执行
+        if self.scheduler is not None:
+            self.scheduler.set_period(f'{self.strategy_id}|slice', *self.slice_interval())
+
+    def slice_interval(self):
+        """
+        :return: (period, jitter) of slice job in seconds, from fixed_interval/random_interval of task in milliseconds
+        """
         if 'fixed_interval' in self.task and 'random_interval' in self.task:
-            time_inverval = (self.task["fixed_interval"] + self.task["random_interval"] * random.random()) / 1000
-        else:
-            time_inverval = 60
-        if time.time() - self.last_trigger >= time_inverval:
-            self.last_trigger = time.time()
-            if self.status != TaskStatus.PAUSED.value:
-                self.twap_start(self.task)
-        else:
-            pass
+            return self.task["fixed_interval"] / 1000, self.task["random_interval"] / 1000
+        return 60, 0
+
+    def register_jobs(self, scheduler):
+        super().register_jobs(scheduler)
+        # 每隔 fixed_interval + random_interval * random() 毫秒下一次单, 第一次在启动TIME_INTERVAL秒之后, 等待行情到达
+        period, jitter = self.slice_interval()
+        scheduler.add_job(f'{self.strategy_id}|slice', self.on_slice, period, jitter,
+                          priority=JobPriority.STRATEGY.value, delay=self.config['TIME_INTERVAL'])
+
+    def on_slice(self):
+        if self.status != TaskStatus.PAUSED.value:
+            self.twap_start(self.task)
 
     def on_finish(self):
         super().on_finish()
@@ -268,15 +277,19 @@ class Twap(StrategyBase):
         self.update_status(TaskStatus.FINISHED.value, 'TWAP has finished!')
         self.on_finish()
 
-    def send_formated_order(self, symbol, direction, price, amount, price_precision, amount_precision, min_size, price_threshold):
-        price = format_price(price, price_precision)
-        amount = format_amount(amount, amount_precision)
-        amount = amount_adjust(amount, amount_precision, min_size)
+    def send_formated_order(self, symbol, direction, price, amount, min_size, price_threshold):
+        # 价格和数量按整数的tick/lot计算, 只在发单时换算成float
+        rules = self.symbol_rules[symbol]
+        ticks = rules.price_to_ticks(price)
+        lots = rules.adjust_lots(rules.amount_to_lots(amount), rules.ceil_lots(min_size))
         if price_threshold:
+            price_units = ticks * rules.tick_units
+            threshold_units = rules.price_units(price_threshold)
             if direction == Direction.SELL.value:
-                amount = 0 if price < price_threshold else amount
+                lots = 0 if price_units < threshold_units else lots
             else:
-                amount = 0 if price > price_threshold else amount
-        if amount:
-            self.send_order(self.task["exchange"], symbol, 'spot', price, amount, direction, OrderType.LIMIT.value, self.task["account"],
+                lots = 0 if price_units > threshold_units else lots
+        if lots:
+            self.send_order(self.task["exchange"], symbol, 'spot', rules.ticks_to_price(ticks), rules.lots_to_amount(lots), direction,
+                            OrderType.LIMIT.value, self.task["account"],
                             'Twap', self.order_delay)
\ No newline at end of file
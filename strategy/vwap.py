@@ -1,12 +1,13 @@
 # encoding: utf-8
 #
 import random
-from datetime import datetime
 import json
+import time
 
 from config.enums import *
 from strategy.strategy_base import StrategyBase
 from util.logger import logger
+from util.time_service import time_service
 from util.util import *
 
 
@@ -24,7 +25,7 @@ class Vwap(StrategyBase):
         self.mkr_unused_tsp = 0  # market volume not used timestamp
         self.market_data = {}  # latest market data
         self.trade_data = {}  # trade data store
-        self.last_order_time = datetime.now()  # latest send order time
+        self.last_order_time = time.monotonic()  # latest send order time, monotonic seconds
         self.order_interval = 5  # order interval is at least 5s
         self.avg_vol_ref_mins = 0  # history avg size in minutes
 
@@ -57,14 +58,14 @@ class Vwap(StrategyBase):
         vwap main logic, driven by orderbook data
         :param orderbook: data format reference strategy_base
         """
-        if (datetime.now() - str_to_datetime(self.task['start_time'])).total_seconds() < 0:
+        if not self.is_started():
             # Time didn't come to start time
             return
         key = '|'.join([orderbook['exchange'], orderbook['symbol'], orderbook['contract_type'], 'orderbook'])
         self.market_data[key] = orderbook
         symbol = self.task['symbol'][0]
         if orderbook['exchange'] == self.task['exchange'] and orderbook['symbol'] == symbol:
-            if self.last_order_time and (datetime.now() - self.last_order_time).total_seconds() < 3:
+            if self.last_order_time and time_service.monotonic - self.last_order_time < 3:
                 # order interval is too close, wait
                 return
 
@@ -82,11 +83,9 @@ class Vwap(StrategyBase):
                 return
             base_currency, quote_currency = self.task['symbol'][1:3]
 
-            price_precision = get_price_precision(self.task, self.task['exchange'], self.task['symbol'][0])
-            amount_precision = get_amount_precision(self.task, self.task['exchange'], self.task['symbol'][0])
+            rules = self.symbol_rules[symbol]
+            price_precision = rules.price_precision
             contract_type = self.task['contract_type'] if 'contract_type' in self.task else 'spot'
-            base_min_order_size, quote_min_order_size = get_min_order_size(self.task, self.task['exchange'],
-                                                                           self.task['symbol'][0])
             bal_diff = get_total_balance(iceberg_balance, base_currency) - self.task['initial_balance'][base_currency]
 
             cum_exec_vol = bal_diff if self.task['direction'] == Direction.BUY.value else -bal_diff
@@ -96,10 +95,10 @@ class Vwap(StrategyBase):
                                         self.task['total_size'], cum_exec_vol)
                 logger.info(f"market_cum_vol: {self.market_cum_vol}; cum_exec_vol: {cum_exec_vol}; amount: {amount}")
             else:
-                if (datetime.now() - self.last_order_time).total_seconds() < 60:
+                if time_service.monotonic - self.last_order_time < 60:
                     # execute every minute
                     return
-                if (datetime.now() - get_datetime(self.last_kline_timestamp)).total_seconds() > 120:
+                if time_service.now_ms - time_service.pdt_to_ms(self.last_kline_timestamp) > 120 * 1000:
                     # avoid outdated data, for exchange kline is not updated or updated by rest
                     self.last_kline_size_of_market = 0
                 self.last_kline_size_of_customer = cum_exec_vol - self.customer_cum_vol_exclude_last_minute
@@ -126,7 +125,7 @@ class Vwap(StrategyBase):
                 # only maker and no spread, set price to bid0 or ask0
                 price = price
 
-            price = format_price(price, price_precision)
+            price = rules.format_price(price)
 
             if not price or price <= 0:
                 logger.warning(f"{self.task['symbol'][0]} price is not valid: {price}")
@@ -148,7 +147,7 @@ class Vwap(StrategyBase):
                 # compute_executed_volume(self.finished_orders)
                 remain_amount = self.task['total_size'] - diff
 
-            min_order_size = max(base_min_order_size, quote_min_order_size / price)
+            min_order_size = rules.min_order_size(price)
             logger.file(f'remain_amount: {remain_amount}; price: {price}; min_order_size: {min_order_size}')
 
             if abs(diff) >= self.task['total_size'] or remain_amount < min_order_size:
@@ -162,14 +161,14 @@ class Vwap(StrategyBase):
 
             amount = min(remain_amount, amount)
 
-            amount = format_amount(amount, amount_precision)
+            amount = rules.format_amount(amount)
 
             if not amount or amount <= min_order_size:
                 # parameter is illegal
                 logger.file(f'amount size is {amount}, lower than min_order_size {min_order_size}')
                 # self.update_status(TaskStatus.WARNING.value, 'amount size is lower than min_order_size: {}'.format(min_order_size))
                 if self.mkr_unused_tsp != self.last_kline_timestamp \
-                        and (datetime.now() - get_datetime(self.last_kline_timestamp)).total_seconds() > 60:
+                        and time_service.now_ms - time_service.pdt_to_ms(self.last_kline_timestamp) > 60 * 1000:
                     self.cum_vol_not_used_of_market += self.last_kline_size_of_market
                     logger.info(f'cum_vol_not_used: {self.cum_vol_not_used_of_market}')
                     self.mkr_unused_tsp = self.last_kline_timestamp
@@ -185,13 +184,13 @@ class Vwap(StrategyBase):
                     self.send_order(self.task['exchange'], symbol, contract_type, price, amount,
                                     self.task['direction'], OrderType.LIMIT.value,
                                     self.task['account'], 'vwap', None, post_only)
-                    self.last_order_time = datetime.now()
+                    self.last_order_time = time_service.monotonic
             else:
                 # no price limit
                 self.send_order(self.task['exchange'], symbol, contract_type, price, amount,
                                 self.task['direction'], OrderType.LIMIT.value,
                                 self.task['account'], 'vwap', None, post_only)
-                self.last_order_time = datetime.now()
+                self.last_order_time = time_service.monotonic
 
     def on_response(self, response):
         super().on_response(response)
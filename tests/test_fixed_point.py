@@ -0,0 +1,205 @@
+# encoding: utf-8
+# SymbolRules/BalanceBook的定点数计算 vs util中原来的float实现, 随机数据用固定的seed生成, 失败时可以复现
+# float实现在十进制的tie(8000.015)和lot的整数倍(9369.0 / 1e-05 = 936899999.9999999)附近结果取决于二进制误差,
+# 这些点单独检查定点数的结果, 其余的点两者必须一致
+# 用法: python -m pytest -q tests/test_fixed_point.py
+import os
+import sys
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+import random
+from decimal import Decimal
+
+from config.enums import Direction, OrderStatus
+from util.fixed_point import BalanceBook, from_units
+from util.symbol_rules import GUARD_DIGITS, SymbolRules
+from util.util import amount_adjust, balance_management_common_process, check_precison_of_number, format_amount, \
+    format_price, increase_reserved_amount
+
+SEED = 20261017
+ROUNDS = 20000
+# (price_precision, size_precision, 价格的数量级)
+PRECISIONS = [(0.01, 1e-06, 60000), (0.1, 0.0001, 3000), (1e-08, 1.0, 0.0001), (0.0001, 0.01, 2),
+              (1e-05, 0.1, 0.5), (1.0, 1e-08, 30000), (0.5, 0.001, 1000), (0.05, 0.01, 20)]
+# 离tie/lot边界不到这个比例的点, float实现的结果不确定
+BAND = 10 ** -(GUARD_DIGITS - 1)
+
+
+def all_rules():
+    return [SymbolRules('Binance', f'S{i}', price_precision, size_precision)
+            for i, (price_precision, size_precision, _) in enumerate(PRECISIONS)]
+
+
+def fraction(value, step):
+    """
+    exact fractional part of value / step, from the decimal repr of both floats
+    """
+    quotient = Decimal(repr(value)) / Decimal(repr(step))
+    return quotient - int(quotient)
+
+
+def test_format_price_matches_float():
+    rng = random.Random(SEED)
+    for rules, (_, _, magnitude) in zip(all_rules(), PRECISIONS):
+        for _ in range(ROUNDS):
+            price = rng.uniform(0.01, 2) * magnitude
+            if abs(fraction(price, rules.price_precision) - Decimal('0.5')) < BAND:
+                continue
+            expected = format_price(price, rules.price_precision)
+            if rules.price_tick != 1:
+                # 0.5/0.05的tick, 原实现只round到小数位数
+                expected = round(price / rules.price_precision) * rules.price_tick / rules.price_scale
+            assert rules.format_price(price) == expected, (rules.price_precision, price)
+
+
+def test_format_price_decimal_tie_to_even():
+    rng = random.Random(SEED)
+    for rules in all_rules():
+        for _ in range(ROUNDS // 10):
+            ticks = rng.randrange(1, 10 ** 6)
+            # 半tick处的十进制数, 例如 8000.015
+            price = (2 * ticks + 1) * rules.price_tick / (2 * rules.price_scale)
+            assert rules.price_to_ticks(price) == ticks + ticks % 2, (rules.price_precision, price)
+
+
+def test_format_amount_matches_float():
+    rng = random.Random(SEED)
+    for rules in all_rules():
+        for _ in range(ROUNDS):
+            amount = rng.uniform(0, 1000)
+            part = fraction(amount, rules.size_precision)
+            if part < BAND or part > 1 - BAND:
+                continue
+            assert rules.format_amount(amount) == format_amount(amount, rules.size_precision), (rules.size_precision, amount)
+
+
+def test_format_amount_keeps_multiples_of_lot():
+    rng = random.Random(SEED)
+    for rules in all_rules():
+        for _ in range(ROUNDS // 10):
+            amount = rules.lots_to_amount(rng.randrange(0, 10 ** 8))
+            assert rules.format_amount(amount) == amount, (rules.size_precision, amount)
+            assert rules.ceil_amount(amount) == amount, (rules.size_precision, amount)
+
+
+def test_adjust_amount_matches_float():
+    rng = random.Random(SEED)
+    for rules in all_rules():
+        for _ in range(ROUNDS):
+            min_size = rules.lots_to_amount(rng.randrange(1, 100)) * rng.uniform(0.5, 1)
+            amount = rng.uniform(0, 3) * min_size
+            for value in (amount, min_size):
+                part = fraction(value, rules.size_precision)
+                if part < BAND or part > 1 - BAND:
+                    break
+            else:
+                amount = rules.format_amount(amount)
+                expected = amount_adjust(amount, rules.size_precision, min_size)
+                assert rules.adjust_amount(amount, min_size) == expected, (rules.size_precision, amount, min_size)
+
+
+def test_is_on_tick_matches_float():
+    rng = random.Random(SEED)
+    for rules, (_, _, magnitude) in zip(all_rules(), PRECISIONS):
+        max_ticks = max(2, int(2 * magnitude / rules.price_precision))
+        for _ in range(ROUNDS):
+            price = rules.ticks_to_price(rng.randrange(1, max_ticks))
+            assert rules.is_on_tick(price), (rules.price_precision, price)
+            assert check_precison_of_number(price, rules.price_precision), (rules.price_precision, price)
+            off_tick = rules.ticks_to_price(rng.randrange(1, max_ticks) * 100 + rng.randrange(1, 100)) / 100
+            assert not rules.is_on_tick(off_tick), (rules.price_precision, off_tick)
+            assert not check_precison_of_number(off_tick, rules.price_precision), (rules.price_precision, off_tick)
+
+
+def run_order(rng, rules, balance, expected, direction):
+    """
+    reserve one order, fill it in parts at random prices not worse than the limit price, then fill or cancel the rest;
+    expected is the float ledger {currency: total} updated the way the old implementation did
+    """
+    max_ticks = max(2, int(2 * PRECISIONS[int(rules.symbol[1:])][2] / rules.price_precision))
+    price = rules.ticks_to_price(rng.randrange(1, max_ticks))
+    quantity = rules.lots_to_amount(rng.randrange(1, 10 ** 5))
+    increase_reserved_amount(balance, rules, 'BASE', 'QUOTE', direction, quantity, price)
+
+    origin_order = {'filled': 0, 'avg_price': 0}
+    filled_lots, cost = 0, 0
+    total_lots = rules.amount_to_lots(quantity)
+    factor = 1 if direction == Direction.BUY.value else -1
+    while True:
+        step = rng.randrange(0, total_lots - filled_lots + 1)
+        filled_lots += step
+        fill_price = rules.ticks_to_price(rng.randrange(1, rules.price_to_ticks(price) + 1)) if direction == Direction.BUY.value \
+            else rules.ticks_to_price(rules.price_to_ticks(price) + rng.randrange(0, 100))
+        cost += rules.lots_to_amount(step) * fill_price
+        filled = rules.lots_to_amount(filled_lots)
+        avg_price = cost / filled if filled_lots else 0
+        if filled_lots == total_lots:
+            status = OrderStatus.FILLED.value
+        elif rng.random() < 0.2:
+            status = OrderStatus.CANCELLED.value
+        else:
+            status = OrderStatus.PARTIALLY_FILLED.value
+        resp = {'status': status, 'direction': direction, 'filled': filled, 'avg_executed_price': avg_price,
+                'original_price': price, 'original_amount': quantity}
+        balance_management_common_process(balance, rules, resp, 'BASE', 'QUOTE', origin_order)
+
+        expected['BASE'] += (filled - origin_order['filled']) * factor
+        expected['QUOTE'] -= (filled * avg_price - origin_order['filled'] * origin_order['avg_price']) * factor
+        origin_order = {'filled': filled, 'avg_price': avg_price}
+        if status != OrderStatus.PARTIALLY_FILLED.value:
+            return
+
+
+def test_balance_book_netting():
+    rng = random.Random(SEED)
+    for rules in all_rules():
+        initial = {'BASE': 10 ** 6, 'QUOTE': 10 ** 10}
+        balance = BalanceBook(initial)
+        expected = dict(initial)
+        for _ in range(ROUNDS // 100):
+            run_order(rng, rules, balance, expected, rng.choice([Direction.BUY.value, Direction.SELL.value]))
+            # 成交或撤单之后占用量精确回到0
+            for currency in ('BASE', 'QUOTE'):
+                assert balance.units[currency][1] == 0, (rules.symbol, currency)
+                assert balance[currency]['reserved'] == 0
+                assert balance[currency]['available'] == balance[currency]['total']
+        for currency in ('BASE', 'QUOTE'):
+            total = from_units(balance.units[currency][0], balance.digits[currency])
+            assert total == balance[currency]['total']
+            assert abs(total - expected[currency]) <= 1e-9 * initial[currency], (rules.symbol, currency)
+
+
+def test_balance_book_mixed_precision():
+    # 同一个币种被不同精度的交易对交易, 账本扩展精度时已有的占用量保持不变
+    rng = random.Random(SEED)
+    rules_list = all_rules()
+    balance = BalanceBook({'BASE': 10 ** 6, 'QUOTE': 10 ** 10})
+    open_orders = []
+    # 先按精度从粗到细各下一单, 保证扩展精度时已有占用量
+    coarse_to_fine = sorted(rules_list, key=lambda rules: (rules.size_digits, rules.quote_digits))
+    for i in range(ROUNDS // 10):
+        rules = coarse_to_fine[i] if i < len(coarse_to_fine) else rng.choice(rules_list)
+        order = (rules, rng.choice([Direction.BUY.value, Direction.SELL.value]),
+                 rules.lots_to_amount(rng.randrange(1, 10 ** 4)), rules.ticks_to_price(rng.randrange(1, 10 ** 4)))
+        increase_reserved_amount(balance, order[0], 'BASE', 'QUOTE', *order[1:])
+        open_orders.append(order)
+    rng.shuffle(open_orders)
+    for rules, direction, quantity, price in open_orders:
+        resp = {'status': OrderStatus.CANCELLED.value, 'direction': direction, 'filled': 0, 'avg_executed_price': 0,
+                'original_price': price, 'original_amount': quantity}
+        balance_management_common_process(balance, rules, resp, 'BASE', 'QUOTE', {'filled': 0, 'avg_price': 0})
+    assert balance.units['BASE'] == [10 ** (6 + balance.digits['BASE']), 0]
+    assert balance.units['QUOTE'] == [10 ** (10 + balance.digits['QUOTE']), 0]
+
+
+def test_balance_book_keeps_units_exact():
+    # 0.1 + 0.2在float账本中是0.30000000000000004
+    rules = SymbolRules('Binance', 'BTCUSDT', 0.01, 0.1)
+    balance = BalanceBook({'BTC': 0, 'USDT': 0})
+    for quantity in (0.1, 0.2):
+        increase_reserved_amount(balance, rules, 'BTC', 'USDT', Direction.SELL.value, quantity, 8000.01)
+    assert balance['BTC']['reserved'] == 0.3
+    increase_reserved_amount(balance, rules, 'BTC', 'USDT', Direction.BUY.value, 0.3, 0.1)
+    assert balance['USDT']['reserved'] == 0.03
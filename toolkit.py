@@ -11,6 +11,7 @@ from config.enums import *
 from config.config import CONFIG_GLOBAL
 from util.logger import *
 from util.aredis import RedisHandler
+from util.book_store import book_store
 
 
 class Toolkit:
@@ -226,11 +227,13 @@ class Toolkit:
         self.send_request([self.trade_request_key, json.dumps(request), PublishChannel.PDT.value])
         # self.requests.append([[self.trade_request_key, json.dumps(request, PublishChannel.PDT.value)])
 
-    def get_orderbook_snapshot(self, exchange, symbol):
-        key = '|'.join(exchange, symbol, 'spot', 'orderbook')
-        if key in self.market_data:
-            data = self.market_data[key]
-            print(data)
+    def get_orderbook_snapshot(self, exchange, symbol, contract_type='spot'):
+        """
+        latest orderbook from shared memory of this host, no redis subscription needed
+        """
+        data = book_store.read(exchange, symbol, contract_type)
+        print(data)
+        return data
 
     def send_request(self, req, rtype='PDT', channel=PublishChannel.PDT.value):
         self.requests.append({
@@ -0,0 +1,256 @@
+# encoding: utf-8
+# 本机共享的最新orderbook: 每个 exchange|symbol|contract_type 一块 multiprocessing.shared_memory, 通过numpy数组读写
+# 收到行情的driver写入, 本机其他driver/balance/toolkit直接读内存, 不需要订阅redis
+# 每个symbol同一时间只有一个写入进程: 拿到该symbol文件锁(flock)的进程, 进程退出或不再订阅时释放, 由其他收到行情的进程接替
+# seqlock: 写入前seq变为奇数, 写完变为偶数; 读到奇数或前后seq不一致时重读, 保证asks/bids/timestamp来自同一条行情
+# 内存布局(float64): [seq, timestamp_ms, ask档数, bid档数, depth, asks(price, size) * depth, bids(price, size) * depth]
+# 用法: book_store.write(exchange, symbol, contract_type, asks, bids, timestamp_ms)
+#       book = book_store.read(exchange, symbol, contract_type); book['asks'][0], book['timestamp_ms']
+import fcntl
+import os
+import re
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from config.config import CONFIG_GLOBAL, sentry
+from util.logger import logger
+
+SEQ, TIMESTAMP, ASK_COUNT, BID_COUNT, DEPTH = range(5)
+HEADER_SIZE = 5
+LEVEL_WIDTH = 2  # price, size; 期货深度中的第三列(币数量)不保存
+READ_RETRIES = 1000  # 写入进程在两次读之间改写了数据时的重读次数, 一次写入只需要微秒级
+LOCK_RETRY_INTERVAL = 1  # 没有拿到写锁的symbol, 每隔1秒再尝试接替写入
+
+
+def segment_name(exchange, symbol, contract_type):
+    # shared_memory名字中不能有'/', 只保留字母数字
+    return re.sub(r'[^0-9A-Za-z]', '_', f"{CONFIG_GLOBAL['BOOK_STORE_PREFIX']}_{exchange}_{symbol}_{contract_type}")
+
+
+def to_levels(levels):
+    """
+    :param levels: [[price, size], ...] or [[price, contracts, coins], ...] of futures
+    :return: np.ndarray of shape (len(levels), LEVEL_WIDTH)
+    """
+    try:
+        array = np.asarray(levels, dtype=np.float64)
+    except ValueError:
+        array = None
+    if array is None or array.ndim != 2:
+        # 空列表或者每档长度不一致
+        array = np.asarray([level[:LEVEL_WIDTH] for level in levels], dtype=np.float64).reshape(-1, LEVEL_WIDTH)
+    return array[:, :LEVEL_WIDTH]
+
+
+def attach(name, depth=None):
+    """
+    open shared memory segment of a book, create it when depth is given and it doesn't exist
+    :return: (SharedMemory, np.ndarray), None when it doesn't exist
+    """
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        if depth is None:
+            return None
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=(HEADER_SIZE + depth * LEVEL_WIDTH * 2) * 8)
+            np.ndarray((HEADER_SIZE,), dtype=np.float64, buffer=shm.buf)[DEPTH] = depth
+        except FileExistsError:
+            shm = shared_memory.SharedMemory(name=name)
+    # 共享内存在进程退出后保留, 给之后启动的进程继续使用; 不交给resource_tracker, 否则进程退出时会被unlink
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    header = np.ndarray((HEADER_SIZE,), dtype=np.float64, buffer=shm.buf)
+    if header[DEPTH] == 0:
+        # 写入进程刚创建, 还没有写入depth
+        del header
+        shm.close()
+        return None
+    array = np.ndarray((HEADER_SIZE + int(header[DEPTH]) * LEVEL_WIDTH * 2,), dtype=np.float64, buffer=shm.buf)
+    return shm, array
+
+
+class BookWriter:
+    """
+    write side of one book, holds the file lock of the symbol while writing
+    """
+
+    def __init__(self, name, depth):
+        self.name = name
+        self.depth = depth
+        self.lock_path = os.path.join(CONFIG_GLOBAL['BOOK_STORE_LOCK_DIR'], name + '.lock')
+        self.lock_fd = None
+        self.next_try = 0  # 没有拿到锁时下一次尝试的时间(monotonic)
+        self.shm = None
+        self.array = None
+
+    @property
+    def owned(self):
+        return self.lock_fd is not None
+
+    def try_lock(self, now):
+        if now < self.next_try:
+            return False
+        self.next_try = now + LOCK_RETRY_INTERVAL
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self.lock_fd = fd
+        if self.shm is None:
+            segment = attach(self.name, self.depth)
+            if segment is None:
+                self.release()
+                return False
+            self.shm, self.array = segment
+        return True
+
+    def write(self, asks, bids, timestamp_ms):
+        array = self.array
+        depth = int(array[DEPTH])
+        # 转换在seq变为奇数之前完成, 读者需要重读的窗口只有内存拷贝
+        ask_levels = to_levels(asks[:depth])
+        bid_levels = to_levels(bids[:depth])
+        levels = array[HEADER_SIZE:].reshape(2, depth, LEVEL_WIDTH)
+        seq = array[SEQ]
+        array[SEQ] = seq + 1
+        array[TIMESTAMP] = timestamp_ms
+        array[ASK_COUNT] = len(ask_levels)
+        array[BID_COUNT] = len(bid_levels)
+        levels[0, :len(ask_levels)] = ask_levels
+        levels[1, :len(bid_levels)] = bid_levels
+        array[SEQ] = seq + 2
+
+    def release(self):
+        if self.lock_fd is not None:
+            fcntl.flock(self.lock_fd, fcntl.LOCK_UN)
+            os.close(self.lock_fd)
+            self.lock_fd = None
+        if self.shm is not None:
+            self.array = None
+            self.shm.close()
+            self.shm = None
+
+
+class BookStore:
+    """
+    latest orderbook of each symbol on this host in shared memory
+    """
+
+    def __init__(self):
+        self.depth = CONFIG_GLOBAL['BOOK_STORE_DEPTH']
+        self.writers = {}  # (exchange, symbol, contract_type) -> BookWriter
+        self.readers = {}  # (exchange, symbol, contract_type) -> np.ndarray on shared memory
+        self.segments = {}  # (exchange, symbol, contract_type) -> SharedMemory of readers
+        self.failed = False  # 写入出错只记录一次, 共享内存只是辅助, 不影响行情分发
+
+    def get_writer(self, key):
+        writer = self.writers.get(key)
+        if writer is None:
+            writer = self.writers[key] = BookWriter(segment_name(*key), self.depth)
+        return writer
+
+    def owns(self, exchange, symbol, contract_type):
+        """
+        whether this process writes the book, tries to take over the lock when the book has no writer
+        """
+        writer = self.get_writer((exchange, symbol, contract_type))
+        if writer.owned:
+            return True
+        try:
+            return writer.try_lock(time.monotonic())
+        except Exception as e:
+            self.on_error(e)
+            return False
+
+    def write(self, exchange, symbol, contract_type, asks, bids, timestamp_ms):
+        """
+        :param asks: [[price, size], ...], best price first
+        :param bids: [[price, size], ...], best price first
+        :param timestamp_ms: epoch ms of market data
+        :return: bool, False when another process writes this book
+        """
+        if not self.owns(exchange, symbol, contract_type):
+            return False
+        try:
+            self.writers[(exchange, symbol, contract_type)].write(asks, bids, timestamp_ms)
+        except Exception as e:
+            self.on_error(e)
+            return False
+        return True
+
+    def write_message(self, market_data):
+        """
+        write orderbook MarketMessage, depth is only decoded by the process that owns the book
+        """
+        if not self.owns(market_data.exchange, market_data.symbol, market_data.contract_type):
+            return False
+        try:
+            metadata = market_data['metadata']
+            asks, bids, timestamp_ms = metadata['asks'], metadata['bids'], market_data.timestamp_ms
+        except Exception as e:
+            self.on_error(e)
+            return False
+        return self.write(market_data.exchange, market_data.symbol, market_data.contract_type, asks, bids, timestamp_ms)
+
+    def release(self, exchange, symbol, contract_type):
+        """
+        stop writing the book, e.g. no task of this process subscribes it any more
+        """
+        writer = self.writers.pop((exchange, symbol, contract_type), None)
+        if writer is not None:
+            writer.release()
+
+    def read(self, exchange, symbol, contract_type='spot'):
+        """
+        :return: {'asks': [[price, size], ...], 'bids': [...], 'timestamp_ms': int, 'seq': int},
+                 None when the book has never been written on this host or is being written too often to read
+        """
+        key = (exchange, symbol, contract_type)
+        array = self.readers.get(key)
+        if array is None:
+            segment = attach(segment_name(*key))
+            if segment is None:
+                return None
+            self.segments[key], array = segment
+            self.readers[key] = array
+        for _ in range(READ_RETRIES):
+            seq = array[SEQ]
+            if seq == 0:
+                return None  # 还没有写入过
+            if seq % 2:
+                continue  # 正在写入
+            snapshot = array.copy()
+            if array[SEQ] != seq or snapshot[SEQ] != seq:
+                continue
+            depth = int(snapshot[DEPTH])
+            levels = snapshot[HEADER_SIZE:].reshape(2, depth, LEVEL_WIDTH)
+            return {
+                'asks': levels[0, :int(snapshot[ASK_COUNT])].tolist(),
+                'bids': levels[1, :int(snapshot[BID_COUNT])].tolist(),
+                'timestamp_ms': int(snapshot[TIMESTAMP]),
+                'seq': int(seq)
+            }
+        return None
+
+    def on_error(self, e):
+        if not self.failed:
+            self.failed = True
+            logger.error('book store error:', e)
+            sentry.captureException()
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.release()
+        self.writers = {}
+        # 先释放numpy数组, 否则SharedMemory.close会因为buffer仍被引用而失败
+        self.readers = {}
+        for shm in self.segments.values():
+            shm.close()
+        self.segments = {}
+
+
+book_store = BookStore()
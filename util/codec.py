@@ -0,0 +1,113 @@
+# encoding: utf-8
+# 所有redis消息的json编解码, 由CONFIG_GLOBAL['JSON_CODEC']选择实现:
+# auto(按orjson > msgspec > ujson > json顺序选择已安装的库), 或者指定orjson/msgspec/ujson/json
+# 用法: codec.loads(message['data']), codec.dumps(body, default=encode_record), dumps总是返回str
+import json
+from collections import namedtuple
+
+from config.config import CONFIG_GLOBAL
+from config.enums import MarketDataType
+from util.records import Record
+
+
+def _json_dumps(obj, default=None):
+    return json.dumps(obj, default=default)
+
+
+def _select_backend(name):
+    """
+    :return: (backend name, loads, dumps)
+    """
+    candidates = ['orjson', 'msgspec', 'ujson'] if name == 'auto' else [name]
+    for candidate in candidates:
+        try:
+            if candidate == 'orjson':
+                import orjson
+                option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+                def dumps(obj, default=None):
+                    try:
+                        return orjson.dumps(obj, default=default, option=option).decode()
+                    except TypeError:
+                        # 超过64位的整数等orjson不支持的情况, 使用标准库
+                        return json.dumps(obj, default=default)
+                return candidate, orjson.loads, dumps
+
+            if candidate == 'msgspec':
+                import msgspec
+                decoder = msgspec.json.Decoder()
+
+                def dumps(obj, default=None):
+                    try:
+                        return msgspec.json.encode(obj, enc_hook=default).decode()
+                    except (TypeError, msgspec.EncodeError):
+                        return json.dumps(obj, default=default)
+                return candidate, decoder.decode, dumps
+
+            if candidate == 'ujson':
+                import ujson
+
+                def dumps(obj, default=None):
+                    try:
+                        return ujson.dumps(obj, ensure_ascii=False, default=default)
+                    except (TypeError, OverflowError):
+                        return json.dumps(obj, default=default)
+                return candidate, ujson.loads, dumps
+        except ImportError:
+            continue
+    return 'json', json.loads, _json_dumps
+
+
+BACKEND, loads, dumps = _select_backend(CONFIG_GLOBAL['JSON_CODEC'])
+
+
+# -------- typed decode of market data, fields are the same as pdt messages --------
+
+# 与pdt的list格式一致, trade[1]和trade.timestamp都可以使用
+TradeTick = namedtuple('TradeTick', ['id', 'timestamp', 'price', 'side', 'size'])
+FutureTradeTick = namedtuple('FutureTradeTick', ['id', 'timestamp', 'price', 'side', 'size', 'coin_size'])
+KlineBar = namedtuple('KlineBar', ['timestamp', 'open', 'close', 'high', 'low', 'volume'])
+TRADE_TYPES = {5: TradeTick, 6: FutureTradeTick}
+
+
+class OrderBookData(Record):
+    """
+    metadata of orderbook message, asks/bids: [[price, size], ...]
+    """
+    __slots__ = ('asks', 'bids', 'timestamp')
+
+
+class MarketData(Record):
+    """
+    market data message, metadata is OrderBookData for orderbook, list of TradeTick for trade, list of KlineBar for kline,
+    json dict/list for other data types
+    """
+    __slots__ = ('exchange', 'symbol', 'contract_type', 'data_type', 'metadata', 'timestamp',
+                 'range', 'subscribed_kline_size')
+
+
+def decode_metadata(data_type, metadata):
+    """
+    :param data_type: MarketDataType value
+    :param metadata: decoded json metadata
+    """
+    if data_type == MarketDataType.ORDERBOOK.value:
+        return OrderBookData.from_dict(metadata)
+    if data_type == MarketDataType.TRADE.value:
+        # 未知格式保持原样
+        return [TRADE_TYPES[len(trade)](*trade) if len(trade) in TRADE_TYPES else trade for trade in metadata]
+    if data_type == MarketDataType.KLINE.value:
+        return [KlineBar(*bar) if len(bar) == 6 else bar for bar in metadata]
+    return metadata
+
+
+def decode_market_data(data):
+    """
+    decode market data message into typed record
+    :param data: raw message from redis
+    :return: MarketData
+    """
+    message = MarketData.from_dict(loads(data))
+    if 'metadata' in message and 'data_type' in message:
+        message.metadata = decode_metadata(message.data_type, message.metadata)
+    return message
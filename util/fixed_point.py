@@ -0,0 +1,80 @@
+# encoding: utf-8
+# 定点数余额账本: 每个币种的total/reserved保存为 value * 10^digits 的整数, 加减和比较都是精确的, 不会累积浮点误差
+# digits来自交易该币种的交易对(util.symbol_rules.SymbolRules): base按size_digits, quote按quote_digits(数量 * 价格),
+# 账本只会扩展到更细的精度(整数乘以10^n), 已有的余额始终保持精确
+# 只在边界转换: 下单/成交的数量和价格由SymbolRules换算成整数, 对外展示的dict视图用from_units换算回float
+# 用法: balance = BalanceBook(initial_balance); increase_reserved_amount(balance, rules, ...); balance['BTC']['total']
+
+POW10 = [10 ** i for i in range(64)]
+# 初始余额的精度, 币种第一次被交易时按交易对的精度扩展
+INITIAL_DIGITS = 8
+
+
+def to_units(value, digits):
+    """
+    0.1, 3 -> 100; the float is rounded to the nearest unit once
+    """
+    return round(value * POW10[digits])
+
+
+def from_units(units, digits):
+    """
+    :return: float nearest to units / 10^digits, int / int division in python is correctly rounded
+    """
+    return units / POW10[digits]
+
+
+class BalanceBook(dict):
+    """
+    {currency: {'total', 'available', 'reserved', 'shortable'}} as before, so readers and json.dumps are unchanged;
+    the float values are only a view of integer ledgers in self.units and are rewritten on every update
+    """
+
+    def __init__(self, initial_balance=None):
+        super().__init__()
+        self.units = {}  # currency -> [total, reserved], in 10^-digits
+        self.digits = {}  # currency -> digits of the ledger
+        for currency, total in (initial_balance or {}).items():
+            self.set_total(currency, total)
+
+    def set_total(self, currency, total):
+        """
+        reset currency to total with nothing reserved
+        """
+        digits = self.digits.setdefault(currency, INITIAL_DIGITS)
+        units = to_units(total, digits)
+        self.units[currency] = [units, 0]
+        value = from_units(units, digits)
+        self[currency] = {"total": value, "available": value, "reserved": 0, "shortable": 0}
+
+    def align(self, currency, units, digits):
+        """
+        :return: units in the digits of the ledger, the ledger is rescaled first when digits is finer
+        """
+        ledger_digits = self.digits[currency]
+        if digits <= ledger_digits:
+            return units * POW10[ledger_digits - digits]
+        factor = POW10[digits - ledger_digits]
+        ledger = self.units[currency]
+        ledger[0] *= factor
+        ledger[1] *= factor
+        self.digits[currency] = digits
+        return units
+
+    def add_reserved(self, currency, units, digits):
+        units = self.align(currency, units, digits)
+        ledger = self.units[currency]
+        ledger[1] += units
+        self[currency]["reserved"] = from_units(ledger[1], self.digits[currency])
+
+    def add_total(self, currency, units, digits):
+        """
+        total changes with a fill, available is recomputed as total - reserved
+        """
+        units = self.align(currency, units, digits)
+        ledger = self.units[currency]
+        ledger[0] += units
+        digits = self.digits[currency]
+        view = self[currency]
+        view["total"] = from_units(ledger[0], digits)
+        view["available"] = from_units(ledger[0] - ledger[1], digits)
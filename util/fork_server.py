@@ -0,0 +1,99 @@
+# encoding: utf-8
+# master与zygote(fork server, 见zygote.py)之间的协议: unix domain socket上的文本行
+# master -> zygote: b'fork\n'                 fork一个driver
+# zygote -> master: b'forked <pid>\n'         对fork请求的回复, 按请求顺序返回
+#                   b'exit <pid> <code>\n'    zygote回收了一个driver, code为负数时表示被信号结束
+# 用法: client = ZygoteClient(path); await client.connect(); pid = await client.fork(); code = await client.wait(pid)
+import asyncio
+import os
+
+FORK = b'fork\n'
+FORKED = 'forked'
+EXIT = 'exit'
+
+
+def exit_code(status):
+    """
+    :param status: status of os.waitpid
+    :return: exit code like asyncio.subprocess.Process.returncode, -signal when killed by signal
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+class ZygoteClient:
+    """
+    connection of master to the zygote of its host
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.writer = None
+        self.reader_task = None
+        self.pending = []  # futures of fork requests waiting for reply, in order
+        self.exits = {}  # pid -> future of exit code
+
+    @property
+    def connected(self):
+        return self.writer is not None
+
+    async def connect(self):
+        reader, self.writer = await asyncio.open_unix_connection(self.path)
+        self.reader_task = asyncio.ensure_future(self.read_process(reader))
+
+    async def fork(self):
+        """
+        :return: pid of the forked driver
+        """
+        future = asyncio.get_event_loop().create_future()
+        self.pending.append(future)
+        self.writer.write(FORK)
+        await self.writer.drain()
+        return await future
+
+    async def wait(self, pid):
+        """
+        :return: exit code of driver, raise ConnectionError when the zygote exits before the driver
+        """
+        future = self.exits.get(pid)
+        if future is None:
+            raise ConnectionError('driver is not forked by current zygote connection')
+        try:
+            return await future
+        finally:
+            self.exits.pop(pid, None)
+
+    async def read_process(self, reader):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                fields = line.decode().split()
+                if fields[0] == FORKED and self.pending:
+                    pid = int(fields[1])
+                    # 在回复fork之前登记, driver立即退出时exit消息可能在fork()返回之前到达
+                    self.exits[pid] = asyncio.get_event_loop().create_future()
+                    future = self.pending.pop(0)
+                    if not future.done():
+                        future.set_result(pid)
+                elif fields[0] == EXIT:
+                    future = self.exits.get(int(fields[1]))
+                    if future is not None and not future.done():
+                        future.set_result(int(fields[2]))
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        zygote exited or connection lost: pending forks fail, drivers already forked are no longer reported,
+        their futures are removed by wait
+        """
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        for future in self.pending + list(self.exits.values()):
+            if not future.done():
+                future.set_exception(ConnectionError('zygote connection lost'))
+        self.pending = []
@@ -1,29 +1,181 @@
 # encoding: utf-8
+import contextvars
+import json
 import os
 import sys
-import traceback
-from datetime import datetime
+import threading
+import time
+from collections import deque
 
-from config.config import ROOT_PATH
+from config.config import ROOT_PATH, CONFIG_GLOBAL
 from util.alioss import alioss
 
+SINK_OSS = 'oss'
+SINK_FILE = 'file'
+SINK_STDOUT = 'stdout'  # local_debug模式下代替oss和本地文件
+JSON_RECORD = '{"ts":"%s","lvl":"%s","src":"%s","msg":%s}\n'  # 本地文件的json lines格式, 字段固定
+LOW_LEVELS = ('DEBUG', 'INFO', 'FILE')  # 队列满时优先丢弃的级别
 
-def format_msg(level, *args):
-    caller = traceback.extract_stack()[-3]
-    filepath, filename = os.path.split(caller[0])
+LEVELS = {'DEBUG': 10, 'FILE': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+
+_code_names = {}  # code object -> 'file.py/func', 调用位置只缓存文件名和函数名, 行号每次从frame读取
+
+
+def format_parts(depth, args):
+    """
+    :param depth: frame depth of the caller, relative to format_parts
+    :param args: log arguments, joined with space
+    :return: (time string, 'file.py/func:line', message)
+    """
+    # 通过frame取调用位置, 不再用traceback遍历整个调用栈
+    frame = sys._getframe(depth)
+    code = frame.f_code
+    name = _code_names.get(code)
+    if name is None:
+        name = _code_names[code] = f'{os.path.basename(code.co_filename)}/{code.co_name}'
     msg = ' '.join([str(x) for x in args])
-    return f'{datetime.now().strftime("%Y%m%d %H:%M:%S.%f")[0:-3]} {level}[{filename}/{caller[2]}:{caller[1]}] {msg}'
+    return format_time(), f'{name}:{frame.f_lineno}', msg
+
+
+_second_cache = [0, '']  # [epoch second, 'YYYYmmdd HH:MM:SS'], 同一秒内只格式化毫秒部分
+
+
+def format_time():
+    now = time.time()
+    second = int(now)
+    if second != _second_cache[0]:
+        _second_cache[0] = second
+        _second_cache[1] = time.strftime("%Y%m%d %H:%M:%S", time.localtime(second))
+    return f'{_second_cache[1]}.{int((now - second) * 1000):03d}'
+
+
+def format_msg(level, *args):
+    # frame 0: format_parts, 1: format_msg, 2: 日志方法, 3: 调用者
+    ts, src, msg = format_parts(3, args)
+    return f'{ts} {level}[{src}] {msg}'
+
+
+class Lazy:
+    """
+    defer building a log argument until the line is really formatted,
+    e.g. logger.debug('Master Balance =>', Lazy(json.dumps, balance))
+    """
+    __slots__ = ('func', 'args')
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def __str__(self):
+        return str(self.func(*self.args))
+
+
+class LogShipper:
+    """
+    ship log lines to oss and local file in a background thread;
+    hot path only appends to a bounded queue, small flushes are coalesced into one oss append
+    """
+    def __init__(self):
+        self.queue = deque()  # (sink, level, line), deque的append/popleft线程安全
+        self.capacity = CONFIG_GLOBAL['LOG_QUEUE_SIZE']
+        self.dropped = {}  # level -> dropped count, 队列满时按级别丢弃
+        self.wakeup = threading.Event()
+        self.stopped = False
+        self.thread = None
+        self.file_name = ''
+        self.oss_pos = 0
+        self.file_handler = None
+        self.oss_pending = []  # oss写入失败时保留, 下次合并重试
+        self.ship_lock = threading.Lock()  # close()的最后一次ship可能和后台线程的ship同时进行, oss_pos/oss_pending需要互斥
+
+    def start(self, file_name, oss_pos, file_handler):
+        self.file_name = file_name
+        self.oss_pos = oss_pos
+        self.file_handler = file_handler
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='log_shipper', daemon=True)
+            self.thread.start()
+
+    def put(self, sink, level, line):
+        """
+        append a line to queue, never block; when queue is full, DEBUG/INFO lines are dropped first,
+        WARNING/ERROR lines are kept until twice of capacity
+        """
+        size = len(self.queue)
+        if size >= self.capacity and (level in LOW_LEVELS or size >= 2 * self.capacity):
+            self.dropped[level] = self.dropped.get(level, 0) + 1
+            return
+        self.queue.append((sink, level, line))
+
+    def notify(self):
+        self.wakeup.set()
+
+    def run(self):
+        while not self.stopped:
+            # 在一个间隔内合并所有flush, 队列积压超过一半时立即写出
+            self.wakeup.wait(CONFIG_GLOBAL['LOG_SHIP_INTERVAL'])
+            self.wakeup.clear()
+            self.ship()
+            if len(self.queue) < self.capacity / 2:
+                time.sleep(CONFIG_GLOBAL['LOG_SHIP_INTERVAL'])
+
+    def ship(self):
+        """
+        drain queue, write local file and append oss in one request
+        """
+        with self.ship_lock:
+            oss_lines, file_lines = self.oss_pending, []
+            self.oss_pending = []
+            for _ in range(len(self.queue)):
+                sink, level, line = self.queue.popleft()
+                if sink == SINK_OSS:
+                    oss_lines.append(line)
+                else:
+                    file_lines.append(line)
+            if self.dropped:
+                dropped, self.dropped = self.dropped, {}
+                oss_lines.append(format_msg('WARNING ', f'log queue full, dropped lines: {dropped}') + '\n')
+
+            if file_lines and self.file_handler is not None:
+                try:
+                    self.file_handler.write(''.join(file_lines))
+                    self.file_handler.flush()
+                except Exception:
+                    pass
+
+            if oss_lines:
+                try:
+                    # 向阿里云oss写入日志信息, 并后移oss文件指针
+                    self.oss_pos = alioss.file_append(self.file_name, self.oss_pos, ''.join(oss_lines))
+                except Exception:
+                    # 写入失败时保留, 超过容量则丢弃最早的日志
+                    if len(oss_lines) > self.capacity:
+                        self.dropped['OSS'] = self.dropped.get('OSS', 0) + len(oss_lines) - self.capacity
+                        oss_lines = oss_lines[-self.capacity:]
+                    self.oss_pending = oss_lines
+
+    def close(self, timeout=5):
+        """
+        stop background thread and ship remaining lines, used before process exit
+        """
+        self.stopped = True
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+        # join超时时后台线程可能仍在ship, ship_lock保证两次ship串行
+        self.ship()
 
 
 class EaasLog:
     def __init__(self):
-        self.string_buffer = ''
-        self.file_buffer = ''
-        self.file_handler = None  # 打开的文件无需关闭, 因为时刻会flush, 最后会被回收机制自动关闭
+        self.shipper = LogShipper()
         self.file_name = ''
         self.file_link = ''
-        self.oss_pos = 0
         self.local_debug = False
+        # 每个输出端的日志级别, 低于所有输出端级别的日志直接返回, 参数不会被格式化
+        self.levels = {sink: LEVELS[level] for sink, level in CONFIG_GLOBAL['LOG_LEVEL'].items()}
+        self.file_format = CONFIG_GLOBAL['LOG_FILE_FORMAT']  # 本地日志格式, text/json
 
     def init(self, file_name, local_debug=False):
         self.local_debug = local_debug
@@ -32,59 +184,94 @@ class EaasLog:
 
         self.file_name = file_name
         self.file_link = alioss.sign_url(file_name)
-        self.oss_pos = alioss.update_pos_if_exist(file_name)
+        oss_pos = alioss.update_pos_if_exist(file_name)
 
         log_dir = os.path.join(ROOT_PATH, 'log')
         if not os.path.exists(log_dir):
             os.mkdir(log_dir)
-        self.file_handler = open(os.path.join(log_dir, file_name), 'a+')
+        # 打开的文件无需关闭, 因为时刻会flush, 最后会被回收机制自动关闭
+        self.shipper.start(file_name, oss_pos, open(os.path.join(log_dir, file_name), 'a+'))
 
     def flush(self):
-        try:
-            if len(self.string_buffer) > 0:
-                # 向阿里云oss写入日志信息, 并后移oss文件指针
-                self.oss_pos = alioss.file_append(self.file_name, self.oss_pos, self.string_buffer)
-                self.string_buffer = ''
-
-            if len(self.file_buffer) > 0:
-                # 写入本地日志文件, 并且flush
-                self.file_handler.write(self.file_buffer)
-                self.file_buffer = ''
-                self.file_handler.flush()
-        except Exception:  # 如果发生异常, 就下次再flush
-            pass
+        """
+        wake up background shipper, never block caller
+        """
+        self.shipper.notify()
 
-    def debug(self, *args):
+    def close(self):
+        """
+        ship all buffered logs synchronously, call before process exit
+        """
+        self.shipper.close()
+
+    def emit(self, level, sinks, args):
+        """
+        format the line once and put it to every sink whose level is enabled
+        :param level: key of LEVELS
+        :param sinks: sinks this method writes to, stdout is used instead in local_debug mode
+        :param args: log arguments
+        """
+        value = LEVELS[level]
         if self.local_debug:
-            print(format_msg('DEBUG ', *args))
-        else:
-            self.string_buffer += format_msg('DEBUG ', *args) + '\n'
-            self.file_buffer += format_msg('', *args) + '\n'
+            if value >= self.levels[SINK_STDOUT]:
+                # frame 0: format_parts, 1: emit, 2: 日志方法, 3: 调用者
+                ts, src, msg = format_parts(3, args)
+                print(f'{ts} {level} [{src}] {msg}')
+            return
+
+        enabled = [sink for sink in sinks if value >= self.levels[sink]]
+        if not enabled:
+            return
+        ts, src, msg = format_parts(3, args)
+        for sink in enabled:
+            if sink == SINK_OSS:
+                self.shipper.put(SINK_OSS, level, f'{ts} {level} [{src}] {msg}\n')
+            elif self.file_format == 'json':
+                self.shipper.put(SINK_FILE, level, JSON_RECORD % (ts, level, src, json.dumps(msg, ensure_ascii=False)))
+            else:
+                self.shipper.put(SINK_FILE, level, f'{ts} [{src}] {msg}\n')
+
+    def debug(self, *args):
+        self.emit('DEBUG', (SINK_OSS, SINK_FILE), args)
 
     def info(self, *args):
-        if self.local_debug:
-            print(format_msg('INFO ', *args))
-        else:
-            self.string_buffer += format_msg('INFO ', *args) + '\n'
+        self.emit('INFO', (SINK_OSS,), args)
 
     def warning(self, *args):
-        if self.local_debug:
-            print(format_msg('WARNING ', *args))
-        else:
-            self.string_buffer += format_msg('WARNING ', *args) + '\n'
+        self.emit('WARNING', (SINK_OSS,), args)
 
     def error(self, *args):
-        if self.local_debug:
-            print(format_msg('ERROR ', *args))
-        else:
-            self.string_buffer += format_msg('ERROR ', *args) + '\n'
+        self.emit('ERROR', (SINK_OSS,), args)
 
     # 写本地日志文件
     def file(self, *args):
-        if self.local_debug:
-            print(format_msg('FILE ', *args))
-        else:
-            self.file_buffer += format_msg('', *args) + '\n'
+        self.emit('FILE', (SINK_FILE,), args)
+
+
+_task_log = contextvars.ContextVar('task_log', default=None)
+
+
+class LogRouter:
+    """
+    logger of current task: a driver hosting several tasks binds an EaasLog to the context of each task,
+    so callbacks of a task write to its own log file; code outside any task uses the default log
+    """
+    def __init__(self):
+        self.default_log = EaasLog()
+
+    @staticmethod
+    def bind(log):
+        """
+        use log for the current context, e.g. context.run(logger.bind, EaasLog())
+        """
+        _task_log.set(log)
+
+    def current(self):
+        return _task_log.get() or self.default_log
+
+    def __getattr__(self, name):
+        # 返回绑定到当前EaasLog的方法, 不增加调用栈层数, format_parts的depth不变
+        return getattr(self.current(), name)
 
 
-logger = EaasLog()
+logger = LogRouter()
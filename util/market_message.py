@@ -0,0 +1,118 @@
+# encoding: utf-8
+import re
+
+from util import codec
+from util.time_service import time_service
+
+# 行情消息的头部字段只出现在最外层, metadata中只有asks/bids/timestamp或list, 可以直接从原始字符串中匹配
+HEADER_RE = {key: re.compile(r'"%s"\s*:\s*"([^"]*)"' % key) for key in ('exchange', 'symbol', 'contract_type', 'data_type')}
+# 最外层的timestamp是最后一个字段时, 后面只有一个'}'; metadata中的timestamp后面至少还有两个'}'
+TIMESTAMP_RE = re.compile(r'"timestamp"\s*:\s*"?(\d+)"?\s*}\s*$')
+NUMBER = r'(-?[\d.]+(?:[eE][-+]?\d+)?)'
+TOP_LEVEL_RE = {side: re.compile(r'"%s"\s*:\s*\[\s*\[\s*%s\s*,\s*%s' % (side, NUMBER, NUMBER)) for side in ('asks', 'bids')}
+
+
+class MarketMessage:
+    """
+    lazily decoded market data message:
+    header (exchange, symbol, contract_type, data_type) is matched from raw string when created, used to drop messages
+    that are not subscribed; top_of_book() and timestamp are matched without decoding depth, used by paused task;
+    the whole message is decoded by codec.decode_market_data only when other fields are touched,
+    after that it behaves like a dict, e.g. message['metadata']['asks'][:10]
+    """
+    __slots__ = ('raw', 'exchange', 'symbol', 'contract_type', 'data_type', '_data', '_top', '_timestamp', '_timestamp_ms')
+
+    def __init__(self, raw):
+        self.raw = raw
+        for key, pattern in HEADER_RE.items():
+            match = pattern.search(raw)
+            setattr(self, key, match.group(1) if match is not None else None)
+        self._data = None
+        self._top = None
+        self._timestamp = None
+        self._timestamp_ms = None
+
+    @property
+    def data(self):
+        """
+        :return: codec.MarketData, decoded at first access
+        """
+        if self._data is None:
+            self._data = codec.decode_market_data(self.raw)
+        return self._data
+
+    @property
+    def decoded(self):
+        return self._data is not None
+
+    @property
+    def timestamp(self):
+        if self._timestamp is None:
+            match = TIMESTAMP_RE.search(self.raw[-64:]) if self._data is None else None
+            self._timestamp = match.group(1) if match is not None else self.data['timestamp']
+        return self._timestamp
+
+    @property
+    def timestamp_ms(self):
+        """
+        epoch ms of timestamp, parsed once for all strategies
+        """
+        if self._timestamp_ms is None:
+            self._timestamp_ms = time_service.pdt_to_ms(self.timestamp)
+        return self._timestamp_ms
+
+    def top_of_book(self):
+        """
+        first level of orderbook without decoding other levels
+        :return: ([ask0_price, ask0_size], [bid0_price, bid0_size])
+        """
+        if self._top is None:
+            ask = TOP_LEVEL_RE['asks'].search(self.raw) if self._data is None else None
+            bid = TOP_LEVEL_RE['bids'].search(self.raw) if ask is not None else None
+            if bid is not None:
+                self._top = ([float(ask.group(1)), float(ask.group(2))], [float(bid.group(1)), float(bid.group(2))])
+            else:
+                metadata = self.data['metadata']
+                self._top = (metadata['asks'][0], metadata['bids'][0])
+        return self._top
+
+    def __getitem__(self, key):
+        if key in ('exchange', 'symbol', 'contract_type', 'data_type'):
+            return getattr(self, key)
+        if key == 'timestamp':
+            return self.timestamp
+        return self.data[key]
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def keys(self):
+        return self.data.keys()
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return self.raw
+
+    def to_dict(self):
+        return self.data.to_dict()
+
+
+class MarketRoute:
+    """
+    routing of one (exchange, symbol, data_type), see StrategyMaster.build_market_route
+    """
+    __slots__ = ('subscription', 'strategy_ids', 'handlers', 'rules')
+
+    def __init__(self, subscription, strategy_ids, handlers, rules):
+        self.subscription = subscription  # subscribe_key['market_data']中的记录, 没有订阅时为None
+        self.strategy_ids = strategy_ids  # 关注该symbol的策略
+        self.handlers = handlers  # 关注该symbol的策略回调函数
+        self.rules = rules  # SymbolRules, 用于检查行情的价格精度
@@ -0,0 +1,72 @@
+# encoding: utf-8
+# 本机行情转发: relay.py 对每个行情频道只在pdt redis订阅一次, 通过unix domain socket把原始消息转发给本机的driver
+# frame格式: 头部(payload长度, channel长度, relay收到消息的时间) + channel + payload, 消息内容不做任何转换
+# driver发给relay的订阅命令使用同样的frame, channel为SUBSCRIBE/UNSUBSCRIBE, payload为行情频道
+# 用法: client = RelayClient(path); await client.connect(); await client.subscribe(channels); channel, data, relay_time = await client.read()
+import asyncio
+import struct
+
+FRAME_HEADER = struct.Struct('!IHd')  # payload长度, channel长度, relay收到消息的epoch时间(秒)
+SUBSCRIBE = b'+'
+UNSUBSCRIBE = b'-'
+
+
+def encode_frame(channel, payload, relay_time=0.0):
+    """
+    :param channel: bytes
+    :param payload: bytes
+    :return: list of bytes, written by writer.writelines without joining
+    """
+    return [FRAME_HEADER.pack(len(payload), len(channel), relay_time), channel, payload]
+
+
+async def read_frame(reader):
+    """
+    :param reader: asyncio.StreamReader
+    :return: (channel, payload, relay_time), channel and payload are bytes
+    """
+    payload_len, channel_len, relay_time = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    body = await reader.readexactly(channel_len + payload_len)
+    return body[:channel_len], body[channel_len:], relay_time
+
+
+class RelayClient:
+    """
+    connection of a driver to the market relay of its host
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.reader = None
+        self.writer = None
+
+    @property
+    def connected(self):
+        return self.writer is not None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = None
+        self.writer = None
+
+    async def send_command(self, command, channels):
+        for channel in channels:
+            self.writer.writelines(encode_frame(command, channel.encode()))
+        await self.writer.drain()
+
+    async def subscribe(self, channels):
+        await self.send_command(SUBSCRIBE, channels)
+
+    async def unsubscribe(self, channels):
+        await self.send_command(UNSUBSCRIBE, channels)
+
+    async def read(self):
+        """
+        :return: (channel, data, relay_time), channel and data are str
+        """
+        channel, payload, relay_time = await read_frame(self.reader)
+        return channel.decode(), payload.decode(), relay_time
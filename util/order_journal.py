@@ -0,0 +1,116 @@
+# encoding: utf-8
+import json
+import os
+
+from config.config import ROOT_PATH, CONFIG_GLOBAL
+from util.order_store import BOOKS
+from util.records import encode_record
+
+
+class OrderJournal:
+    """
+    append-only journal of order state transitions, used to recover orders after driver restart
+    journal line: [strategy_id, ref_id, book, order], book is one of BOOKS or None(order removed),
+    every line is the full order at that moment, so replay is idempotent and only the last line of a ref_id counts
+    snapshot: {'pending_orders': {}, 'active_orders': {}, 'finished_orders': {}}, same format as orders/<task_id>.json
+    """
+    def __init__(self):
+        self.journal_path = ''
+        self.snapshot_path = ''
+        self.file_handler = None
+        self.records = 0  # 上次压缩之后写入的记录数
+        self.dirty = False  # 有未fsync的记录
+
+    def open(self, task_id):
+        order_dir = os.path.join(ROOT_PATH, 'orders')
+        if not os.path.exists(order_dir):
+            os.mkdir(order_dir)
+        self.journal_path = os.path.join(order_dir, f'{task_id}.journal')
+        self.snapshot_path = os.path.join(order_dir, f'{task_id}.snapshot.json')
+
+    def load(self):
+        """
+        read snapshot and replay journal
+        :return: dict of BOOKS, None if there is no history
+        """
+        if not os.path.isfile(self.snapshot_path) and not os.path.isfile(self.journal_path):
+            return None
+
+        books = {book: {} for book in BOOKS}
+        if os.path.isfile(self.snapshot_path):
+            with open(self.snapshot_path, 'r') as f:
+                books.update(json.load(f))
+
+        if os.path.isfile(self.journal_path):
+            with open(self.journal_path, 'r') as f:
+                for line in f:
+                    try:
+                        strategy_id, ref_id, book, order = json.loads(line)
+                    except ValueError:
+                        # 进程被杀时最后一行可能不完整, 之前的记录都已写入
+                        break
+                    for name in BOOKS:
+                        books[name].setdefault(strategy_id, {}).pop(ref_id, None)
+                    if book is not None:
+                        books[book][strategy_id][ref_id] = order
+        return books
+
+    def start(self, books):
+        """
+        write current orders as snapshot and start an empty journal
+        :param books: dict of BOOKS
+        """
+        self.compact(books)
+
+    def record(self, strategy_id, ref_id, book, order):
+        """
+        append one state transition, line buffered so that it reaches os at once; fsync is batched in sync()
+        """
+        if self.file_handler is None:
+            return
+        self.file_handler.write(json.dumps([strategy_id, ref_id, book, order], default=encode_record) + '\n')
+        self.records += 1
+        self.dirty = True
+
+    def sync(self, books):
+        """
+        called on timer: fsync journal, compact when journal is large enough
+        :param books: dict of BOOKS, current orders in memory
+        """
+        if self.file_handler is None:
+            return
+        if self.records >= CONFIG_GLOBAL['ORDER_JOURNAL_COMPACT_SIZE']:
+            self.compact(books)
+        elif self.dirty:
+            os.fsync(self.file_handler.fileno())
+            self.dirty = False
+
+    def compact(self, books):
+        """
+        write snapshot atomically, then truncate journal;
+        if process dies in between, old journal is replayed on new snapshot, result is the same
+        """
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(books, f, default=encode_record)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+        if self.file_handler is not None:
+            self.file_handler.close()
+        self.file_handler = open(self.journal_path, 'w', buffering=1)
+        self.records = 0
+        self.dirty = False
+
+    def close(self, remove=False):
+        """
+        :param remove: remove journal and snapshot, used when orders have been saved to orders/<task_id>.json
+        """
+        if self.file_handler is not None:
+            self.file_handler.close()
+            self.file_handler = None
+        if remove:
+            for path in (self.journal_path, self.snapshot_path):
+                if os.path.isfile(path):
+                    os.remove(path)
@@ -0,0 +1,129 @@
+# encoding: utf-8
+from collections import ChainMap
+from types import MappingProxyType
+
+PENDING = 'pending_orders'  # 已经发单到PDT, 但是暂时还没有收到PDT回复, 没有order_id
+ACTIVE = 'active_orders'  # 发单收到PDT回复, 有order_id, 需要定时inspect查询状态
+FINISHED = 'finished_orders'  # 所有已经完结的订单, filled/cancelled/rejected
+BOOKS = (PENDING, ACTIVE, FINISHED)
+
+
+class OrderEntry:
+    """
+    index entry of one order, shared by all indexes of OrderStore
+    """
+    __slots__ = ('strategy_id', 'ref_id', 'book', 'order')
+
+    def __init__(self, strategy_id, ref_id, book, order):
+        self.strategy_id = strategy_id
+        self.ref_id = ref_id
+        self.book = book  # PENDING/ACTIVE/FINISHED, None means removed from books
+        self.order = order
+
+
+class OrderStore:
+    """
+    orders of all strategies, every order is kept once and moved between status books in O(1)
+    books are plain dicts keyed by strategy_id then ref_id, strategies keep references to their own books,
+    so books are never replaced, only updated in place
+    """
+    def __init__(self):
+        self.orders = {}  # 所有策略的发单记录
+        self.pending_orders = {}
+        self.active_orders = {}
+        self.finished_orders = {}
+        self.books = {PENDING: self.pending_orders, ACTIVE: self.active_orders, FINISHED: self.finished_orders}
+
+        self.entries = {}  # (strategy_id, ref_id) -> OrderEntry
+        self.by_order_id = {}  # 'exchange|symbol|order_id' -> OrderEntry, 用于on_order_update映射
+        self.unfinished_count = 0  # pending + active 订单数
+
+    def add_strategy(self, strategy_id):
+        self.orders.setdefault(strategy_id, {})
+        for book in self.books.values():
+            book.setdefault(strategy_id, {})
+
+    def add(self, strategy_id, ref_id, order, book=PENDING):
+        """
+        add a new order, or an order reloaded from cache
+        :param book: PENDING/ACTIVE/FINISHED
+        """
+        self.add_strategy(strategy_id)
+        key = (strategy_id, ref_id)
+        if key in self.entries:
+            self.orders[strategy_id][ref_id] = order
+            self.entries[key].order = order
+            self.move(strategy_id, ref_id, book)
+            return
+
+        entry = OrderEntry(strategy_id, ref_id, None, order)
+        self.entries[key] = entry
+        self.orders[strategy_id][ref_id] = order
+        self.move(strategy_id, ref_id, book)
+
+    def move(self, strategy_id, ref_id, book):
+        """
+        move order to another book
+        :param book: PENDING/ACTIVE/FINISHED, None means remove order from books but keep it in orders
+        :return: order, None if order is unknown
+        """
+        entry = self.entries.get((strategy_id, ref_id))
+        if entry is None:
+            return None
+        if entry.book is not None:
+            self.books[entry.book][strategy_id].pop(ref_id, None)
+            if entry.book != FINISHED:
+                self.unfinished_count -= 1
+        if book is not None:
+            self.books[book][strategy_id][ref_id] = entry.order
+            if book != FINISHED:
+                self.unfinished_count += 1
+        entry.book = book
+        return entry.order
+
+    def set_order_id(self, strategy_id, ref_id, ex_sy_order_id):
+        """
+        :param ex_sy_order_id: 'exchange|symbol|order_id'
+        """
+        entry = self.entries.get((strategy_id, ref_id))
+        if entry is not None:
+            self.by_order_id[ex_sy_order_id] = entry
+
+    def find_by_order_id(self, ex_sy_order_id):
+        """
+        :return: OrderEntry or None
+        """
+        return self.by_order_id.get(ex_sy_order_id)
+
+    def get_book(self, strategy_id, ref_id):
+        entry = self.entries.get((strategy_id, ref_id))
+        return entry.book if entry is not None else None
+
+    def iter_active(self):
+        """
+        :return: list of (strategy_id, ref_id), safe to modify books while iterating
+        """
+        return [(strategy_id, ref_id) for strategy_id, book in self.active_orders.items() for ref_id in book]
+
+    def trade_orders(self):
+        """
+        read-only views of finished and active orders, active orders override finished ones;
+        used for reports, no copy of orders
+        :return: {strategy_id: mapping of ref_id -> order}
+        """
+        return {strategy_id: MappingProxyType(ChainMap(self.active_orders[strategy_id], self.finished_orders[strategy_id]))
+                for strategy_id in self.orders}
+
+    def load(self, books, decode=None):
+        """
+        reload orders from cache, format is the same as orders/<task_id>.json
+        :param books: {'pending_orders': {}, 'active_orders': {}, 'finished_orders': {}}
+        :param decode: convert json dict to order record, e.g. Order.from_dict
+        """
+        for book in BOOKS:
+            for strategy_id, orders in books.get(book, {}).items():
+                for ref_id, order in orders.items():
+                    self.add(strategy_id, ref_id, decode(order) if decode is not None else order, book)
+
+    def to_dict(self):
+        return {PENDING: self.pending_orders, ACTIVE: self.active_orders, FINISHED: self.finished_orders}
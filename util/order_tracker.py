@@ -0,0 +1,122 @@
+# encoding: utf-8
+# active订单的状态跟踪: 信任on_order_update推送, 只inspect最近没有任何回报(stale)的订单
+# 到期的订单按 过期程度 * (1 + 成交可能性) 排序, 相同时年龄大的优先, inspect请求使用从共享限频(PDT_RATE_LIMIT)预取的令牌,
+# 令牌不够时剩下的订单留到下一轮, 缺少的令牌由driver从共享令牌桶补充
+# 用法: tracker.on_update(strategy_id, ref_id); for strategy_id, ref_id in tracker.select(orders, push, top_of_book): inspect
+import time
+
+
+class OrderState:
+    __slots__ = ('created', 'last_update', 'last_inspect', 'urgent')
+
+    def __init__(self, now):
+        self.created = now
+        self.last_update = now  # 最近一次收到回报(发单/撤单/查询回报, order_update推送)
+        self.last_inspect = 0  # 最近一次发出inspect, 回报没到之前不会重复发送
+        self.urgent = False  # 撤单后需要尽快inspect得到成交量
+
+
+def distance_from_touch(direction, price, top_of_book):
+    """
+    relative distance of order price to the opposite side of book in bps, <= 0 means the order crosses the touch
+    :param top_of_book: ([ask0_price, ask0_size], [bid0_price, bid0_size]), None when there is no market data
+    """
+    if not top_of_book:
+        return None
+    ask, bid = top_of_book
+    if direction == 'Buy':
+        return (ask[0] - price) / ask[0] * 10000
+    return (price - bid[0]) / bid[0] * 10000
+
+
+class OrderTracker:
+    def __init__(self, tokens, stale_push=60, stale_poll=6, clock=time.monotonic):
+        """
+        :param tokens: inspect tokens of each exchange|account, TokenReserve filled by the driver from SharedRateLimiter
+        :param stale_push: seconds without update before an order of push exchange (ORDER_UPDATE_EX) is inspected
+        :param stale_poll: same for other exchanges
+        """
+        self.clock = clock
+        self.stale_push = stale_push
+        self.stale_poll = stale_poll
+        self.tokens = tokens
+        self.states = {}  # (strategy_id, ref_id) -> OrderState
+        self.stats = {'inspect': 0, 'deferred': 0, 'rate_limited': 0}
+
+    def get_state(self, key, now):
+        state = self.states.get(key)
+        if state is None:
+            state = self.states[key] = OrderState(now)
+        return state
+
+    def on_update(self, strategy_id, ref_id):
+        """
+        any response of the order: send/cancel/inspect response or order_update push
+        """
+        now = self.clock()
+        state = self.get_state((strategy_id, ref_id), now)
+        state.last_update = now
+        state.last_inspect = 0
+
+    def mark_urgent(self, strategy_id, ref_id):
+        self.get_state((strategy_id, ref_id), self.clock()).urgent = True
+
+    def acquire(self, exch_acc):
+        """
+        take one inspect token of account, for inspections outside of select (e.g. after cancel)
+        """
+        if self.tokens.try_acquire(exch_acc):
+            self.stats['inspect'] += 1
+            return True
+        self.stats['deferred'] += 1
+        return False
+
+    def on_rate_limited(self, exch_acc):
+        self.stats['rate_limited'] += 1
+        self.tokens.drop(exch_acc)
+
+    def score(self, state, order, push, top_of_book, now):
+        """
+        priority of inspection, >= 1 means the order is due
+        staleness: time since last update/inspect in units of stale period
+        fill likelihood: 1 when the order crosses the touch, 1 / (1 + bps) otherwise, orders near the touch are due earlier
+        """
+        if state.urgent:
+            return float('inf')
+        stale_after = self.stale_push if push else self.stale_poll
+        staleness = (now - max(state.last_update, state.last_inspect)) / stale_after
+        distance = distance_from_touch(order['direction'], order['price'], top_of_book)
+        likelihood = 0 if distance is None else 1 / (1 + max(distance, 0))
+        return staleness * (1 + likelihood)
+
+    def select(self, orders, push, top_of_book):
+        """
+        :param orders: {(strategy_id, ref_id): order} of active orders
+        :param push: callable(order) -> bool, whether order status is pushed by on_order_update
+        :param top_of_book: callable(order) -> top of book of order symbol, None when unknown
+        :return: list of (strategy_id, ref_id) to inspect now, in priority order; tokens are already taken
+        """
+        now = self.clock()
+        # 已经完结的订单不再跟踪
+        for key in [key for key in self.states if key not in orders]:
+            del self.states[key]
+
+        due = []
+        for key, order in orders.items():
+            state = self.get_state(key, now)
+            score = self.score(state, order, push(order), top_of_book(order), now)
+            if score >= 1:
+                # 相同优先级时先创建的订单优先
+                due.append((score, -state.created, key, order))
+        due.sort(key=lambda item: item[:2], reverse=True)
+
+        selected = []
+        for _, _, key, order in due:
+            exch_acc = f"{order['exchange']}|{order['account_id']}"
+            if not self.acquire(exch_acc):
+                continue
+            state = self.states[key]
+            state.last_inspect = now
+            state.urgent = False
+            selected.append(key)
+        return selected
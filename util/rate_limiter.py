@@ -0,0 +1,116 @@
+# encoding: utf-8
+# 按 exchange|account 和 action 的请求限频
+# SharedRateLimiter: 同一个 exchange|account 的所有driver进程共用redis中的令牌桶(lua脚本保证原子性)
+# TokenReserve: 预先从SharedRateLimiter取得的令牌, 供同步代码(order_tracker选择inspect订单)直接使用
+# 用法: granted, wait = await shared_limiter.acquire('Binance|trader1', 'place_order', 3)
+#       if reserve.try_acquire('Binance|trader1'): send; ... await reserve.fill(shared_limiter)
+from config.config import sentry
+from util.logger import logger
+
+# KEYS[1]: 令牌桶的hash; ARGV: rate, burst, count
+# 返回 [得到的令牌数, 下一个令牌需要等待的秒数], 时间使用redis服务器的TIME, 不依赖各个机器的时钟
+TOKEN_BUCKET_SCRIPT = """
+if redis.replicate_commands then redis.replicate_commands() end
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local count = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local granted = math.min(count, math.floor(tokens))
+tokens = tokens - granted
+local wait = 0
+if granted < count then wait = (1 - tokens) / rate end
+redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {granted, tostring(wait)}
+"""
+
+
+class SharedRateLimiter:
+    """
+    token buckets in redis keyed by 'exchange|account' and action, shared by all driver processes
+    """
+
+    def __init__(self, redis, limits, prefix='eaas_rate_limit'):
+        """
+        :param redis: aredis StrictRedis
+        :param limits: {exchange: {action: [rate, burst]}, 'default': {...}}, actions without limit are not limited
+        """
+        self.limits = limits
+        self.prefix = prefix
+        self.script = redis.register_script(TOKEN_BUCKET_SCRIPT)
+        self.failed = False  # redis出错时不限频, 只记录一次
+
+    def get_limit(self, exch_acc, action):
+        exchange = exch_acc.split('|', 1)[0]
+        return self.limits.get(exchange, self.limits['default']).get(action)
+
+    async def acquire(self, exch_acc, action, count=1):
+        """
+        :return: (granted, wait), granted <= count requests may be sent now, the rest should wait for wait seconds
+        """
+        limit = self.get_limit(exch_acc, action)
+        if limit is None:
+            return count, 0
+        rate, burst = limit
+        try:
+            granted, wait = await self.script.execute(keys=[f'{self.prefix}:{exch_acc}:{action}'], args=[rate, burst, count])
+        except Exception as e:
+            # 限频只是保护措施, redis不可用时不能阻塞下单
+            if not self.failed:
+                self.failed = True
+                logger.error('rate limiter error:', e)
+                sentry.captureException()
+            return count, 0
+        self.failed = False
+        return int(granted), float(wait)
+
+
+class TokenReserve:
+    """
+    tokens of one action taken from SharedRateLimiter ahead of use, so synchronous code spends the shared budget
+    without waiting on redis: try_acquire records the shortfall of each account, the driver takes that many tokens
+    in fill(); requests paid by the reserve must not be limited again when they are pushed
+    """
+
+    def __init__(self, action):
+        self.action = action
+        self.tokens = {}  # exch_acc -> tokens taken from the shared bucket and not used yet
+        self.wanted = {}  # exch_acc -> requests denied since the last fill
+
+    def try_acquire(self, exch_acc):
+        """
+        :return: bool, False when no token is reserved for account, the shortfall is taken by the next fill
+        """
+        if self.tokens.get(exch_acc, 0) > 0:
+            self.tokens[exch_acc] -= 1
+            return True
+        self.wanted[exch_acc] = self.wanted.get(exch_acc, 0) + 1
+        return False
+
+    def drop(self, exch_acc):
+        """
+        exchange reported rate limit: give up reserved tokens of account
+        """
+        self.tokens.pop(exch_acc, None)
+
+    async def fill(self, limiter):
+        """
+        :param limiter: SharedRateLimiter
+        :return: number of tokens taken
+        """
+        wanted, self.wanted = self.wanted, {}
+        taken = 0
+        for exch_acc, count in wanted.items():
+            count -= self.tokens.get(exch_acc, 0)
+            if count <= 0:
+                continue
+            granted, _ = await limiter.acquire(exch_acc, self.action, count)
+            if granted:
+                self.tokens[exch_acc] = self.tokens.get(exch_acc, 0) + granted
+                taken += granted
+        return taken
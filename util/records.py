@@ -0,0 +1,122 @@
+# encoding: utf-8
+from collections.abc import MutableMapping
+
+_MISSING = object()
+
+
+class Record:
+    """
+    base of __slots__ records, behaves like a dict for existing code:
+    record['price'], record['status'] = 'filled', 'order_id' in record, record.get('filled', 0)
+    unset slots are missing keys, same as a dict without that key
+    records are converted to dict only at the json boundary, see encode_record
+    """
+    __slots__ = ()
+
+    def __init__(self, **kwargs):
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        decode from json dict, unknown keys are ignored
+        """
+        record = cls()
+        for key in cls.__slots__:
+            if key in data:
+                setattr(record, key, data[key])
+        return record
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        try:
+            setattr(self, key, value)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def __delitem__(self, key):
+        try:
+            delattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return isinstance(key, str) and hasattr(self, key)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        return [key for key in self.__slots__ if hasattr(self, key)]
+
+    def values(self):
+        return [getattr(self, key) for key in self.keys()]
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.keys()]
+
+    def to_dict(self):
+        data = {}
+        for key in self.__slots__:
+            value = getattr(self, key, _MISSING)
+            if value is not _MISSING:
+                data[key] = value
+        return data
+
+
+# pandas和isinstance检查把Record当作dict处理
+MutableMapping.register(Record)
+
+
+def encode_record(obj):
+    """
+    json default hook, e.g. json.dumps(body, default=encode_record)
+    """
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+class Order(Record):
+    """
+    order sent by StrategyMaster.send_order, retained in OrderStore for the whole task
+    """
+    __slots__ = ('exchange', 'symbol', 'account_type', 'contract_type', 'price', 'quantity', 'direction', 'order_type',
+                 'account_id', 'strategy_key', 'delay', 'post_only', 'filled', 'avg_price', 'create_time', 'notes',
+                 'order_id', 'status', 'update_time', 'pending_cancel')
+
+
+class OrderRequest(Record):
+    """
+    send/cancel/inspect request published to pdt, metadata is Order for send request
+    """
+    __slots__ = ('strategy', 'task_id', 'strategy_id', 'ref_id', 'action', 'metadata')
+
+
+class OrderResponse(Record):
+    """
+    unified order response, built from pdt response or order update, see StrategyMaster.on_response
+    """
+    __slots__ = ('strategy_id', 'ref_id', 'action', 'task_id', 'exchange', 'account_id', 'symbol', 'contract_type',
+                 'timestamp', 'status', 'direction', 'original_amount', 'original_price', 'filled',
+                 'avg_executed_price', 'order_id')
@@ -0,0 +1,141 @@
+# encoding: utf-8
+# 定时任务调度: 每个job有自己的周期/随机抖动/优先级, 只在到期时执行, 代替所有任务每TIME_INTERVAL全部跑一遍
+# 同一次run_due中到期的job按(priority, 注册顺序)执行, 每个job记录执行次数/耗时/超时(overrun)
+# 用法: scheduler.add_job('send_status', self.send_status, 3, priority=JobPriority.STATUS.value)
+#       scheduler.run_due(time.monotonic()); delay = scheduler.next_due() - time.monotonic()
+import random
+import time
+
+from config.config import sentry
+from util.logger import logger
+
+
+class Job:
+    __slots__ = ('name', 'callback', 'period', 'jitter', 'priority', 'seq', 'next_run',
+                 'runs', 'errors', 'overruns', 'total_time', 'max_time', 'last_time', 'max_lag')
+
+    def __init__(self, name, callback, period, jitter, priority, seq, next_run):
+        self.name = name
+        self.callback = callback
+        self.period = period  # 秒
+        self.jitter = jitter  # 每次在period上增加[0, jitter)秒的随机时间
+        self.priority = priority  # 越小越先执行
+        self.seq = seq
+        self.next_run = next_run
+        self.runs = 0
+        self.errors = 0
+        self.overruns = 0  # 执行耗时超过period的次数
+        self.total_time = 0
+        self.max_time = 0
+        self.last_time = 0
+        self.max_lag = 0  # 实际执行时间比计划晚的最大值(秒)
+
+    def interval(self):
+        return self.period + self.jitter * random.random() if self.jitter else self.period
+
+    def stats(self):
+        return {
+            'period': self.period,
+            'jitter': self.jitter,
+            'priority': self.priority,
+            'runs': self.runs,
+            'errors': self.errors,
+            'overruns': self.overruns,
+            'avg_ms': self.total_time / self.runs * 1000 if self.runs else 0,
+            'max_ms': self.max_time * 1000,
+            'last_ms': self.last_time * 1000,
+            'max_lag_ms': self.max_lag * 1000,
+        }
+
+
+class Scheduler:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.jobs = {}  # name -> Job
+        self.seq = 0
+
+    def add_job(self, name, callback, period, jitter=0, priority=0, delay=None):
+        """
+        register or replace a job
+        :param name: str, unique job name, e.g. 'send_status', '<strategy_id>|slice'
+        :param callback: callable without argument
+        :param period: seconds between two runs
+        :param jitter: seconds, a random value in [0, jitter) is added to each interval
+        :param priority: int, jobs due at the same time run in ascending priority
+        :param delay: seconds before the first run, default is one interval; 0 runs it on the next run_due
+        """
+        self.seq += 1
+        job = Job(name, callback, period, jitter, priority, self.seq, 0)
+        job.next_run = self.clock() + (job.interval() if delay is None else delay)
+        self.jobs[name] = job
+        return job
+
+    def remove_job(self, name):
+        self.jobs.pop(name, None)
+
+    def set_period(self, name, period, jitter=None):
+        """
+        change period (and jitter) of a job, the next run is moved accordingly; unknown job is ignored
+        :param jitter: seconds, None keeps the current jitter
+        """
+        job = self.jobs.get(name)
+        if job is None:
+            return
+        job.next_run += period - job.period
+        job.period = period
+        if jitter is not None:
+            job.jitter = jitter
+
+    def run_due(self, now=None):
+        """
+        run all jobs whose next_run has come; an exception of one job is logged and does not stop the others
+        :return: int, number of jobs executed
+        """
+        if now is None:
+            now = self.clock()
+        due = [job for job in self.jobs.values() if job.next_run <= now]
+        due.sort(key=lambda job: (job.priority, job.seq))
+        for job in due:
+            if self.jobs.get(job.name) is not job:
+                # 被前面执行的job删除或替换
+                continue
+            job.max_lag = max(job.max_lag, now - job.next_run)
+            start = self.clock()
+            try:
+                job.callback()
+            except Exception as e:
+                job.errors += 1
+                logger.error(f'job {job.name} error:', e)
+                sentry.captureException()
+            finally:
+                end = self.clock()
+                cost = end - start
+                job.runs += 1
+                job.total_time += cost
+                job.last_time = cost
+                job.max_time = max(job.max_time, cost)
+                if cost > job.period:
+                    job.overruns += 1
+                # 从计划时间往后推, 不累积执行耗时; 落后超过一个周期时从当前时间重新开始, 不补跑
+                interval = job.interval()
+                job.next_run = job.next_run + interval if job.next_run + interval > end else end + interval
+        return len(due)
+
+    def next_due(self):
+        """
+        :return: monotonic time of the earliest job, None when there is no job
+        """
+        if not self.jobs:
+            return None
+        return min(job.next_run for job in self.jobs.values())
+
+    def stats(self):
+        return {name: job.stats() for name, job in self.jobs.items()}
+
+    def reset_stats(self):
+        """
+        max values are reset after each report
+        """
+        for job in self.jobs.values():
+            job.max_time = 0
+            job.max_lag = 0
@@ -0,0 +1,160 @@
+# encoding: utf-8
+# 交易对的下单规则(价格精度/数量精度/最小下单量), 每个策略在set_task时按coin_config生成一次
+# 价格和数量在内部是按交易对精度缩放的整数: float只在边界乘以10^digits取整一次, 之后tick/lot的取整和比较都是整数运算,
+# 发单时再由整数换算回float; 不再每次解析str(precision), 也不需要EPSILON修正浮点误差
+# 用法: rules = self.symbol_rules[symbol]; price = rules.format_price(price); amount = rules.format_amount(amount)
+#       ticks = rules.price_to_ticks(price); lots = rules.amount_to_lots(amount); rules.ticks_to_price(ticks)
+from decimal import Decimal
+
+# 定点数比交易对的精度多保留的小数位数: 吸收float的表示误差(2.9999999999999996按3.0处理),
+# 同时保留精度以下的部分, 数量向下取整到lot时和float的math.floor结果一致
+GUARD_DIGITS = 4
+
+
+def get_decimal(precision):
+    """
+    precision = 0.001 -> 3, 1e-08 -> 8, 0.05 -> 2, 10 -> 0
+    """
+    exponent = Decimal(repr(precision)).normalize().as_tuple().exponent
+    return max(0, -exponent)
+
+
+def round_half_even(units, step):
+    """
+    units / step rounded to the nearest integer, ties to even like round()
+    """
+    quotient, rest = divmod(units, step)
+    if 2 * rest > step or (2 * rest == step and quotient % 2):
+        quotient += 1
+    return quotient
+
+
+class SymbolRules:
+    __slots__ = ('exchange', 'symbol', 'price_precision', 'size_precision', 'price_decimal', 'size_decimal',
+                 'price_scale', 'size_scale', 'price_tick', 'size_lot', 'price_digits', 'size_digits', 'quote_digits',
+                 'price_unit_scale', 'size_unit_scale', 'tick_units', 'lot_units',
+                 'base_min_order_size', 'quote_min_order_size')
+
+    def __init__(self, exchange, symbol, price_precision, size_precision, base_min_order_size=0, quote_min_order_size=0):
+        self.exchange = exchange
+        self.symbol = symbol
+        self.price_precision = price_precision
+        self.size_precision = size_precision
+        self.price_decimal = get_decimal(price_precision)
+        self.size_decimal = get_decimal(size_precision)
+        # price = ticks * price_tick / price_scale, price_tick和price_scale都是整数
+        self.price_scale = 10 ** self.price_decimal
+        self.size_scale = 10 ** self.size_decimal
+        self.price_tick = round(price_precision * self.price_scale)
+        self.size_lot = round(size_precision * self.size_scale)
+        # 定点数: price = price_units / 10^price_digits, amount = size_units / 10^size_digits,
+        # amount * price的单位是10^-quote_digits, 余额账本(util.fixed_point.BalanceBook)使用同样的单位
+        self.price_digits = self.price_decimal + GUARD_DIGITS
+        self.size_digits = self.size_decimal + GUARD_DIGITS
+        self.quote_digits = self.price_digits + self.size_digits
+        self.price_unit_scale = 10 ** self.price_digits
+        self.size_unit_scale = 10 ** self.size_digits
+        self.tick_units = self.price_tick * 10 ** GUARD_DIGITS
+        self.lot_units = self.size_lot * 10 ** GUARD_DIGITS
+        self.base_min_order_size = base_min_order_size
+        self.quote_min_order_size = quote_min_order_size
+
+    @classmethod
+    def from_coin_config(cls, exchange, symbol, coin_config):
+        """
+        :param coin_config: task['coin_config'][symbol], {price_precision, size_precision, base_min_order_size, quote_min_order_size}
+        """
+        return cls(exchange, symbol, coin_config['price_precision'], coin_config['size_precision'],
+                   coin_config.get('base_min_order_size', 0), coin_config.get('quote_min_order_size', 0))
+
+    def price_units(self, price):
+        """
+        fixed point price in 10^-price_digits, the only float operation on the price path
+        """
+        return round(price * self.price_unit_scale)
+
+    def size_units(self, amount):
+        """
+        fixed point amount in 10^-size_digits
+        """
+        return round(amount * self.size_unit_scale)
+
+    def price_to_ticks(self, price):
+        """
+        nearest integer number of ticks, a decimal tie (8000.015 with tick 0.01) is rounded to even
+        """
+        return round_half_even(self.price_units(price), self.tick_units)
+
+    def ticks_to_price(self, ticks):
+        # int / int在python中是正确舍入的, 结果是离该十进制数最近的float
+        return ticks * self.price_tick / self.price_scale
+
+    def amount_to_lots(self, amount):
+        """
+        integer number of lots, rounded down
+        """
+        return self.size_units(amount) // self.lot_units
+
+    def ceil_lots(self, amount):
+        """
+        integer number of lots, rounded up
+        """
+        return -(-self.size_units(amount) // self.lot_units)
+
+    def lots_to_amount(self, lots):
+        return lots * self.size_lot / self.size_scale
+
+    def format_price(self, price):
+        """
+        round price to nearest tick, same as util.format_price except for decimal ties;
+        other ticks (0.5, 0.05) are snapped to multiples of the tick
+        """
+        return self.ticks_to_price(self.price_to_ticks(price))
+
+    def format_amount(self, amount):
+        """
+        round amount down to lot, same as util.format_amount except that exact multiples of the lot are kept
+        (util.format_amount(9369.0, 1e-05) is 9368.99999)
+        """
+        return self.lots_to_amount(self.amount_to_lots(amount))
+
+    def ceil_amount(self, amount):
+        """
+        round amount up to lot
+        """
+        return self.lots_to_amount(self.ceil_lots(amount))
+
+    @staticmethod
+    def adjust_lots(lots, min_lots):
+        """
+        same as util.amount_adjust in lots: lots smaller than min_lots + 1 are raised to min_lots
+        :param min_lots: min order size rounded up to lot, see ceil_lots
+        """
+        if lots <= 0:
+            return 0
+        if lots >= min_lots + 1:
+            return lots
+        return min_lots
+
+    def adjust_amount(self, amount, min_size):
+        """
+        amount rounded down to lot, raised to min_size rounded up when it is smaller than min_size + one lot
+        """
+        return self.lots_to_amount(self.adjust_lots(self.amount_to_lots(amount), self.ceil_lots(min_size)))
+
+    def min_order_size(self, price):
+        """
+        min order size in base currency at price
+        """
+        return max(self.base_min_order_size, self.quote_min_order_size / price)
+
+    def is_on_tick(self, price):
+        """
+        whether price is an exact multiple of price_precision, compared in fixed point instead of
+        util.check_precison_of_number with its 1e-8 epsilon
+        """
+        return self.price_units(price) % self.tick_units == 0
+
+
+# 没有coin_config的交易对, 余额账本按8位小数的精度计算
+DEFAULT_RULES = SymbolRules('', '', 1e-08, 1e-08)
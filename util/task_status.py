@@ -0,0 +1,83 @@
+# encoding: utf-8
+# task状态的增量推送: 状态变化时推送完整快照(snapshot), 其他时候只推送相对上一次快照变化的字段(delta)
+# delta总是相对最近一次snapshot计算, 丢失或重复的delta不影响结果, 使用方只需要把最新的delta合并到snapshot上
+# 用法: message = tracker.build(status_obj); status = merge_status(snapshot, delta)
+import copy
+import time
+
+# 策略每次on_timer都可能变化的字段, 只有这些字段变化时推送delta, 其他字段变化推送snapshot
+DELTA_FIELDS = ('deal_size', 'current_price', 'attention')
+SNAPSHOT = 'snapshot'
+DELTA = 'delta'
+
+
+class StatusTracker:
+    def __init__(self, snapshot_interval=300, clock=time.monotonic):
+        self.clock = clock
+        self.snapshot_interval = snapshot_interval  # 秒, 定期推送snapshot, 方便新的使用方同步
+        self.snapshot = None  # 最近一次推送的snapshot
+        self.snapshot_time = 0
+
+    def is_state_changed(self, status_obj):
+        """
+        whether any field other than update_time and DELTA_FIELDS differs from the last snapshot
+        """
+        snapshot = self.snapshot
+        if snapshot is None or snapshot.keys() != status_obj.keys():
+            return True
+        for key, value in status_obj.items():
+            if key == 'strategies' or key == 'update_time':
+                continue
+            if snapshot[key] != value:
+                return True
+        strategies = status_obj['strategies']
+        if snapshot['strategies'].keys() != strategies.keys():
+            return True
+        for strategy_id, strategy in strategies.items():
+            last = snapshot['strategies'][strategy_id]
+            for key, value in strategy.items():
+                if key not in DELTA_FIELDS and last.get(key) != value:
+                    return True
+        return False
+
+    def build(self, status_obj, force_snapshot=False):
+        """
+        :param status_obj: full status of task, see StrategyMaster.send_status
+        :param force_snapshot: bool, e.g. on finish
+        :return: snapshot (status_obj with type 'snapshot') or delta
+            {type: 'delta', name, update_time, strategies: {strategy_id: {changed fields since snapshot}}}
+        """
+        now = self.clock()
+        if force_snapshot or now - self.snapshot_time >= self.snapshot_interval or self.is_state_changed(status_obj):
+            # 保存副本, 之后的status_obj与它比较
+            self.snapshot = copy.deepcopy(status_obj)
+            self.snapshot_time = now
+            status_obj['type'] = SNAPSHOT
+            return status_obj
+
+        strategies = {}
+        for strategy_id, strategy in status_obj['strategies'].items():
+            last = self.snapshot['strategies'][strategy_id]
+            changed = {key: strategy[key] for key in DELTA_FIELDS if key in strategy and strategy[key] != last.get(key)}
+            if changed:
+                strategies[strategy_id] = changed
+        return {
+            'type': DELTA,
+            'name': status_obj['name'],
+            'update_time': status_obj['update_time'],
+            'strategies': strategies,
+        }
+
+
+def merge_status(snapshot, delta):
+    """
+    apply delta to snapshot, return the latest full status; snapshot is not modified
+    """
+    if not delta:
+        return snapshot
+    status = copy.deepcopy(snapshot)
+    status['update_time'] = delta['update_time']
+    for strategy_id, changed in delta['strategies'].items():
+        if strategy_id in status['strategies']:
+            status['strategies'][strategy_id].update(changed)
+    return status
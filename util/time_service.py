@@ -0,0 +1,50 @@
+# encoding: utf-8
+# 热路径上的时间服务, 内部统一使用整数毫秒(epoch ms, 与pdt时间戳同为本地时间)
+# now_ms = 启动时的墙上时间 + 单调时钟的增量, 系统时间跳变(ntp校时/手工改时间)不会影响超时判断
+# StrategyMaster在每条消息和每次on_timer开始时tick()一次, 同一事件中的所有策略共用time_service.now_ms
+# 用法: time_service.now_ms - time_service.pdt_to_ms(market_data['timestamp']) > 3000
+import time
+
+from util.timestamp import pdt_to_ms, str_to_ms
+
+
+class TimeService:
+    def __init__(self):
+        self.wall_anchor_ms = int(time.time() * 1000)
+        self.monotonic_anchor = time.monotonic()
+        self.monotonic = self.monotonic_anchor  # 最近一次tick的单调时钟, 单位秒, 用于间隔判断
+        self.now_ms = self.wall_anchor_ms  # 最近一次tick的时间, epoch ms
+
+    def tick(self):
+        """
+        refresh cached clock, called once at the beginning of each message/timer
+        :return: now_ms
+        """
+        self.monotonic = time.monotonic()
+        self.now_ms = self.wall_anchor_ms + int((self.monotonic - self.monotonic_anchor) * 1000)
+        return self.now_ms
+
+    def current_ms(self):
+        """
+        uncached epoch ms, for code running outside of message/timer callbacks
+        """
+        return self.wall_anchor_ms + int((time.monotonic() - self.monotonic_anchor) * 1000)
+
+    def pdt_to_ms(self, timestamp):
+        """
+        :param timestamp: pdt timestamp YYYYMMDDHHmmssSSS, str or int
+        :return: epoch ms
+        """
+        return pdt_to_ms(timestamp)
+
+    def str_to_ms(self, string):
+        """
+        :param string: '2019-10-12 12:22:22', '2019_10_12 12:22:22.103' and other formats of util.str_to_datetime
+        :return: epoch ms, None when string is None
+        """
+        if string is None:
+            return None
+        return str_to_ms(string)
+
+
+time_service = TimeService()
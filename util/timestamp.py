@@ -0,0 +1,139 @@
+# encoding: utf-8
+# pdt时间戳(YYYYMMDDHHmmssSSS, 本地时间)的解析, 全部使用整数运算, 不经过strptime
+# 单个值: pdt_to_ms / pdt_to_datetime / str_to_ms, 重复出现的值(同一秒的行情, 同一订单的多次回报)走LRU缓存
+# 整列: pdt_array_to_ms(numpy) / str_series_to_datetime(pandas), 用于报表中对全部订单历史的解析
+import time
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# 没有夏令时的时区, 本地时间与UTC的偏移是常量; 有夏令时的时区每个值使用mktime计算
+FIXED_OFFSET = not time.daylight
+UTC_OFFSET_MS = -time.timezone * 1000
+# str.translate一次去掉所有分隔符, 代替多次str.replace
+SEPARATORS = str.maketrans('', '', '_-:. T')
+
+
+def days_from_civil(year, month, day):
+    """
+    days since 1970-01-01 of proleptic gregorian date, integer only; works on numpy int arrays as well
+    """
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + 12 * (month <= 2) - 3) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+def split_pdt(value):
+    """
+    :param value: int YYYYMMDDHHmmssSSS
+    :return: (year, month, day, hour, minute, second, millisecond)
+    """
+    value, millisecond = divmod(value, 1000)
+    value, second = divmod(value, 100)
+    value, minute = divmod(value, 100)
+    value, hour = divmod(value, 100)
+    value, day = divmod(value, 100)
+    year, month = divmod(value, 100)
+    return year, month, day, hour, minute, second, millisecond
+
+
+@lru_cache(maxsize=65536)
+def second_to_ms(second):
+    """
+    :param second: str or int YYYYMMDDHHmmss in local time
+    :return: int, epoch ms
+    """
+    year, month, day, hour, minute, second, _ = split_pdt(int(second) * 1000)
+    if FIXED_OFFSET:
+        local_seconds = ((days_from_civil(year, month, day) * 24 + hour) * 60 + minute) * 60 + second
+        return local_seconds * 1000 - UTC_OFFSET_MS
+    return int(time.mktime((year, month, day, hour, minute, second, 0, 0, -1))) * 1000
+
+
+def pdt_to_ms(timestamp):
+    """
+    timestamp = '20191012164822103'
+    return = 1570870102103 (UTC+8)
+
+    the second part goes through LRU, messages in the same second are only computed once
+    :param timestamp: str or int, pdt timestamp in local time
+    :return: int, epoch ms
+    """
+    if isinstance(timestamp, str):
+        return second_to_ms(timestamp[:14]) + int(timestamp[14:17])
+    second, millisecond = divmod(timestamp, 1000)
+    return second_to_ms(second) + millisecond
+
+
+@lru_cache(maxsize=65536)
+def pdt_to_datetime(timestamp):
+    """
+    timestamp = '20191012164822103'
+    return = 2019-10-12 16:48:22.103000
+
+    :param timestamp: str or int, pdt timestamp
+    :return: naive datetime in local time, datetime is immutable so cached values are shared
+    """
+    year, month, day, hour, minute, second, millisecond = split_pdt(int(timestamp))
+    return datetime(year, month, day, hour, minute, second, millisecond * 1000)
+
+
+def normalize(string):
+    """
+    '2019-10-12 12:22:22' -> '20191012122222', None when length is not 8/14/17
+    """
+    digits = string.translate(SEPARATORS)
+    return digits if len(digits) in (8, 14, 17) else None
+
+
+def str_to_ms(string):
+    """
+    :param string: '2019-10-12 12:22:22', '2019_10_12 12:22:22.103', '20191012'
+    :return: int, epoch ms; None when format is unknown
+    """
+    digits = normalize(string)
+    if digits is None:
+        return None
+    return pdt_to_ms(digits.ljust(17, '0'))
+
+
+def str_to_datetime(string):
+    """
+    :param string: same as str_to_ms
+    :return: naive datetime; None when format is unknown
+    """
+    digits = normalize(string)
+    if digits is None:
+        return None
+    return pdt_to_datetime(digits.ljust(17, '0'))
+
+
+def pdt_array_to_ms(values):
+    """
+    vectorized pdt_to_ms
+    :param values: iterable/Series of pdt timestamps, str or int
+    :return: numpy int64 array of epoch ms
+    """
+    values = np.asarray(values).astype(np.int64)
+    year, month, day, hour, minute, second, millisecond = split_pdt(values)
+    local_ms = (((days_from_civil(year, month, day) * 24 + hour) * 60 + minute) * 60 + second) * 1000 + millisecond
+    if FIXED_OFFSET:
+        return local_ms - UTC_OFFSET_MS
+    # 夏令时: 按唯一的秒计算偏移
+    local_seconds, inverse = np.unique(local_ms // 1000, return_inverse=True)
+    offsets = np.array([int(time.mktime(time.gmtime(int(s))[:8] + (-1,))) - int(s) for s in local_seconds])
+    return local_ms + offsets[inverse] * 1000
+
+
+def str_series_to_datetime(series, fmt='%Y-%m-%d %H:%M:%S'):
+    """
+    vectorized datetime.strptime for a whole column, e.g. update_time of orders
+    :param series: pandas Series or list of str
+    :return: pandas Series/DatetimeIndex of naive datetime64
+    """
+    return pd.to_datetime(series, format=fmt)
@@ -0,0 +1,64 @@
+# encoding: utf-8
+# 最近一段时间(默认1分钟)的逐笔成交统计, 供需要参考市场成交量的策略使用(Iceberg, TriangleIceberg)
+# 成交按时间顺序进入deque, 过期的从左边弹出, 成交量/成交额/买卖量都是累加值, 读取是O(1)
+# 用法: window.add_trades(trade['metadata'], time_service.now_ms); window.expire(time_service.now_ms); window.size
+from collections import deque
+
+from util.timestamp import pdt_to_ms
+
+
+class TradeWindow:
+    def __init__(self, window_ms=60 * 1000):
+        self.window_ms = window_ms
+        self.trades = deque()  # (timestamp_ms, price, size, side)
+        self.size = 0  # 窗口内的成交量
+        self.quote = 0  # 窗口内的成交额, price * size
+        self.buy_size = 0
+        self.sell_size = 0
+
+    def add(self, timestamp_ms, price, size, side):
+        self.trades.append((timestamp_ms, price, size, side))
+        self.size += size
+        self.quote += price * size
+        if side == 'buy':
+            self.buy_size += size
+        else:
+            self.sell_size += size
+
+    def add_trades(self, trades, now_ms):
+        """
+        :param trades: metadata of pdt trade message, [[id, timestamp, price, side, size], ...]
+        :param now_ms: current epoch ms, trades out of window are dropped
+        """
+        for trade in trades:
+            timestamp_ms = pdt_to_ms(trade[1])
+            if now_ms - timestamp_ms <= self.window_ms:
+                self.add(timestamp_ms, trade[2], trade[4], trade[3])
+
+    def expire(self, now_ms):
+        """
+        drop trades out of window; pdt pushes trades in time order, so only the left side needs to be checked
+        """
+        trades = self.trades
+        while trades and now_ms - trades[0][0] > self.window_ms:
+            _, price, size, side = trades.popleft()
+            self.size -= size
+            self.quote -= price * size
+            if side == 'buy':
+                self.buy_size -= size
+            else:
+                self.sell_size -= size
+        if not trades:
+            # 窗口为空时清零, 避免浮点数累加误差
+            self.size = self.quote = self.buy_size = self.sell_size = 0
+
+    @property
+    def count(self):
+        return len(self.trades)
+
+    @property
+    def vwap(self):
+        """
+        :return: volume weighted average price in window, None when there is no trade
+        """
+        return self.quote / self.size if self.size > 0 else None
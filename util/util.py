@@ -24,6 +24,9 @@ from config.enums import *
 from config.config import *
 from util.alioss import alioss
 from util.logger import logger
+from util.records import encode_record
+from util.time_service import time_service
+from util.timestamp import normalize, pdt_to_datetime, str_series_to_datetime
 
 
 def ip4_addresses():
@@ -70,50 +73,58 @@ def update_strategy_conf(strategy, task):
         strategy['trade_role'] = task['trade_role']
 
 
-def increase_reserved_amount(balance_ref, base, quote, direction, quantity, price):
+def increase_reserved_amount(balance_ref, rules, base, quote, direction, quantity, price):
     """
     update reserved amount by order response
+    :param balance_ref: BalanceBook, reserved amount is kept in fixed point
+    :param rules: SymbolRules of the order symbol, quantity and price are converted to its fixed point units
     """
-    if direction == Direction.SELL.value:
-        balance_ref[base]["reserved"] += quantity
-    else:
-        balance_ref[quote]["reserved"] += quantity * price
+    reserve_units(balance_ref, rules, base, quote, direction, rules.size_units(quantity), rules.price_units(price))
 
 
-def decrease_reserved_amount(balance_ref, base, quote, direction, quantity, price):
+def decrease_reserved_amount(balance_ref, rules, base, quote, direction, quantity, price):
     """
     update reserved_amount by order_response
     """
-    increase_reserved_amount(balance_ref, base, quote, direction, -1 * quantity, price)
+    reserve_units(balance_ref, rules, base, quote, direction, -rules.size_units(quantity), rules.price_units(price))
+
+
+def reserve_units(balance_ref, rules, base, quote, direction, size_units, price_units):
+    if direction == Direction.SELL.value:
+        balance_ref.add_reserved(base, size_units, rules.size_digits)
+    else:
+        balance_ref.add_reserved(quote, size_units * price_units, rules.quote_digits)
 
 
-def balance_management_common_process(balance_ref, resp, base, quote, origin_order):
+def balance_management_common_process(balance_ref, rules, resp, base, quote, origin_order):
     # 此时无需任何操作
     if resp["status"] == OrderStatus.PENDING.value:
         return False
 
     # 如果发单被拒, 则减去相应的资金占用量
     if resp["status"] == OrderStatus.REJECTED.value:
-        decrease_reserved_amount(balance_ref, base, quote, resp["direction"], resp["original_amount"], resp["original_price"])
+        decrease_reserved_amount(balance_ref, rules, base, quote, resp["direction"], resp["original_amount"], resp["original_price"])
         return False
 
     # 其他情况都需要处理相应的资金占用量, Cancel, Fill/Partial Fill
-    size_diff = resp["filled"] - origin_order["filled"]
-    amount_diff = resp["filled"] * resp["avg_executed_price"] - origin_order["filled"] * origin_order["avg_price"]
+    # 全部使用交易对精度的定点数计算, 多次部分成交累加后不会出现 0.30000000000000004 这样的误差
+    filled = rules.size_units(resp["filled"])
+    origin_filled = rules.size_units(origin_order["filled"])
+    price_units = rules.price_units(resp["original_price"])
+    size_diff = filled - origin_filled
+    # 数量 * 价格的单位是10^-quote_digits, 乘积是精确的
+    amount_diff = filled * rules.price_units(resp["avg_executed_price"]) - origin_filled * rules.price_units(origin_order["avg_price"])
 
     if resp["status"] in [OrderStatus.PARTIALLY_FILLED.value, OrderStatus.FILLED.value]:
-        decrease_reserved_amount(balance_ref, base, quote, resp["direction"], size_diff, resp["original_price"])
+        reserve_units(balance_ref, rules, base, quote, resp["direction"], -size_diff, price_units)
 
     elif resp["status"] == OrderStatus.CANCELLED.value:
-        size_remain = resp["original_amount"] - origin_order["filled"]
-        decrease_reserved_amount(balance_ref, base, quote, resp["direction"], size_remain, resp["original_price"])
+        size_remain = rules.size_units(resp["original_amount"]) - origin_filled
+        reserve_units(balance_ref, rules, base, quote, resp["direction"], -size_remain, price_units)
 
     factor = 1 if resp["direction"] == Direction.BUY.value else -1
-    balance_ref[base]["total"] += size_diff * factor
-    balance_ref[quote]["total"] -= amount_diff * factor
-
-    balance_ref[base]["available"] = balance_ref[base]["total"] - balance_ref[base]["reserved"]
-    balance_ref[quote]["available"] = balance_ref[quote]["total"] - balance_ref[quote]["reserved"]
+    balance_ref.add_total(base, size_diff * factor, rules.size_digits)
+    balance_ref.add_total(quote, -amount_diff * factor, rules.quote_digits)
     return True
 
 
@@ -172,8 +183,7 @@ def cal_orders(data, start_time, end_time, exchange_fee, service_fee=0.01, curre
     algo, exchange, symbol, _ = task_id.split('_')
     account = trades['account_id'].values[0]
     direction = trades['direction'].values[0]
-    trades['datetime'] = [datetime.strptime(str(x), '%Y-%m-%d %H:%M:%S') for x in
-                          trades['update_time'].tolist()]
+    trades['datetime'] = str_series_to_datetime(trades['update_time'].astype(str))
     trades.set_index('datetime', inplace=True)
     trades.sort_index(inplace=True)
     trades = trades.truncate(before=start_time, after=end_time)
@@ -375,18 +385,11 @@ def str_to_datetime(string):
     :param string: str
     :return: class 'datetime.datetime'
     """
-    for char in ['_', '-', ':', '.', ' ']:
-        # remove special chart
-        string = string.replace(char, '')
-    if len(string) == 8:
-        return datetime.strptime(string, '%Y%m%d')
-    elif len(string) == 14:
-        return datetime.strptime(string, '%Y%m%d%H%M%S')
-    elif len(string) == 17:
-        return datetime.strptime(string, '%Y%m%d%H%M%S%f')
-    else:
+    digits = normalize(string)
+    if digits is None:
         logger.info(f'wrong length of string:{len(string)}')
         return None
+    return pdt_to_datetime(digits.ljust(17, '0'))
 
 
 def get_volume_filter(config):
@@ -631,16 +634,7 @@ def get_datetime(timestamp):
     :param timestamp: str, int,
     :return: class 'datetime.datetime'
     """
-    if not isinstance(timestamp, str):
-        timestamp = str(timestamp)
-    year = int(timestamp[0:4])
-    month = int(timestamp[4:6])
-    day = int(timestamp[6:8])
-    hour = int(timestamp[8:10])
-    minute = int(timestamp[10:12])
-    second = int(timestamp[12:14])
-    milisec = int(timestamp[14:17]) * 1000
-    return datetime(year, month, day, hour, minute, second, milisec)
+    return pdt_to_datetime(timestamp)
 
 
 def market_data_validate(market_data, tolerance=3):
@@ -667,9 +661,10 @@ def market_data_validate(market_data, tolerance=3):
     :param tolerance: float, the threshold for market data validation
     :return: bool, whether market data is valid
     """
-    dt = get_datetime(market_data['timestamp'])
-    now = datetime.now()
-    return True if (now - dt).total_seconds() <= tolerance else False
+    timestamp_ms = getattr(market_data, 'timestamp_ms', None)
+    if timestamp_ms is None:
+        timestamp_ms = time_service.pdt_to_ms(market_data['timestamp'])
+    return time_service.current_ms() - timestamp_ms <= tolerance * 1000
 
 
 def orderbook_price_filter(orderbook, amount, level=3):
@@ -845,7 +840,7 @@ def get_history_orders(task_id, strategy_id, start_time=False, end_time=False, t
     if df.empty:
         return df
     df.rename(columns={'filled': 'filled_quantity'}, inplace=True)
-    df['time'] = [datetime.strptime(x, '%Y-%m-%d %H:%M:%S') for x in df['update_time'].tolist()]
+    df['time'] = str_series_to_datetime(df['update_time'])
     df = df.sort_values(by='time', ascending=True)
     df = df.drop_duplicates(subset=['order_id'], keep='last')
     if start_time:
@@ -1149,7 +1144,7 @@ def save_orders(order_data, file_name):
     if not os.path.exists(log_dir):
         os.mkdir(log_dir)
     with open(os.path.join(log_dir, file_name), 'w') as f:
-        json.dump(order_data, f)
+        json.dump(order_data, f, default=encode_record)
 
 
 def get_trade_summary(trade_history, time_interval, price_key, quantity_key):
@@ -0,0 +1,177 @@
+# encoding: utf-8
+import asyncio
+import ctypes
+import gc
+import json
+import os
+import select
+import signal
+import socket
+import sys
+import traceback
+from datetime import datetime
+
+from config.config import *
+from util.fork_server import FORK, FORKED, EXIT, exit_code
+# driver依赖的所有模块(pandas/sqlalchemy/oss2/strategies...)在zygote中只导入一次, fork出的driver直接共享
+import driver
+
+
+def preload():
+    """
+    import and warm up modules used by driver, then move all objects to the permanent generation
+    so that gc in forked drivers doesn't touch (and copy) the shared pages
+    """
+    import pandas as pd
+    from util import codec
+    # 第一次使用时才加载的模块
+    pd.DataFrame({'price': [1.0], 'size': [2.0]}).to_dict('records')
+    datetime.strptime('20191010155258', '%Y%m%d%H%M%S')
+    codec.loads(codec.dumps({'exchange': 'Binance', 'metadata': {'asks': [[1.0, 2.0]]}}))
+    json.loads(json.dumps({}))
+    gc.collect()
+    gc.freeze()
+
+
+def set_process_name(name):
+    """
+    set /proc/<pid>/comm, forked driver keeps command line of zygote, manage.py and master identify it by name
+    """
+    try:
+        ctypes.CDLL(None).prctl(15, name.encode(), 0, 0, 0)  # PR_SET_NAME, 只在linux下有效
+    except Exception:
+        pass
+
+
+class Zygote:
+    """
+    fork server of drivers:
+        1. 启动时导入driver的所有依赖并预热, 之后fork出的driver不需要再导入, 内存页写时复制共享
+        2. 通过unix domain socket接收master的fork请求, 回复driver的pid
+        3. SIGCHLD时回收退出的driver, 把退出码发给master
+    zygote本身不使用asyncio, fork时没有运行中的event loop和线程
+    """
+
+    def __init__(self):
+        self.path = CONFIG_GLOBAL['ZYGOTE_SOCKET']
+        self.server = None
+        self.conn = None  # connection of master, a new master replaces the old connection
+        self.buffer = b''  # request bytes of master not ended with newline yet
+        self.wakeup_r, self.wakeup_w = os.pipe()
+
+    def fork(self, target):
+        """
+        :param target: callable run in the child, the child exits when it returns
+        :return: pid of child
+        """
+        # 缓冲区中的输出会被复制到子进程
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                self.enter_child()
+                target()
+                code = 0
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else 0
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                # 不执行zygote的清理代码
+                os._exit(code)
+        return pid
+
+    def enter_child(self):
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        for sock in (self.server, self.conn):
+            if sock is not None:
+                sock.close()
+        os.close(self.wakeup_r)
+        os.close(self.wakeup_w)
+        # 预加载的对象保留在gc的永久代, driver中的gc不会扫描它们, 共享页不会因此被复制
+        set_process_name(CONFIG_GLOBAL['DRIVER_PROCESS_NAME'])
+        asyncio.set_event_loop(asyncio.new_event_loop())
+
+    @staticmethod
+    def run_driver():
+        driver.Driver().run()
+
+    def send(self, line):
+        if self.conn is None:
+            return
+        try:
+            self.conn.sendall(line.encode())
+        except OSError:
+            self.conn.close()
+            self.conn = None
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.send(f'{EXIT} {pid} {exit_code(status)}\n')
+
+    def on_request(self):
+        try:
+            data = self.conn.recv(4096)
+        except OSError:
+            data = b''
+        if not data:
+            # master退出, 已经fork的driver继续运行
+            self.conn.close()
+            self.conn = None
+            self.buffer = b''
+            return
+        lines = (self.buffer + data).split(b'\n')
+        self.buffer = lines.pop()
+        for _ in range(lines.count(FORK.strip())):
+            pid = self.fork(self.run_driver)
+            print(f'Fork driver pid {pid}')
+            self.send(f'{FORKED} {pid}\n')
+
+    def serve(self):
+        while True:
+            sockets = [self.server, self.wakeup_r] + ([self.conn] if self.conn is not None else [])
+            try:
+                readable, _, _ = select.select(sockets, [], [])
+            except InterruptedError:
+                continue
+            if self.wakeup_r in readable:
+                os.read(self.wakeup_r, 512)
+                self.reap()
+            if self.server in readable:
+                conn, _ = self.server.accept()
+                if self.conn is not None:
+                    self.conn.close()
+                self.conn = conn
+                self.buffer = b''
+            if self.conn is not None and self.conn in readable:
+                self.on_request()
+
+    def run(self):
+        preload()
+        os.set_blocking(self.wakeup_w, False)
+        signal.set_wakeup_fd(self.wakeup_w)
+        # 只需要唤醒select, 回收在主循环中进行
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.path)
+        self.server.listen()
+        print(f'Start zygote on {self.path}')
+        self.serve()
+
+
+if __name__ == '__main__':
+    zygote_instance = Zygote()
+    zygote_instance.run()